@@ -0,0 +1,110 @@
+import math
+import struct
+import time
+from logging import getLogger
+from threading import Lock
+
+import numpy
+
+try:
+    from multiprocessing import shared_memory
+except:
+    shared_memory = None
+
+_logger = getLogger(__name__)
+
+# Sequence, publish time, timestamp, pulse id, height, width, dtype.
+_HEADER = struct.Struct("<Qddqii8s")
+_DATA_OFFSET = 64
+_READ_RETRIES = 10
+
+
+class LatestFrameCache(object):
+    """
+    Shared memory slot holding the latest frame published by a camera instance, so that other processes (the REST
+    server) can read it without connecting to the camera. The slot is protected by a sequence counter: the writer
+    makes it odd while updating, and a reader retries if the counter is odd or changed while reading.
+    """
+
+    def __init__(self, size, interval=0.0, name=None):
+        """
+        :param size: Maximum frame size in bytes: bigger frames are not cached.
+        :param interval: Minimum interval in seconds between two published frames.
+        :param name: Name of an existing cache to attach to. If None, a new cache is created.
+        """
+        if shared_memory is None:
+            raise RuntimeError("Shared memory not supported")
+        self.size = int(size)
+        self.interval = interval
+        self.owner = name is None
+        self._shared_memory = shared_memory.SharedMemory(name=name, create=self.owner,
+                                                         size=_DATA_OFFSET + self.size if self.owner else 0)
+        self._lock = Lock()
+        self._last_publish = 0.0
+
+    @property
+    def name(self):
+        return self._shared_memory.name
+
+    def __getstate__(self):
+        return {"size": self.size, "interval": self.interval, "name": self.name}
+
+    def __setstate__(self, state):
+        self.__init__(state["size"], state["interval"], state["name"])
+
+    def publish(self, image, timestamp=None, pulse_id=None):
+        """
+        :param image: Frame to publish (2D array).
+        :return: True if the frame was published, False if skipped (interval not elapsed, frame too big, or another
+                 thread publishing).
+        """
+        now = time.time()
+        if (image is None) or (image.nbytes > self.size) or ((now - self._last_publish) < self.interval):
+            return False
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            buffer = self._shared_memory.buf
+            sequence = _HEADER.unpack_from(buffer)[0]
+            struct.pack_into("<Q", buffer, 0, sequence + 1)
+            height, width = image.shape
+            data = numpy.ndarray(image.shape, image.dtype, buffer, _DATA_OFFSET)
+            numpy.copyto(data, image)
+            _HEADER.pack_into(buffer, 0, sequence + 1, now,
+                              float("nan") if timestamp is None else float(timestamp),
+                              -1 if pulse_id is None else int(pulse_id), height, width, image.dtype.str.encode())
+            struct.pack_into("<Q", buffer, 0, sequence + 2)
+            self._last_publish = now
+            return True
+        finally:
+            self._lock.release()
+
+    def get(self, ttl=None):
+        """
+        :param ttl: Maximum age in seconds of the frame. If None, the frame is returned regardless of its age.
+        :return: (image, timestamp, pulse_id) of the latest frame, or None if there is no frame, it is older than
+                 ttl or could not be read consistently.
+        """
+        buffer = self._shared_memory.buf
+        for _ in range(_READ_RETRIES):
+            sequence, publish_time, timestamp, pulse_id, height, width, dtype = _HEADER.unpack_from(buffer)
+            if sequence == 0:
+                return None
+            if sequence % 2:
+                time.sleep(0.0001)
+                continue
+            if (ttl is not None) and (time.time() - publish_time > ttl):
+                return None
+            image = numpy.ndarray((height, width), dtype.rstrip(b"\0").decode(), buffer, _DATA_OFFSET).copy()
+            if struct.unpack_from("<Q", buffer)[0] == sequence:
+                return image, (None if math.isnan(timestamp) else timestamp), (None if pulse_id < 0 else pulse_id)
+        _logger.debug("Could not read consistent frame from cache %s" % (self.name,))
+        return None
+
+    def close(self):
+        self._shared_memory.close()
+        if self.owner:
+            try:
+                self._shared_memory.unlink()
+            except FileNotFoundError:
+                pass
@@ -2,6 +2,7 @@ import socket
 from logging import getLogger
 
 from cam_server import config
+from cam_server.camera.frame_cache import LatestFrameCache
 from cam_server.camera.sender import get_sender_function, get_ipc_address
 from cam_server.camera.source.utils import get_source_class
 from cam_server.instance_management.management import InstanceManager, InstanceWrapper
@@ -25,7 +26,7 @@ class CameraInstanceManager(InstanceManager):
     def __init__(self, config_manager, hostname=None, port_range=None, mode=0):
         super(CameraInstanceManager, self).__init__(
             port_range=config.CAMERA_STREAM_PORT_RANGE if (port_range is None) else port_range,
-            auto_delete_stopped=(mode in (3, 4)))
+            auto_delete_stopped=(mode in (3, 4)), preload_modules=config.CAMERA_WORKER_PRELOAD_MODULES)
         self.prefer_same_port = mode not in (1, 3)
         self.allow_reinstantiate = (mode == 1)
         self.config_manager = config_manager
@@ -84,12 +85,38 @@ class CameraInstanceManager(InstanceManager):
         camera_instance = self.get_instance(camera_name)
         camera_instance.set_parameter(new_config)
 
+    def get_latest_image(self, camera_name, ttl=None):
+        """
+        Get the latest frame published by a running camera instance.
+        :param camera_name: Name of the camera.
+        :param ttl: Maximum age of the frame in seconds. If None, config.CAMERA_FRAME_CACHE_TTL.
+        :return: Image, or None if the instance is not running or has no recent frame.
+        """
+        instance = self.instances.get(camera_name)
+        if (instance is None) or not instance.is_running():
+            return None
+        latest = instance.get_latest_frame(config.CAMERA_FRAME_CACHE_TTL if (ttl is None) else ttl)
+        return None if (latest is None) else latest[0]
+
+    def delete_instance(self, instance_name):
+        instance = self._get_instance(instance_name)
+        super(CameraInstanceManager, self).delete_instance(instance_name)
+        instance.close()
+
 
 class CameraInstance(InstanceWrapper):
     def __init__(self, process_function, camera, stream_port, hostname=None):
 
+        # Shared with the instance process, which publishes the latest frame to it.
+        self.frame_cache = None
+        if config.CAMERA_FRAME_CACHE_SIZE > 0:
+            try:
+                self.frame_cache = LatestFrameCache(config.CAMERA_FRAME_CACHE_SIZE, config.CAMERA_FRAME_CACHE_INTERVAL)
+            except Exception as e:
+                _logger.warning("Could not create latest frame cache: %s [%s]" % (str(e), camera.get_name()))
+
         super(CameraInstance, self).__init__(camera.get_name(), process_function, stream_port,
-                                             camera, stream_port)
+                                             camera, stream_port, self.frame_cache)
 
         self.camera = camera
 
@@ -121,6 +148,19 @@ class CameraInstance(InstanceWrapper):
     def get_stream_address(self):
         return self.stream_address
 
+    def get_latest_frame(self, ttl=None):
+        """
+        :return: (image, timestamp, pulse_id) of the latest frame published by the instance, or None.
+        """
+        if self.frame_cache is None:
+            return None
+        return self.frame_cache.get(ttl)
+
+    def close(self):
+        if self.frame_cache is not None:
+            self.frame_cache.close()
+            self.frame_cache = None
+
     def set_parameter(self, configuration):
         self.camera.camera_config.set_configuration(configuration)
 
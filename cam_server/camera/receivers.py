@@ -0,0 +1,171 @@
+import functools
+import mmap
+from collections import deque
+from logging import getLogger
+from multiprocessing import Pipe
+from multiprocessing.connection import wait
+from threading import Thread, Lock
+
+import numpy
+
+from epics.multiproc import CAProcess as Process
+
+from cam_server import config
+
+_logger = getLogger(__name__)
+
+_SLOT_ALIGNMENT = 4096
+
+
+class ConnectionReceivers(object):
+    """
+    Receives the connections to a camera in separate processes, so that the decoding and transformation of the frames
+    of the different connections is not serialized by the GIL. Each receiver process copies its frames into its own
+    slots of a shared memory ring and passes it to this process, which returns the slot once the frame is sent.
+    A receiver with all its slots in use waits for one to be returned before receiving the next frame.
+    The receivers are forked, so the receiver and update functions can be closures over the state of the camera.
+    """
+
+    def __init__(self, connections, frame_size, create_receiver, on_frame, update_function=None, slots=None,
+                 stop_event=None):
+        """
+        :param connections: Number of receiver processes.
+        :param frame_size: Size in bytes of the frames. Bigger frames are pickled.
+        :param create_receiver: Called in each receiver process as create_receiver(index), returning the function
+                                receiving a frame: receive() -> (pulse_id, image, metadata), or None on timeout.
+                                image may be None (e.g. invalid frame), and metadata is a picklable object.
+        :param on_frame: Called for each frame, from the frame thread, as on_frame(pulse_id, image, metadata, release).
+                         image is a view on the ring: release() must be called once it is not used anymore (release
+                         is None if the image is not in the ring).
+        :param update_function: Called in every receiver with the arguments of update().
+        :param slots: Slots of the ring per receiver. If None, config.CAMERA_RECEIVER_SLOTS.
+        :param stop_event: Event stopping the receivers, set if a receiver fails.
+        """
+        self.connections = int(connections)
+        self.slots = int(slots) if slots else config.CAMERA_RECEIVER_SLOTS
+        self.slot_size = ((int(frame_size) + _SLOT_ALIGNMENT - 1) // _SLOT_ALIGNMENT) * _SLOT_ALIGNMENT
+
+        self._create_receiver = create_receiver
+        self._update_function = update_function
+        self._on_frame = on_frame
+        self._stop_event = stop_event
+        self._ring = mmap.mmap(-1, max(self.slot_size * self.slots * self.connections, 1))
+        self._locks = [Lock() for _ in range(self.connections)]
+        self._closed = False
+
+        self._pipes = []
+        self._processes = []
+        for index in range(self.connections):
+            connection, receiver_connection = Pipe()
+            self._pipes.append(connection)
+            process = Process(target=self._run_receiver, args=(index, receiver_connection))
+            process.daemon = True
+            process.start()
+            receiver_connection.close()
+            self._processes.append(process)
+
+        self._frame_thread = Thread(target=self._receive_frames, daemon=True)
+        self._frame_thread.start()
+
+    def _send(self, index, message):
+        with self._locks[index]:
+            self._pipes[index].send(message)
+
+    def _release(self, slot):
+        if not self._closed:
+            try:
+                self._send(slot // self.slots, ("release", slot))
+            except (OSError, ValueError):
+                pass
+
+    def update(self, *args):
+        """
+        Calls update_function(*args) in all receivers before they receive the next frame.
+        """
+        for index in range(self.connections):
+            self._send(index, ("update", args))
+
+    def _run_receiver(self, index, connection):
+        for other in self._pipes:
+            other.close()
+        free_slots = deque(range(index * self.slots, (index + 1) * self.slots))
+        try:
+            receive = self._create_receiver(index)
+            while (self._stop_event is None) or (not self._stop_event.is_set()):
+                # Waits for a free slot if all are in use.
+                while connection.poll(0 if free_slots else config.PROCESS_POLL_INTERVAL):
+                    message = connection.recv()
+                    if message is None:
+                        return
+                    kind, arguments = message
+                    if kind == "release":
+                        free_slots.append(arguments)
+                    else:
+                        self._update_function(*arguments)
+                if not free_slots:
+                    continue
+                frame = receive()
+                if frame is None:
+                    continue
+                pulse_id, image, metadata = frame
+                slot = None
+                if (image is not None) and (image.nbytes <= self.slot_size):
+                    slot = free_slots.popleft()
+                    numpy.copyto(numpy.ndarray(image.shape, image.dtype, self._ring, slot * self.slot_size), image)
+                    image = (image.shape, image.dtype.str)
+                connection.send((pulse_id, image, metadata, slot))
+        except (KeyboardInterrupt, EOFError, BrokenPipeError):
+            pass
+        except Exception as e:
+            _logger.error("Error on receiver %d: %s" % (index, str(e)))
+        finally:
+            connection.close()
+
+    def _receive_frames(self):
+        pipes = list(self._pipes)
+        while pipes:
+            for connection in wait(pipes, timeout=config.PROCESS_POLL_INTERVAL):
+                try:
+                    pulse_id, image, metadata, slot = connection.recv()
+                except (EOFError, OSError):
+                    pipes.remove(connection)
+                    if not self._closed:
+                        _logger.error("Receiver %d exited" % (self._pipes.index(connection),))
+                        if self._stop_event is not None:
+                            self._stop_event.set()
+                    continue
+                release = None
+                if slot is not None:
+                    shape, dtype = image
+                    image = numpy.ndarray(shape, dtype, self._ring, slot * self.slot_size)
+                    release = functools.partial(self._release, slot)
+                try:
+                    self._on_frame(pulse_id, image, metadata, release)
+                except Exception as e:
+                    _logger.error("Error processing frame of PID %s: %s" % (pulse_id, str(e)))
+                    if release is not None:
+                        release()
+                    if self._stop_event is not None:
+                        self._stop_event.set()
+
+    def close(self, timeout=config.PROCESS_COMMUNICATION_TIMEOUT):
+        if self._closed:
+            return
+        self._closed = True
+        for index in range(self.connections):
+            try:
+                self._send(index, None)
+            except:
+                pass
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._frame_thread.join(timeout)
+        for connection in self._pipes:
+            connection.close()
+        try:
+            self._ring.close()
+        except BufferError:
+            # Images still referencing the ring: released when garbage collected.
+            pass
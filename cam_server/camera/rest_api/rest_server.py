@@ -1,4 +1,3 @@
-import base64
 import json
 import logging
 
@@ -8,8 +7,10 @@ from bottle import request, response
 from cam_server import config
 from cam_server.camera.configuration import CameraConfig
 from cam_server.instance_management import rest_api
-from cam_server.pipeline.data_processing.functions import get_png_from_image
-from cam_server.utils import register_logs_rest_interface
+from cam_server.pipeline.data_processing.functions import get_png_from_image, get_preview_from_image, \
+    get_preview_format, PREVIEW_FORMATS
+from cam_server.utils import register_logs_rest_interface, get_image_bytes_response
+from cam_server_client.utils import get_image_bytes
 
 _logger = logging.getLogger(__name__)
 
@@ -152,17 +153,27 @@ def register_rest_interface(app, instance_manager, interface_prefix=None):
                 "status": "Geometry of camera %s retrieved." % camera_name,
                 "geometry": [width, height]}
 
+    def get_image(camera_name, raw=False):
+        # Running instances publish their latest frame: the camera is only accessed if there is no recent one.
+        if not raw and hasattr(instance_manager, "get_latest_image"):
+            image = instance_manager.get_latest_image(camera_name)
+            if image is not None:
+                return image
+        camera = instance_manager.config_manager.load_camera(camera_name)
+        return camera.get_image(raw=raw)
+
     @app.get(api_root_address + '/<camera_name>/image')
     def get_camera_image(camera_name):
         """
-        Return a camera image in PNG format. URL parameters available:
-        raw, scale=[float], min_value=[float], max_value[float], colormap[string].
+        Return a camera image in PNG (default), JPEG or WebP format. URL parameters available:
+        raw, scale=[float], min_value=[float], max_value[float], colormap[string],
+        format=[png|jpeg|webp], compression=[0-9] (PNG), quality=[1-100] (JPEG/WebP), decimation=[int],
+        legacy (previous PNG renderer).
         Colormap: See http://matplotlib.org/examples/color/colormaps_reference.html
         :param camera_name: Name of the camera to grab the image from.
-        :return: PNG image.
+        :return: Image (PNG, JPEG or WebP).
         """
 
-        camera = instance_manager.config_manager.load_camera(camera_name)
         raw = 'raw' in request.params
         scale = float(request.params["scale"]) if "scale" in request.params else None
         min_value = float(request.params["min_value"]) if "min_value" in request.params else None
@@ -170,35 +181,42 @@ def register_rest_interface(app, instance_manager, interface_prefix=None):
         colormap_name = request.params.get("colormap")
 
         # Retrieve a single image from the camera.
-        image_raw_bytes = camera.get_image(raw=raw)
+        image_raw_bytes = get_image(camera_name, raw)
 
-        image = get_png_from_image(image_raw_bytes, scale, min_value, max_value, colormap_name)
+        if "legacy" in request.params:
+            image = get_png_from_image(image_raw_bytes, scale, min_value, max_value, colormap_name)
+            response.set_header('Content-type', 'image/png')
+            return image
 
-        response.set_header('Content-type', 'image/png')
+        image_format = get_preview_format(request.params.get("format"))
+        compression = int(request.params["compression"]) if "compression" in request.params else None
+        quality = int(request.params["quality"]) if "quality" in request.params else None
+        decimation = int(request.params["decimation"]) if "decimation" in request.params else None
+        image = get_preview_from_image(image_raw_bytes, scale, min_value, max_value, colormap_name, image_format,
+                                       compression, quality, decimation)
+
+        response.set_header('Content-type', PREVIEW_FORMATS[image_format])
         return image
 
     @app.get(api_root_address + '/<camera_name>/image_bytes')
     def get_camera_image_bytes(camera_name):
         """
-        Return the camera image bytes.
+        Return the camera image bytes. URL parameters available: format=[raw|npy] (binary response, also selected
+        with the Accept header, compressed according to Accept-Encoding: bitshuffle_lz4 or lz4).
         :param camera_name: Name of the camera to grab the image from.
-        :return: JSON with details and byte stream.
+        :return: JSON with details and byte stream, or binary image.
         """
 
-        camera = instance_manager.config_manager.load_camera(camera_name)
-
         # Retrieve a single image from the camera.
-        image_bytes = camera.get_image()
+        image_bytes = get_image(camera_name)
 
-        base64_bytes = base64.b64encode(image_bytes)
-        image_shape = image_bytes.shape
-        image_dtype = image_bytes.dtype.descr[0][1]
+        binary_response = get_image_bytes_response(image_bytes)
+        if binary_response is not None:
+            return binary_response
 
         return {"state": "ok",
                 "status": "Image bytes of camera '%s'." % camera_name,
-                "image": {"bytes": base64_bytes.decode("utf-8"),
-                          "shape": image_shape,
-                          "dtype": image_dtype}}
+                "image": get_image_bytes(image_bytes)}
 
     @app.error(405)
     def method_not_allowed(res):
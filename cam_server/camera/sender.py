@@ -1,6 +1,7 @@
 import time
 import os
 import sys
+import numpy
 from logging import getLogger
 
 from bsread.sender import Sender, PUB
@@ -8,7 +9,8 @@ from zmq import Again
 
 from cam_server import config
 from cam_server.camera.source.common import transform_image
-from cam_server.utils import set_statistics, on_message_sent, init_statistics, MaxLenDict
+from cam_server.camera.receivers import ConnectionReceivers
+from cam_server.utils import set_statistics, on_message_sent, init_statistics, JitterBuffer
 
 from cam_server.ipc import IpcSender
 
@@ -32,6 +34,10 @@ def get_connections(camera):
         _logger.warning("Invalid number of connections (using 1) [%s]" % (camera.get_name(),))
     return 1
 
+def get_connection_processes(camera):
+    connection_processes = camera.camera_config.get_configuration().get("connection_processes")
+    return str(connection_processes).lower() == "true"
+
 def get_buffer_size(camera):
     buffer_size = camera.camera_config.get_configuration().get("buffer_size")
     try:
@@ -41,14 +47,14 @@ def get_buffer_size(camera):
         _logger.warning("Invalid buffer size (using 0) [%s]" % (camera.get_name(),))
     return 0
 
-def get_buffer_threshold(camera):
-    buffer_threshold = camera.camera_config.get_configuration().get("buffer_threshold")
+def get_buffer_latency(camera):
+    buffer_latency = camera.camera_config.get_configuration().get("buffer_latency")
     try:
-        if buffer_threshold is not None:
-            return min(max(float(buffer_threshold), 0), 1.0)
+        if buffer_latency is not None:
+            return max(float(buffer_latency), 0) / 1000.0
     except:
-        _logger.warning("Invalid buffer threshold (using 0.5) [%s]" % (camera.get_name(),))
-    return 0.5
+        _logger.warning("Invalid buffer latency (using %d) [%s]" % (config.CAMERA_BUFFER_LATENCY, camera.get_name()))
+    return config.CAMERA_BUFFER_LATENCY / 1000.0
 
 def get_dtype(camera):
     dtype = camera.camera_config.get_configuration().get("dtype")
@@ -75,7 +81,7 @@ def create_sender(camera, port):
     else:
         return Sender(port=port, mode=PUB, data_header_compression=config.CAMERA_BSREAD_DATA_HEADER_COMPRESSION)
 
-def process_epics_camera(stop_event, statistics, parameter_queue, camera, port):
+def process_epics_camera(stop_event, statistics, parameter_queue, camera, port, frame_cache=None):
     """
     Start the camera stream and listen for image monitors. This function blocks until stop_event is set.
     :param stop_event: Event when to stop the process.
@@ -83,6 +89,7 @@ def process_epics_camera(stop_event, statistics, parameter_queue, camera, port):
     :param parameter_queue: Parameters queue to be passed to the pipeline.
     :param camera: Camera instance to get the images from.
     :param port: Port to use to bind the output stream.
+    :param frame_cache: If provided (frame_cache.LatestFrameCache), the latest frame is published to it.
     """
     sender = None
     exit_code = 0
@@ -149,8 +156,11 @@ def process_epics_camera(stop_event, statistics, parameter_queue, camera, port):
             frame_shape = str(x_size) + "x" + str(y_size) + "x" + str(image.itemsize)
             set_statistics(statistics, sender, statistics.total_bytes + frame_size, 1 if (image is not None) else 0, frame_shape)
 
+            pulse_id = int(time.time() *100) if simulate_pulse_id else None
+            if frame_cache is not None:
+                frame_cache.publish(image, timestamp, pulse_id)
+
             try:
-                pulse_id = int(time.time() *100) if simulate_pulse_id else None
                 sender.send(data=data, pulse_id = pulse_id, timestamp=timestamp, check_data=False)
                 on_message_sent(statistics)
             except Again:
@@ -186,7 +196,7 @@ def process_epics_camera(stop_event, statistics, parameter_queue, camera, port):
 
 
 
-def process_bsread_camera(stop_event, statistics, parameter_queue, camera, port):
+def process_bsread_camera(stop_event, statistics, parameter_queue, camera, port, frame_cache=None):
     """
     Start the camera stream and receive the incoming bsread streams. This function blocks until stop_event is set.
     :param stop_event: Event when to stop the process.
@@ -194,12 +204,14 @@ def process_bsread_camera(stop_event, statistics, parameter_queue, camera, port)
     :param parameter_queue: Parameters queue to be passed to the pipeline.
     :param camera: Camera instance to get the stream from.
     :param port: Port to use to bind the output stream.
+    :param frame_cache: If provided (frame_cache.LatestFrameCache), the latest frame is published to it.
     """
     sender = None
     camera_streams = []
     receive_threads = []
     threaded = False
-    message_buffer, message_buffer_send_thread, message_buffer_lock = None, None, None
+    message_buffer, message_buffer_send_thread = None, None
+    receivers = None
     data_changed = False
     format_error = False
     exit_code = 0
@@ -226,46 +238,31 @@ def process_bsread_camera(stop_event, statistics, parameter_queue, camera, port)
             nonlocal data_changed
             data_changed = True
 
-        def message_buffer_send_task(message_buffer, stop_event, message_buffer_lock):
+        def message_buffer_send_task(message_buffer, stop_event):
             nonlocal sender, data_format_changed
             _logger.info("Start message buffer send thread [%s]" % (camera.get_name(),))
             sender = create_sender(camera, port)
             sender.open(no_client_action=no_client_timeout, no_client_timeout=get_client_timeout(camera))
             last_pid = None
-            interval = 1
-            threshold = int(message_buffer.maxlen * get_buffer_threshold(camera))
             buffer_logs = get_buffer_logs(camera)
             try:
                 while not stop_event.is_set():
-                    tx = False
-                    with message_buffer_lock:
-                        size=len(message_buffer)
-                        if size > 0:
-                            pids = sorted(message_buffer.keys())
-                            pulse_id = pids[0]
-                            if (last_pid) and (pulse_id <= last_pid):
-                                message_buffer.pop(pulse_id) #Remove ancient PIDs
-                                _logger.info("Removed ancient Pulse ID from queue: %d [%s]" % (pulse_id, camera.get_name()))
-                            else:
-                                if not last_pid or \
-                                     (pulse_id <= (last_pid+interval)) or (size > threshold):
-                                    (data, timestamp) = message_buffer.pop(pulse_id)
-                                    #sender.send(data=data, pulse_id=pulse_id, timestamp=timestamp, check_data=True)
-                                    #Don't send inside the sync block
-                                    tx = True
-                    if tx:
+                    # Released in pulse id order: when following the last sent, or after waiting the buffer
+                    # latency for the previous PIDs. Late PIDs are dropped by the buffer.
+                    released = message_buffer.get(config.PROCESS_POLL_INTERVAL)
+                    if released is not None:
+                        pulse_id, (data, timestamp, release) = released
                         sender.send(data=data, pulse_id=pulse_id, timestamp=timestamp, check_data=data_format_changed)
                         data_format_changed = False
+                        if release is not None:
+                            # Returns the shared memory slot of the image to its receiver process.
+                            release()
                         on_message_sent(statistics)
-                        if (last_pid):
-                            expected = (last_pid + interval);
+                        if last_pid and buffer_logs and message_buffer.increment:
+                            expected = (last_pid + message_buffer.increment)
                             if pulse_id != expected:
-                                interval = pulse_id - last_pid
-                                if buffer_logs:
-                                    _logger.info("Failed Pulse ID %d - received %d: Pulse ID interval set to: %d [%s]" % (expected, pulse_id, interval, camera.get_name()))
+                                _logger.info("Failed Pulse ID %d - received %d: Pulse ID interval: %d [%s]" % (expected, pulse_id, message_buffer.increment, camera.get_name()))
                         last_pid = pulse_id
-                    if size == 0:
-                        time.sleep(0.001)
                     #while not parameter_queue.empty():
                     #    new_parameters = parameter_queue.get()
                     #    camera.camera_config.set_configuration(new_parameters)
@@ -312,9 +309,8 @@ def process_bsread_camera(stop_event, statistics, parameter_queue, camera, port)
 
         stats_lock = RLock()
         if threaded:
-            message_buffer_lock = RLock()
-            message_buffer = MaxLenDict(maxlen=buffer_size)
-            message_buffer_send_thread = Thread(target=message_buffer_send_task, args=(message_buffer, stop_event, message_buffer_lock))
+            message_buffer = JitterBuffer(get_buffer_latency(camera), maxlen=buffer_size)
+            message_buffer_send_thread = Thread(target=message_buffer_send_task, args=(message_buffer, stop_event))
             message_buffer_send_thread.start()
         else:
             sender = create_sender(camera, port)
@@ -426,7 +422,8 @@ def process_bsread_camera(stop_event, statistics, parameter_queue, camera, port)
                         total_bytes[index] = data.statistics.total_bytes_received
 
                 with stats_lock:
-                    set_statistics(statistics, sender, sum(total_bytes), 1 if data else 0, frame_shape)
+                    set_statistics(statistics, sender, sum(total_bytes), 1 if data else 0, frame_shape,
+                                   queues=[message_buffer] if threaded else None)
 
                 # In case of receiving error or timeout, the returned data is None.
                 if data is None:
@@ -448,6 +445,9 @@ def process_bsread_camera(stop_event, statistics, parameter_queue, camera, port)
                 timestamp_ns = data.data.global_timestamp_offset
                 timestamp = timestamp_s + (timestamp_ns / 1e9)
 
+                if frame_cache is not None:
+                    frame_cache.publish(image, timestamp, pulse_id)
+
                 data = {
                     "image": image,
                     "height": height,
@@ -457,8 +457,7 @@ def process_bsread_camera(stop_event, statistics, parameter_queue, camera, port)
                     "timestamp": timestamp
                 }
                 if threaded:
-                    with message_buffer_lock:
-                        message_buffer[pulse_id]= (data, timestamp)
+                    message_buffer.put(pulse_id, (data, timestamp, None))
                 else:
                     sender.send(data=data, pulse_id=pulse_id, timestamp=timestamp, check_data=data_format_changed)
                     data_format_changed = False
@@ -470,7 +469,7 @@ def process_bsread_camera(stop_event, statistics, parameter_queue, camera, port)
             return True
 
 
-        def receive_task(index, message_buffer, stop_event, message_buffer_lock, camera_stream):
+        def receive_task(index, message_buffer, stop_event, camera_stream):
             _logger.info("Start receive thread %d [%s]" % (index, camera.get_name()))
             #camera_stream = camera.get_stream()
             camera_stream.connect()
@@ -490,11 +489,68 @@ def process_bsread_camera(stop_event, statistics, parameter_queue, camera, port)
                         pass
                 _logger.info("Exit receive thread %d [%s]" % (index, camera.get_name()))
 
-        if threaded:
+        def create_connection_receiver(index):
+            # Runs in the receiver process of the connection: receives, decodes and transforms its frames.
+            camera_stream = camera.get_stream(data_change_callback=data_change_callback)
+            camera_stream.connect()
+
+            def receive():
+                nonlocal data_changed
+                if data_changed:
+                    camera.updtate_size_raw()
+                    process_parameters()
+                    data_changed = False
+                data = camera_stream.receive()
+                if data is None:
+                    return None
+                image = data.data.data[camera_name + config.EPICS_PV_SUFFIX_IMAGE].value
+                if image is not None:
+                    image = transform_image(image, camera.camera_config)
+                    if (len(x_axis) != image.shape[1]) or (len(y_axis) != image.shape[0]):
+                        image = None
+                timestamp = data.data.global_timestamp + (data.data.global_timestamp_offset / 1e9)
+                return data.data.pulse_id, image, (index, timestamp, x_axis, y_axis, data.statistics.total_bytes_received)
+            return receive
+
+        def update_connection_receiver(parameters):
+            camera.camera_config.set_configuration(parameters)
+            process_parameters()
+
+        def on_connection_frame(pulse_id, image, metadata, release):
+            nonlocal frame_shape, format_error
+            index, timestamp, frame_x_axis, frame_y_axis, total_bytes[index] = metadata
+            format_error = image is None
+            if image is not None:
+                height, width = image.shape
+                frame_shape = str(width) + "x" + str(height) + "x" + str(image.itemsize)
+            set_statistics(statistics, sender, sum(total_bytes), 1, frame_shape, queues=[message_buffer])
+            if image is None:
+                return
+            if frame_cache is not None:
+                frame_cache.publish(image, timestamp, pulse_id)
+            data = {
+                "image": image,
+                "height": height,
+                "width": width,
+                "x_axis": frame_x_axis,
+                "y_axis": frame_y_axis,
+                "timestamp": timestamp
+            }
+            if not message_buffer.put(pulse_id, (data, timestamp, release)):
+                release()
+
+        if threaded and get_connection_processes(camera):
+            _logger.info("Receiving %d connections in separate processes [%s]" % (connections, camera.get_name()))
+            receivers = ConnectionReceivers(connections, x_size * y_size * numpy.dtype(get_dtype(camera)).itemsize,
+                                            create_connection_receiver, on_connection_frame,
+                                            update_connection_receiver,
+                                            slots=buffer_size // connections + config.CAMERA_RECEIVER_SLOTS,
+                                            stop_event=stop_event)
+        elif threaded:
             for i in range(connections):
                 camera_stream = camera.get_stream(data_change_callback=data_change_callback)
                 #camera_stream.format_error_counter = 0
-                receive_thread = Thread(target=receive_task, args=(i, message_buffer, stop_event, message_buffer_lock, camera_stream))
+                receive_thread = Thread(target=receive_task, args=(i, message_buffer, stop_event, camera_stream))
                 receive_thread.start()
                 receive_threads.append(receive_thread)
 
@@ -504,6 +560,8 @@ def process_bsread_camera(stop_event, statistics, parameter_queue, camera, port)
                 new_parameters = parameter_queue.get()
                 camera.camera_config.set_configuration(new_parameters)
                 process_parameters()
+                if receivers is not None:
+                    receivers.update(new_parameters)
 
             if data_changed:
                 time.sleep(0.1) #Sleeping in case channels are monitored and were not updated
@@ -567,6 +625,11 @@ def process_bsread_camera(stop_event, statistics, parameter_queue, camera, port)
                 except:
                     pass
         else:
+            if receivers is not None:
+                try:
+                    receivers.close()
+                except:
+                    pass
             for t in receive_threads + [message_buffer_send_thread]:
                 if t:
                     try:
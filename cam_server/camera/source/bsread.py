@@ -18,6 +18,11 @@ class CameraBsread(CameraEpics):
         self.bsread_stream_address = None
         self.bsread_source = None
 
+    def __getstate__(self):
+        state = super(CameraBsread, self).__getstate__()
+        state.update(bsread_source=None)
+        return state
+
     def connect(self):
         self.verify_camera_online()
         self._collect_camera_settings()
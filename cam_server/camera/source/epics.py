@@ -32,6 +32,16 @@ class CameraEpics:
         self.channel_height = None
         self.channel_creation_lock = threading.Lock()
 
+    def __getstate__(self):
+        # Sent to the pooled worker running the camera: channels and locks are local to each process.
+        state = self.__dict__.copy()
+        state.update(channel_image=None, channel_width=None, channel_height=None)
+        del state["channel_creation_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.channel_creation_lock = threading.Lock()
 
     def caget(self, channel_name, timeout=config.EPICS_TIMEOUT, as_string=True):
         channel = create_pv(channel_name)
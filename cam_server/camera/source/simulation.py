@@ -60,6 +60,15 @@ class CameraSimulation(CameraEpics):
         self.raw = self.image_type in ["raw", "static_raw"]
         self.static = self.image_type in ["static_beam", "static_raw"]
 
+    def __getstate__(self):
+        state = super(CameraSimulation, self).__getstate__()
+        state.update(callback_functions=[], simulation_thread=None)
+        del state["simulation_stop_event"]
+        return state
+
+    def __setstate__(self, state):
+        super(CameraSimulation, self).__setstate__(state)
+        self.simulation_stop_event = Event()
 
     def _generate_dead_pixels(self, number_of_dead_pixel):
         dead_pixels = numpy.zeros((self.height_raw, self.width_raw))
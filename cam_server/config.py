@@ -21,6 +21,10 @@ CAMERA_STREAM_PORT_RANGE = (10100, 10301)
 DEFAULT_CAMERA_CONFIG_FOLDER = "configuration/camera_config"
 # Default colormap to use when getting an image from the camera.
 DEFAULT_CAMERA_IMAGE_COLORMAP = "rainbow"
+# Default format of the image previews (png, jpeg or webp), PNG compression level (0-9) and JPEG/WebP quality (1-100).
+DEFAULT_CAMERA_IMAGE_FORMAT = "png"
+DEFAULT_CAMERA_IMAGE_COMPRESSION = 0
+DEFAULT_CAMERA_IMAGE_QUALITY = 90
 
 # We have only 2 channels: Image and timestamp. Header compression is not really needed.
 CAMERA_BSREAD_DATA_HEADER_COMPRESSION = None
@@ -30,6 +34,16 @@ CAMERA_BSREAD_IMAGE_COMPRESSION = None
 CAMERA_BSREAD_SCALAR_COMPRESSION = None
 # Default interval for simulation camera.
 DEFAULT_CAMERA_SIMULATION_INTERVAL = 0.1
+# Size in bytes of the shared memory slot where running camera instances publish their latest frame (0 to disable).
+CAMERA_FRAME_CACHE_SIZE = 64 * 1024 * 1024
+# Minimum interval in seconds between two frames published to the latest frame cache.
+CAMERA_FRAME_CACHE_INTERVAL = 0.1
+# Maximum age in seconds of a cached frame served by the REST image endpoints: older frames are read from the camera.
+CAMERA_FRAME_CACHE_TTL = 1.0
+# Default time in milliseconds a frame of a threaded bsread camera waits for the previous pulse ids.
+CAMERA_BUFFER_LATENCY = 100
+# Shared memory frame slots of each connection receiver process, in addition to its share of the message buffer.
+CAMERA_RECEIVER_SLOTS = 4
 
 # Number of image format error before rising exception
 FORMAT_ERROR_COUNT = 10
@@ -68,13 +82,46 @@ BSREAD_IMAGE_BUFFER_SIZE_DEFAULT = 1000
 BSREAD_DATA_BUFFER_SIZE_DEFAULT = 1000
 BSREAD_IMAGE_BUFFER_SIZE_MAX = 5000
 BSREAD_DATA_BUFFER_SIZE_MAX = 10000
+#Maximum size in MB of the images waiting to be merged with bsread data
+BSREAD_IMAGE_BUFFER_MB_DEFAULT = 512
+#Maximum time in seconds images and bsread data wait to be merged
+BSREAD_JOIN_TIMEOUT = 10.0
+#Images and bsread data older than the newest pulse id by more than this number of pulses are not merged anymore
+BSREAD_JOIN_PID_WINDOW = 10000
 
 BSREAD_FORMAT_ERROR_TIMEOUT = 10 #s
 
+#Maximum number of pre-processing work buffers of each shape and type kept by a pipeline.
+PIPELINE_BUFFER_POOL_SIZE = 4
+
+#Slots of the shared memory frame ring per processing worker process (frames being processed at the same time).
+PIPELINE_WORKER_SLOTS = 4
+
+#Pixels added around the footprint of a rotated region of interest when interpolating with splines (order > 1).
+PIPELINE_ROTATION_SPLINE_MARGIN = 16
+
+#Gaussian fit: relative tolerance for convergence and maximum number of iterations
+GAUSS_FIT_TOLERANCE = 1.49012e-08
+GAUSS_FIT_MAX_ITERATIONS = 100
+#Warm started gaussian fit: the previous parameters are discarded if the rms of the residuals exceeds the one of the
+#previous fit by more than GAUSS_FIT_WARM_START_MAX_RESIDUAL (relative) or if the center moves by more than
+#GAUSS_FIT_WARM_START_MAX_JUMP standard deviations (or the standard deviation changes by more than this fraction).
+GAUSS_FIT_WARM_START_MAX_RESIDUAL = 0.5
+GAUSS_FIT_WARM_START_MAX_JUMP = 1.0
+#Iterations allowed to a warm started fit before falling back to a cold start.
+GAUSS_FIT_WARM_START_MAX_ITERATIONS = 20
+
 #Pipeline types
 PIPELINE_TYPE_PROCESSING = "processing"
 PIPELINE_TYPE_STORE = "store"
 PIPELINE_TYPE_STREAM = "stream"
+PIPELINE_TYPE_MULTI_CAMERA = "multi_camera"
+
+#Multi camera pipelines: maximum time in seconds the frame of a camera waits for the frames of the other cameras with
+#the same pulse id, pulse id window and maximum size in MB of the frames of each camera waiting to be synchronized.
+PIPELINE_SYNC_TIMEOUT = 1.0
+PIPELINE_SYNC_PID_WINDOW = 10000
+PIPELINE_SYNC_BUFFER_MB = 512
 
 
 ABORT_ON_ERROR = True
@@ -87,6 +134,14 @@ ABORT_ON_ERROR = True
 PROCESS_COMMUNICATION_TIMEOUT = 10
 # Interval used when polling the state from the process.
 PROCESS_POLL_INTERVAL = 0.1
+# Number of pre-forked worker processes waiting to run instances (0 to start a new process for every instance).
+WORKER_POOL_SIZE = 2
+# Modules imported by the pre-forked workers while waiting, by default and for the camera and pipeline servers.
+# The camera workers do not import the processing modules.
+WORKER_POOL_PRELOAD_MODULES = ["numpy"]
+CAMERA_WORKER_PRELOAD_MODULES = ["numpy", "bsread", "epics", "cam_server.camera.sender"]
+PIPELINE_WORKER_PRELOAD_MODULES = ["numpy", "scipy.optimize", "scipy.ndimage", "scipy.special", "matplotlib.cm",
+                                   "PIL.Image", "numba", "bsread", "epics", "cam_server.pipeline.transceiver"]
 
 ####################
 # General settings #
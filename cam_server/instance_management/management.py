@@ -1,12 +1,16 @@
+import atexit
+import importlib
 import multiprocessing
+import multiprocessing.synchronize
 import time
 from logging import getLogger
+from threading import Lock, Thread
 from cam_server import __VERSION__
 
 from epics.multiproc import CAProcess as Process
 
 from cam_server import config
-from cam_server.utils import get_port_generator
+from cam_server.utils import get_port_generator, Statistics
 
 try:
     import psutil
@@ -16,8 +20,155 @@ except:
 _logger = getLogger(__name__)
 
 
+class StopEvent(multiprocessing.synchronize.Event):
+    """
+    Stop event of an instance. The instance process clears it to signal that it started, which also sets the started
+    event: the start of the instance is waited for, instead of polling the stop event.
+    """
+
+    def __init__(self):
+        super(StopEvent, self).__init__(ctx=multiprocessing.get_context())
+        self.started = multiprocessing.Event()
+
+    def set(self):
+        self.started.clear()
+        super(StopEvent, self).set()
+
+    def clear(self):
+        super(StopEvent, self).clear()
+        self.started.set()
+
+
+def _run_pooled_worker(connection, stop_event, statistics, parameter_queue, preload_modules):
+    for module_name in preload_modules:
+        try:
+            importlib.import_module(module_name)
+        except Exception as e:
+            _logger.warning("Could not preload module %s: %s" % (module_name, str(e)))
+    task = connection.recv()
+    if task is None:
+        return
+    process_function, args = task
+    process_function(stop_event, statistics, parameter_queue, *args)
+
+
+class PooledWorker(object):
+    """
+    Process started in advance, with the IPC objects of an instance, waiting for the process function to run.
+    """
+
+    def __init__(self, preload_modules=()):
+        """
+        :param preload_modules: Modules imported by the worker while waiting.
+        """
+        self.stop_event = StopEvent()
+        self.stop_event.set()
+        self.statistics = Statistics()
+        self.parameter_queue = multiprocessing.Queue()
+        child_connection, self.connection = multiprocessing.Pipe(duplex=False)
+        self.process = Process(target=_run_pooled_worker,
+                               args=(child_connection, self.stop_event, self.statistics, self.parameter_queue,
+                                     tuple(preload_modules)))
+        self.process.start()
+        child_connection.close()
+
+    def run(self, process_function, args):
+        """
+        :return: True if the process function was sent to the worker, False if it could not be serialized.
+        """
+        try:
+            self.connection.send((process_function, args))
+            return True
+        except Exception as e:
+            _logger.info("Cannot run process function in pooled worker: %s" % (str(e),))
+            return False
+
+    def close(self):
+        try:
+            self.connection.send(None)
+        except:
+            self.process.terminate()
+        self.connection.close()
+
+
+class WorkerPool(object):
+    """
+    Pool of pre-forked worker processes, with the preload modules imported, adopted by instances when they start.
+    The pool is filled and refilled in the background.
+    """
+
+    def __init__(self, size, preload_modules=()):
+        """
+        :param size: Number of idle workers.
+        :param preload_modules: Modules imported by the workers while waiting.
+        """
+        self.size = size
+        self.preload_modules = tuple(preload_modules)
+        self._workers = []
+        self._lock = Lock()
+        self._filling = False
+        self._closed = False
+        atexit.register(self.close)
+        self._start_fill()
+
+    def _start_fill(self):
+        with self._lock:
+            if self._filling or self._closed:
+                return
+            self._filling = True
+        Thread(target=self._fill, daemon=True).start()
+
+    def _fill(self):
+        try:
+            while True:
+                with self._lock:
+                    if (len(self._workers) >= self.size) or self._closed:
+                        return
+                # Forked without holding the lock, so that run() is not blocked meanwhile.
+                worker = PooledWorker(self.preload_modules)
+                with self._lock:
+                    if self._closed:
+                        worker.close()
+                        return
+                    self._workers.append(worker)
+        finally:
+            with self._lock:
+                self._filling = False
+
+    def run(self, process_function, args):
+        """
+        :return: PooledWorker running the process function, or None if no worker is available.
+        """
+        with self._lock:
+            workers, self._workers = [w for w in self._workers if w.process.is_alive()], []
+            worker = workers.pop(0) if workers else None
+            if worker is not None and not worker.run(process_function, args):
+                workers.insert(0, worker)
+                worker = None
+            self._workers = workers
+        if worker is not None:
+            self._start_fill()
+        return worker
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            for worker in self._workers:
+                worker.close()
+            self._workers = []
+
+
 class InstanceManager(object):
-    def __init__(self, port_range=None, auto_delete_stopped=False):
+    def __init__(self, port_range=None, auto_delete_stopped=False, worker_pool_size=None, preload_modules=None):
+        """
+        :param worker_pool_size: Number of pre-forked worker processes. If None, config.WORKER_POOL_SIZE.
+        :param preload_modules: Modules imported by the pre-forked workers. If None,
+                                config.WORKER_POOL_PRELOAD_MODULES.
+        """
+        self.worker_pool_size = config.WORKER_POOL_SIZE if (worker_pool_size is None) else worker_pool_size
+        self.preload_modules = config.WORKER_POOL_PRELOAD_MODULES if (preload_modules is None) else preload_modules
+        # Created when the first instance is started.
+        self.worker_pool = None
         self.instances = {}
         self._info_timestamp = None
         self._tx = None
@@ -27,6 +178,14 @@ class InstanceManager(object):
         self._last_ports = {}
         self.auto_delete_stopped = auto_delete_stopped
 
+    def get_worker_pool(self):
+        """
+        :return: WorkerPool of the manager, created on the first call, or None if disabled.
+        """
+        if (self.worker_pool is None) and (self.worker_pool_size > 0):
+            self.worker_pool = WorkerPool(self.worker_pool_size, self.preload_modules)
+        return self.worker_pool
+
     def get_next_available_port(self, instance_id, prefer_same_port = False):
         if self.auto_delete_stopped:
             self.delete_stopped_instances()
@@ -163,7 +322,7 @@ class InstanceManager(object):
         if instance_name in self.instances:
             instance = self.instances[instance_name]
             if not instance.is_running():
-                instance.start()
+                instance.start(self.get_worker_pool())
             else:
                 _logger.info("Instance '%s' is already running." % instance_name)
         else:
@@ -207,51 +366,44 @@ class InstanceWrapper:
         self.args = args
 
         self.process = None
-        self.manager = multiprocessing.Manager()
 
-        self.stop_event = multiprocessing.Event()
+        self.stop_event = StopEvent()
         # The initial value of the stop event is set -> when the process starts, it un-sets it to signal the start.
         self.stop_event.set()
 
-        self.statistics = self.manager.Namespace()
-        self.statistics.total_bytes = 0
-        self.statistics.clients = 0
-        self.statistics.update_timestamp = None
-        self.statistics.throughput = 0
-        self.statistics.frame_rate = 0
-        self.statistics.rx_count = 0
-        self.statistics.tx_count = 0
-        self.statistics.tx_rate = 0
-        self.statistics.frame_shape = None
-        self.statistics.timestamp = 0
-        self.statistics.pid = ""
-        self.statistics.cpu = 0
-        self.statistics.memory = 0
-        self.statistics._process = None
-        self.statistics._frame_count = 0
+        # Written by the instance process, in shared memory.
+        self.statistics = Statistics()
 
 
         self.parameter_queue = multiprocessing.Queue()
 
         self.last_start_time = None
 
-    def start(self):
+    def start(self, worker_pool=None):
+        """
+        :param worker_pool: If provided (WorkerPool), the instance runs in one of its workers if available.
+        """
         if self.process and self.process.is_alive():
             _logger.info("Instance '%s' already running." % self.instance_name)
             return
 
         self.stop_event.set()
 
-        self.process = Process(target=self.process_function,
-                               args=(self.stop_event, self.statistics, self.parameter_queue,
-                                     *self.args))
-        self.process.start()
+        worker = worker_pool.run(self.process_function, self.args) if worker_pool else None
+        if worker is not None:
+            # The worker was created with its own IPC objects.
+            self.process, self.stop_event = worker.process, worker.stop_event
+            self.statistics, self.parameter_queue = worker.statistics, worker.parameter_queue
+        else:
+            self.process = Process(target=self.process_function,
+                                   args=(self.stop_event, self.statistics, self.parameter_queue,
+                                         *self.args))
+            self.process.start()
 
         # Wait for the processor to clear the flag - indication that the process is ready.
         start_timestamp = time.time()
         error_message = None
-        while self.stop_event.is_set():
-            time.sleep(config.PROCESS_POLL_INTERVAL)
+        while not self.stop_event.started.wait(config.PROCESS_POLL_INTERVAL):
             if not self.process.is_alive():
                 error_message = "'%s' instance  terminated. See logs." % self.instance_name
             # Check if the timeout has already elapsed.
@@ -301,15 +453,25 @@ class InstanceWrapper:
         ret = {"total_bytes": self.statistics.total_bytes,
                 "clients": self.statistics.clients,
                 "throughput": self.statistics.throughput,
-                "time": "" if not self.statistics.update_timestamp else time.strftime("%H:%M:%S", self.statistics.update_timestamp),
+                "time": "" if not self.statistics.update_timestamp else time.strftime("%H:%M:%S", time.localtime(self.statistics.update_timestamp)),
                 "rx":  "%1.2fHz - %d" % (self.statistics.frame_rate,self.statistics.rx_count),
                 "tx": "%1.2fHz - %d" % (self.statistics.tx_rate,self.statistics.tx_count),
-                "pid": str(self.statistics.pid),
+                "pid": str(self.statistics.pid) if self.statistics.pid else "",
                 "cpu": self.statistics.cpu,
                 "memory": self.statistics.memory,
                 }
         if self.statistics.frame_shape:
             ret["frame_shape"] = self.statistics.frame_shape
+        if self.statistics.copies_avoided:
+            ret["copies_avoided"] = "%1.2fHz - %d" % (self.statistics.copies_avoided_rate, self.statistics.copies_avoided)
+        if self.statistics.queue_depth is not None:
+            ret["queues"] = "depth %d - wait %1.3fms - dropped %d" % (self.statistics.queue_depth,
+                                                                      self.statistics.queue_wait * 1000,
+                                                                      self.statistics.queue_dropped)
+        if self.statistics.join_rate is not None:
+            ret["join"] = "hits %1.2fHz - misses %1.2fHz - expired %1.2fHz" % (self.statistics.join_rate,
+                                                                               self.statistics.join_miss_rate,
+                                                                               self.statistics.join_expiry_rate)
         return ret
 
     def get_stream_port(self):
@@ -0,0 +1,78 @@
+import functools
+import importlib
+import importlib.util
+import types
+from threading import RLock
+
+_lock = RLock()
+
+
+class LazyModule(types.ModuleType):
+    """
+    Module imported on the first access to one of its attributes, so that the import time is only paid by the
+    processes using it.
+    """
+
+    def __init__(self, name, submodules=()):
+        """
+        :param name: Name of the module.
+        :param submodules: Submodules imported together with the module (e.g. ("optimize",) for scipy).
+        """
+        super(LazyModule, self).__init__(name)
+        self.__dict__["_submodules"] = tuple(submodules)
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            with _lock:
+                name = self.__name__
+                module = importlib.import_module(name)
+                for submodule in self.__dict__["_submodules"]:
+                    importlib.import_module(name + "." + submodule)
+                self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        return "<lazy module '%s'>" % (self.__name__,)
+
+
+def lazy_import(name, submodules=()):
+    """
+    :param name: Name of the module.
+    :param submodules: Submodules imported together with the module.
+    :return: LazyModule, or None if the module is not installed.
+    """
+    try:
+        spec = importlib.util.find_spec(name.split(".")[0])
+    except (ImportError, ValueError):
+        spec = None
+    if spec is None:
+        return None
+    return LazyModule(name, submodules)
+
+
+numba = lazy_import("numba")
+
+
+def lazy_jit(**options):
+    """
+    Decorator compiling the function with numba.njit(**options) on the first call, instead of importing numba when
+    the module defining the function is imported.
+    """
+    def decorator(function):
+        compiled = []
+
+        @functools.wraps(function)
+        def wrapper(*args):
+            if not compiled:
+                compiled.append(numba.njit(**options)(function))
+            return compiled[0](*args)
+        return wrapper
+    return decorator
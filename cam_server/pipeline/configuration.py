@@ -328,6 +328,13 @@ class PipelineConfig:
 
         verify_attributes("configuration", configuration,  PipelineConfig.MANDATORY_ATTRIBUTES)
 
+        if configuration["pipeline_type"] == config.PIPELINE_TYPE_MULTI_CAMERA:
+            camera_names = configuration.get("camera_names")
+            if (not isinstance(camera_names, (list, tuple))) or (len(camera_names) == 0):
+                raise ValueError("camera_names must be a list of the synchronized cameras.")
+            if len(set(camera_names)) != len(camera_names):
+                raise ValueError("camera_names must not contain duplicated cameras.")
+
         if configuration["pipeline_type"] != config.PIPELINE_TYPE_STREAM:
             if "camera_name" not in configuration:
                 raise ValueError("Camera name not specified in configuration.")
@@ -352,6 +359,14 @@ class PipelineConfig:
                     raise ValueError("Invalid slice orientation '%s'. Slices orientation can be 'vertical' or 'horizontal'."
                                      % image_slices["orientation"])
 
+            image_rois = configuration.get("image_rois")
+            if image_rois:
+                if not isinstance(image_rois, dict):
+                    raise ValueError("image_rois must be a dictionary of named ROIs.")
+                for name, roi in image_rois.items():
+                    if (not isinstance(roi, (list, tuple))) or (len(roi) != 4):
+                        raise ValueError("Invalid ROI '%s': must be [offset_x, size_x, offset_y, size_y]." % name)
+
         # Verify if the pipeline exists.
         get_pipeline_function(configuration["pipeline_type"])
 
@@ -372,6 +387,11 @@ class PipelineConfig:
         if not configuration.get("pipeline_type"):
             configuration["pipeline_type"] = config.PIPELINE_TYPE_PROCESSING
 
+        if configuration["pipeline_type"] == config.PIPELINE_TYPE_MULTI_CAMERA:
+            # The first camera locates the server of the pipeline.
+            if configuration.get("camera_names") and not configuration.get("camera_name"):
+                configuration["camera_name"] = configuration["camera_names"][0]
+
         expanded_config = configuration
         if configuration["pipeline_type"] == config.PIPELINE_TYPE_PROCESSING:
             expanded_config = expand_section(configuration, PipelineConfig.DEFAULT_CONFIGURATION)
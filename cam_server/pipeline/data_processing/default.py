@@ -2,7 +2,8 @@ from cam_server.pipeline.data_processing.processor import process_image as defau
 from cam_server.pipeline.data_processing.pre_processor import process_image as pre_process_image
 
 
-def process_image(image, pulse_id, timestamp, x_axis, y_axis, parameters, image_background_array=None, bsdata = None):
+def process_image(image, pulse_id, timestamp, x_axis, y_axis, parameters, image_background_array=None, bsdata = None,
+                  fit_state=None):
     image, x_axis, y_axis = pre_process_image(image=image,
                          pulse_id=pulse_id,
                          timestamp=timestamp,
@@ -17,4 +18,5 @@ def process_image(image, pulse_id, timestamp, x_axis, y_axis, parameters, image_
                          x_axis=x_axis,
                          y_axis=y_axis,
                          parameters=parameters,
-                         bsdata=bsdata)
+                         bsdata=bsdata,
+                         fit_state=fit_state)
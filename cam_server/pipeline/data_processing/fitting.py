@@ -0,0 +1,450 @@
+from logging import getLogger
+
+import numpy
+
+from cam_server import config
+
+_logger = getLogger(__name__)
+
+# Only samples above this fraction of the amplitude are used for the log-parabola estimate.
+ESTIMATE_THRESHOLD = 0.2
+
+# Bounds of the Levenberg-Marquardt damping factor.
+_LAMBDA_INITIAL = 1e-3
+_LAMBDA_MIN = 1e-12
+_LAMBDA_MAX = 1e12
+
+
+def gauss_function(x, offset, amplitude, center, standard_deviation):
+    return offset + amplitude * numpy.exp(-(x - center) ** 2 / (2 * standard_deviation ** 2))
+
+
+def gauss_jacobian(x, offset, amplitude, center, standard_deviation):
+    """
+    Analytic jacobian of gauss_function (same derivatives as functions._gauss_deriv, but row major).
+    :return: Array of shape (len(x), 4): d/d_offset, d/d_amplitude, d/d_center, d/d_standard_deviation.
+    """
+    distance = x - center
+    fac = numpy.exp(-distance ** 2 / (2 * standard_deviation ** 2))
+    return _jacobian(distance, fac, amplitude, standard_deviation)
+
+
+def _evaluate(x, parameters):
+    # Returns the model and the terms needed to build the jacobian in the same point.
+    offset, amplitude, center, standard_deviation = parameters
+    distance = x - center
+    fac = numpy.exp(-distance ** 2 / (2 * standard_deviation ** 2))
+    return offset + amplitude * fac, distance, fac
+
+
+def _jacobian(distance, fac, amplitude, standard_deviation):
+    result = numpy.empty((distance.size, 4))
+    result[:, 0] = 1.0
+    result[:, 1] = fac
+    result[:, 2] = amplitude * fac * distance / (standard_deviation ** 2)
+    result[:, 3] = result[:, 2] * distance / standard_deviation
+    return result
+
+
+def gauss_estimate(axis, profile, center_of_mass=None, threshold=ESTIMATE_THRESHOLD):
+    """
+    Closed form estimation of the gaussian parameters.
+    The parabola fitted to the logarithm of the peak (Caruana's algorithm, weighted as proposed by Guo) gives
+    amplitude, center and standard deviation. If the peak cannot be described by a parabola, the estimation
+    falls back to max value, position of max value (or center of mass) and area of the profile.
+    :param axis: Axis of the profile.
+    :param profile: Profile to estimate.
+    :param center_of_mass: If provided, used as center in the fall back estimation.
+    :param threshold: Fraction of the amplitude above which the samples are used in the log-parabola.
+    :return: [offset, amplitude, center, standard_deviation] as float64 array.
+    """
+    axis = numpy.asarray(axis, dtype="float64")
+    profile = numpy.asarray(profile, dtype="float64")
+
+    offset = profile.min()  # Minimum is good estimation of offset
+    index_maximum = profile.argmax()
+    amplitude = profile[index_maximum] - offset
+
+    try:
+        signal = profile - offset
+
+        # Contiguous region around the maximum that is above the threshold.
+        below_threshold = signal <= (amplitude * threshold)
+        left = numpy.flatnonzero(below_threshold[:index_maximum])
+        right = numpy.flatnonzero(below_threshold[index_maximum:])
+        start = (left[-1] + 1) if left.size else 0
+        end = (index_maximum + right[0]) if right.size else profile.size
+
+        if end - start >= 3:
+            # Center the axis on the maximum to keep the system well conditioned.
+            x = axis[start:end] - axis[index_maximum]
+            y = signal[start:end]
+            design = numpy.stack((y, x * y, x * x * y), axis=1)
+            (a, b, c), _, _, _ = numpy.linalg.lstsq(design, numpy.log(y) * y, rcond=None)
+
+            if c < 0:
+                estimation = numpy.array([offset,
+                                          numpy.exp(a - b * b / (4 * c)),
+                                          axis[index_maximum] - b / (2 * c),
+                                          numpy.sqrt(-1 / (2 * c))])
+                if numpy.all(numpy.isfinite(estimation)):
+                    return estimation
+    except Exception as e:
+        _logger.debug("Log-parabola estimation failed: %s" % str(e))
+
+    center = center_of_mass if center_of_mass else axis[index_maximum]
+    # Consider gaussian integral is amplitude * sigma * sqrt(2*pi)
+    standard_deviation = numpy.trapz((profile - offset), x=axis) / (amplitude * numpy.sqrt(2 * numpy.pi))
+    return numpy.array([offset, amplitude, center, standard_deviation], dtype="float64")
+
+
+def gauss_fit_lm(axis, profile, initial_parameters=None, tolerance=None, max_iterations=None):
+    """
+    Levenberg-Marquardt least squares fit of a gaussian, with analytic jacobian and bounded number of iterations.
+    :param axis: Axis of the profile.
+    :param profile: Profile to fit.
+    :param initial_parameters: Initial [offset, amplitude, center, standard_deviation]. If None, gauss_estimate is used.
+    :param tolerance: Relative tolerance on the sum of squares and on the parameters for convergence.
+                      Default: config.GAUSS_FIT_TOLERANCE.
+    :param max_iterations: Maximum number of iterations. Default: config.GAUSS_FIT_MAX_ITERATIONS.
+    :return: (parameters, iterations, converged). If the fit diverges the initial parameters are returned.
+    """
+    tolerance = config.GAUSS_FIT_TOLERANCE if tolerance is None else tolerance
+    max_iterations = config.GAUSS_FIT_MAX_ITERATIONS if max_iterations is None else max_iterations
+
+    x = numpy.asarray(axis, dtype="float64")
+    y = numpy.asarray(profile, dtype="float64")
+    if initial_parameters is None:
+        initial_parameters = gauss_estimate(x, y)
+    initial_parameters = numpy.array(initial_parameters, dtype="float64")
+
+    parameters = initial_parameters
+    model, distance, fac = _evaluate(x, parameters)
+    residuals = y - model
+    chi2 = residuals.dot(residuals)
+    if not numpy.isfinite(chi2):
+        return initial_parameters, 0, False
+
+    damping, damping_factor = _LAMBDA_INITIAL, 2.0
+    iterations = 0
+    converged = False
+    sqrt_tolerance = numpy.sqrt(tolerance)
+
+    while iterations < max_iterations:
+        iterations += 1
+        jacobian = _jacobian(distance, fac, parameters[1], parameters[3])
+        hessian = jacobian.T.dot(jacobian)
+        gradient = jacobian.T.dot(residuals)
+        scale = numpy.maximum(hessian.diagonal(), _LAMBDA_MIN)
+
+        # Increase the damping until the step reduces the sum of squares.
+        while True:
+            try:
+                step = numpy.linalg.solve(hessian + numpy.diag(damping * scale), gradient)
+                predicted_reduction = step.dot(2 * gradient - hessian.dot(step))
+                new_parameters = parameters + step
+                model, new_distance, new_fac = _evaluate(x, new_parameters)
+                new_residuals = y - model
+                new_chi2 = new_residuals.dot(new_residuals)
+            except numpy.linalg.LinAlgError:
+                new_chi2 = numpy.inf
+            if numpy.isfinite(new_chi2) and new_chi2 <= chi2:
+                break
+            damping *= damping_factor
+            damping_factor *= 2
+            if damping > _LAMBDA_MAX:
+                break
+
+        if damping > _LAMBDA_MAX:
+            # No step can reduce the sum of squares: we are at the minimum.
+            converged = True
+            break
+
+        reduction = chi2 - new_chi2
+        parameters, residuals, chi2, distance, fac = new_parameters, new_residuals, new_chi2, new_distance, new_fac
+        # Damping update based on the gain ratio (Nielsen).
+        gain = (reduction / predicted_reduction) if predicted_reduction > 0 else 0.0
+        damping = max(damping * max(1 / 3.0, 1 - (2 * gain - 1) ** 3), _LAMBDA_MIN)
+        damping_factor = 2.0
+
+        if ((reduction <= tolerance * chi2) and (predicted_reduction <= tolerance * chi2)) or \
+                numpy.all(numpy.abs(step) <= sqrt_tolerance * (numpy.abs(parameters) + sqrt_tolerance)):
+            converged = True
+            break
+
+    if not numpy.all(numpy.isfinite(parameters)):
+        return initial_parameters, iterations, False
+
+    return parameters, iterations, converged
+
+
+def _solve(matrices, vectors):
+    # Batched solve: if any of the systems is singular, solve them one by one, setting singular ones to nan.
+    try:
+        return numpy.linalg.solve(matrices, vectors[..., None])[..., 0]
+    except numpy.linalg.LinAlgError:
+        result = numpy.full(vectors.shape, numpy.nan)
+        for i in range(len(matrices)):
+            try:
+                result[i] = numpy.linalg.solve(matrices[i], vectors[i])
+            except numpy.linalg.LinAlgError:
+                pass
+        return result
+
+
+def gauss_estimate_batch(axis, profiles, threshold=ESTIMATE_THRESHOLD):
+    """
+    Vectorized version of gauss_estimate, for a stack of profiles sharing the same axis.
+    :param axis: Axis of the profiles.
+    :param profiles: 2-D array, one profile per row.
+    :param threshold: Fraction of the amplitude above which the samples are used in the log-parabola.
+    :return: Array of shape (len(profiles), 4) with [offset, amplitude, center, standard_deviation] on each row.
+    """
+    axis = numpy.asarray(axis, dtype="float64")
+    profiles = numpy.asarray(profiles, dtype="float64")
+    rows, size = profiles.shape
+    row_indexes = numpy.arange(rows)
+    indexes = numpy.arange(size)
+
+    offset = profiles.min(1)
+    index_maximum = profiles.argmax(1)
+    amplitude = profiles[row_indexes, index_maximum] - offset
+    signal = profiles - offset[:, None]
+
+    # Fall back estimation.
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        standard_deviation = numpy.trapz(signal, x=axis, axis=1) / (amplitude * numpy.sqrt(2 * numpy.pi))
+    estimation = numpy.stack((offset, amplitude, axis[index_maximum], standard_deviation), axis=1)
+
+    # Contiguous region around the maximum that is above the threshold.
+    below_threshold = signal <= (amplitude * threshold)[:, None]
+    start = numpy.where(below_threshold & (indexes < index_maximum[:, None]), indexes, -1).max(1) + 1
+    end = numpy.where(below_threshold & (indexes >= index_maximum[:, None]), indexes, size).min(1)
+    window = (indexes >= start[:, None]) & (indexes < end[:, None])
+
+    # Weighted normal equations of the parabola fitted to the logarithm of the peak (restricted to the used columns).
+    columns = slice(start.min(), max(end.max(), start.min()))
+    window = window[:, columns]
+    x = axis[columns] - axis[index_maximum][:, None]
+    weighted = numpy.where(window, signal[:, columns], 0.0) ** 2
+    log_signal = numpy.log(numpy.where(window, signal[:, columns], 1.0))
+    moments, vectors = [], []
+    for k in range(5):
+        moments.append(weighted.sum(1))
+        if k < 3:
+            vectors.append((weighted * log_signal).sum(1))
+        weighted = weighted * x
+    moments = numpy.stack(moments, axis=1)
+    matrices = numpy.stack([moments[:, 0:3], moments[:, 1:4], moments[:, 2:5]], axis=1)
+    vectors = numpy.stack(vectors, axis=1)
+    valid = (end - start) >= 3
+    if valid.any():
+        a, b, c = _solve(matrices[valid], vectors[valid]).T
+        with numpy.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            parabola = numpy.stack((offset[valid],
+                                    numpy.exp(a - b * b / (4 * c)),
+                                    axis[index_maximum[valid]] - b / (2 * c),
+                                    numpy.sqrt(-1 / (2 * c))), axis=1)
+        good = (c < 0) & numpy.all(numpy.isfinite(parabola), axis=1)
+        estimation[numpy.flatnonzero(valid)[good]] = parabola[good]
+
+    return estimation
+
+
+def gauss_fit_batch(axis, profiles, initial_parameters=None, tolerance=None, max_iterations=None):
+    """
+    Vectorized Levenberg-Marquardt gaussian fit of a stack of profiles sharing the same axis.
+    All the profiles are fitted together: each iteration is a single vectorized step for all the rows that
+    did not converge yet.
+    :param axis: Axis of the profiles.
+    :param profiles: 2-D array, one profile per row.
+    :param initial_parameters: Array of shape (len(profiles), 4). If None, gauss_estimate_batch is used.
+    :param tolerance: Relative tolerance for convergence. Default: config.GAUSS_FIT_TOLERANCE.
+    :param max_iterations: Maximum number of iterations. Default: config.GAUSS_FIT_MAX_ITERATIONS.
+    :return: (parameters, iterations, converged): arrays with one element (a row of 4 in case of parameters)
+             per profile. Rows that diverge get the initial parameters.
+    """
+    tolerance = config.GAUSS_FIT_TOLERANCE if tolerance is None else tolerance
+    max_iterations = config.GAUSS_FIT_MAX_ITERATIONS if max_iterations is None else max_iterations
+
+    x = numpy.asarray(axis, dtype="float64")
+    y = numpy.asarray(profiles, dtype="float64")
+    if y.ndim != 2 or y.shape[1] != x.shape[0]:
+        raise RuntimeError("Invalid profiles shape %s for axis of size %d" % (str(y.shape), x.shape[0]))
+    rows = y.shape[0]
+
+    if initial_parameters is None:
+        initial_parameters = gauss_estimate_batch(x, y)
+    initial_parameters = numpy.array(initial_parameters, dtype="float64").reshape(rows, 4)
+
+    def evaluate(parameters, y):
+        offset, amplitude, center, standard_deviation = [p[:, None] for p in parameters.T]
+        distance = x - center
+        fac = numpy.exp(-distance ** 2 / (2 * standard_deviation ** 2))
+        residuals = y - (offset + amplitude * fac)
+        return residuals, numpy.einsum("ij,ij->i", residuals, residuals), distance, fac
+
+    parameters = initial_parameters.copy()
+    with numpy.errstate(all="ignore"):
+        residuals, chi2, distance, fac = evaluate(parameters, y)
+    iterations = numpy.zeros(rows, dtype="int64")
+    converged = numpy.zeros(rows, dtype="bool")
+    damping = numpy.full(rows, _LAMBDA_INITIAL)
+    damping_factor = numpy.full(rows, 2.0)
+    active = numpy.isfinite(chi2)
+    identity = numpy.eye(4)
+    sqrt_tolerance = numpy.sqrt(tolerance)
+
+    for _ in range(max_iterations):
+        rows_active = numpy.flatnonzero(active)
+        if rows_active.size == 0:
+            break
+        iterations[rows_active] += 1
+
+        amplitude, standard_deviation = parameters[rows_active, 1, None], parameters[rows_active, 3, None]
+        active_distance = distance[rows_active]
+        # Transposed jacobian: (rows, 4, size).
+        jacobian = numpy.empty((rows_active.size, 4, x.size))
+        jacobian[:, 0] = 1.0
+        jacobian[:, 1] = fac[rows_active]
+        numpy.multiply(jacobian[:, 1], active_distance * (amplitude / standard_deviation ** 2), out=jacobian[:, 2])
+        numpy.multiply(jacobian[:, 2], active_distance / standard_deviation, out=jacobian[:, 3])
+        hessian = numpy.matmul(jacobian, jacobian.transpose(0, 2, 1))
+        gradient = numpy.matmul(jacobian, residuals[rows_active, :, None])[:, :, 0]
+        scale = numpy.maximum(numpy.diagonal(hessian, axis1=1, axis2=2), _LAMBDA_MIN)
+
+        # Increase the damping of each row until its step reduces the sum of squares.
+        pending = numpy.arange(rows_active.size)
+        while pending.size:
+            rows_pending = rows_active[pending]
+            with numpy.errstate(all="ignore"):
+                step = _solve(hessian[pending] + identity * (damping[rows_pending, None] * scale[pending])[:, None, :],
+                              gradient[pending])
+                predicted_reduction = numpy.einsum("ij,ij->i", step, 2 * gradient[pending] -
+                                                   numpy.matmul(hessian[pending], step[:, :, None])[:, :, 0])
+                new_parameters = parameters[rows_pending] + step
+                new_residuals, new_chi2, new_distance, new_fac = evaluate(new_parameters, y[rows_pending])
+            accepted = numpy.isfinite(new_chi2) & (new_chi2 <= chi2[rows_pending])
+
+            rows_accepted = rows_pending[accepted]
+            reduction = chi2[rows_accepted] - new_chi2[accepted]
+            predicted_reduction = predicted_reduction[accepted]
+            parameters[rows_accepted] = new_parameters[accepted]
+            residuals[rows_accepted] = new_residuals[accepted]
+            chi2[rows_accepted] = new_chi2[accepted]
+            distance[rows_accepted] = new_distance[accepted]
+            fac[rows_accepted] = new_fac[accepted]
+            # Damping update based on the gain ratio (Nielsen).
+            with numpy.errstate(all="ignore"):
+                gain = numpy.where(predicted_reduction > 0, reduction / predicted_reduction, 0.0)
+            damping[rows_accepted] = numpy.maximum(damping[rows_accepted] *
+                                                   numpy.maximum(1 / 3.0, 1 - (2 * gain - 1) ** 3), _LAMBDA_MIN)
+            damping_factor[rows_accepted] = 2.0
+
+            small_step = numpy.all(numpy.abs(step[accepted]) <= sqrt_tolerance *
+                                   (numpy.abs(parameters[rows_accepted]) + sqrt_tolerance), axis=1)
+            converged[rows_accepted] = ((reduction <= tolerance * chi2[rows_accepted]) &
+                                        (predicted_reduction <= tolerance * chi2[rows_accepted])) | small_step
+
+            rows_rejected = rows_pending[~accepted]
+            damping[rows_rejected] *= damping_factor[rows_rejected]
+            damping_factor[rows_rejected] *= 2
+            # No step can reduce the sum of squares: these rows are at the minimum.
+            at_minimum = damping[rows_rejected] > _LAMBDA_MAX
+            converged[rows_rejected[at_minimum]] = True
+            pending = pending[~accepted][~at_minimum]
+
+        active &= ~converged
+
+    diverged = ~numpy.all(numpy.isfinite(parameters), axis=1)
+    parameters[diverged] = initial_parameters[diverged]
+    converged[diverged] = False
+
+    return parameters, iterations, converged
+
+
+class GaussFitState(object):
+    """
+    Keeps the parameters of the last fits of a pipeline processing thread, so that the next frame can be fitted
+    starting from them (warm start) instead of from gauss_estimate, which is then not computed. Beam parameters change
+    little from pulse to pulse, so the warm started fit needs fewer iterations, mainly on noisy profiles where the
+    estimation is poor.
+    The previous parameters are discarded (cold start) if they do not describe the new profile: the rms of the
+    residuals exceeds the one of the previous fit by more than max_residual (relative), or if the warm started fit
+    does not converge within max_iterations or jumps too far from them (center moving by more than max_jump standard
+    deviations, or standard deviation changing by more than max_jump relative).
+    """
+
+    def __init__(self, max_residual=None, max_jump=None, max_iterations=None):
+        self.max_residual = config.GAUSS_FIT_WARM_START_MAX_RESIDUAL if max_residual is None else max_residual
+        self.max_jump = config.GAUSS_FIT_WARM_START_MAX_JUMP if max_jump is None else max_jump
+        self.max_iterations = config.GAUSS_FIT_WARM_START_MAX_ITERATIONS if max_iterations is None else max_iterations
+        self.parameters = {}
+        self.mean_square_residuals = {}
+        self.iterations = {}
+        self.warm_starts = 0
+        self.cold_starts = 0
+
+    def reset(self):
+        self.parameters = {}
+        self.mean_square_residuals = {}
+        self.iterations = {}
+
+    @staticmethod
+    def _get_chi2(axis, profile, parameters):
+        model, _, _ = _evaluate(axis, parameters)
+        residuals = profile - model
+        return residuals.dot(residuals)
+
+    def _is_jump(self, parameters, previous):
+        standard_deviation = abs(previous[3])
+        return (abs(parameters[2] - previous[2]) > self.max_jump * standard_deviation) or \
+               (abs(abs(parameters[3]) - standard_deviation) > self.max_jump * standard_deviation)
+
+    def fit(self, name, axis, profile, center_of_mass=None):
+        """
+        Fit the profile, starting from the last parameters fitted with the same name if still valid.
+        :param name: Identifier of the fit (e.g. "x", "gr_y").
+        :param axis: Axis of the profile.
+        :param profile: Profile to fit.
+        :param center_of_mass: If provided, used as center in the fall back estimation of a cold start.
+        :return: [offset, amplitude, center, standard_deviation]. The total number of iterations is stored in
+                 self.iterations[name].
+        """
+        x = numpy.asarray(axis, dtype="float64")
+        y = numpy.asarray(profile, dtype="float64")
+        previous = self.parameters.get(name)
+        iterations = 0
+
+        if (previous is not None) and (previous[3] != 0):
+            with numpy.errstate(all="ignore"):
+                chi2 = self._get_chi2(x, y, previous)
+                valid = chi2 / y.size <= self.mean_square_residuals[name] * (1 + self.max_residual) ** 2
+            if valid:
+                parameters, iterations, converged = gauss_fit_lm(x, y, previous, max_iterations=self.max_iterations)
+                if converged and not self._is_jump(parameters, previous):
+                    self.warm_starts += 1
+                    self._set(name, x, y, parameters, iterations)
+                    return parameters
+
+        self.cold_starts += 1
+        initial_parameters = gauss_estimate(x, y, center_of_mass)
+        try:
+            parameters, cold_iterations, converged = gauss_fit_lm(x, y, initial_parameters)
+            iterations += cold_iterations
+        except Exception as e:
+            _logger.debug("Gaussian fit failed: %s" % str(e))
+            parameters, converged = initial_parameters, False
+
+        # Only converged fits are used as starting point of the next frame.
+        if converged:
+            self._set(name, x, y, parameters, iterations)
+        else:
+            self.parameters.pop(name, None)
+            self.iterations[name] = iterations
+        return parameters
+
+    def _set(self, name, axis, profile, parameters, iterations):
+        self.parameters[name] = parameters
+        self.mean_square_residuals[name] = self._get_chi2(axis, profile, parameters) / profile.size
+        self.iterations[name] = iterations
@@ -1,20 +1,182 @@
 import io
+import mmap
+import struct
+import sys
+import zlib
 from logging import getLogger
+from threading import Lock
 
 import numpy
-import scipy
-import scipy.misc
-import scipy.optimize
-import scipy.ndimage
-from PIL import Image
-
-from matplotlib import cm
 
 from cam_server import config
+from cam_server.lazy_import import lazy_import, lazy_jit
+from cam_server.pipeline.data_processing import fitting
+
+# Imported on first use: most pipelines do not rotate, fit with scipy or render images.
+scipy = lazy_import("scipy", ("ndimage", "optimize", "special"))
+Image = lazy_import("PIL.Image")
+cm = lazy_import("matplotlib.cm")
+numba = lazy_import("numba")
 
 _logging = getLogger(__name__)
 
 
+class BufferPool(object):
+    """
+    Pool of page aligned work buffers, reused across frames so that the pre-processing does not allocate memory on
+    every frame. A buffer is only handed out again when nothing else references it (neither the buffer itself nor
+    a view of it): images still being processed or sent are never overwritten.
+    """
+
+    # Reference counts of a free buffer: pool entry and base of the aligned array (raw), pool entry (array),
+    # plus the argument of sys.getrefcount.
+    _FREE_RAW_REFERENCES = 3
+    _FREE_ARRAY_REFERENCES = 2
+
+    def __init__(self, max_buffers=None):
+        """
+        :param max_buffers: Maximum number of buffers of each shape and type. If all of them are in use, new
+                            (not pooled) arrays are allocated. Default: config.PIPELINE_BUFFER_POOL_SIZE.
+        """
+        self.max_buffers = config.PIPELINE_BUFFER_POOL_SIZE if max_buffers is None else max_buffers
+        self.buffers = {}
+        self.allocations = 0
+        self.lock = Lock()
+
+    def get(self, shape, dtype):
+        """
+        :return: Free buffer with the given shape and type. The content is undefined.
+        """
+        dtype = numpy.dtype(dtype)
+        key = (tuple(shape), dtype.str)
+        with self.lock:
+            entries = self.buffers.setdefault(key, [])
+            for entry in entries:
+                if (sys.getrefcount(entry[0]) <= BufferPool._FREE_RAW_REFERENCES) and \
+                        (sys.getrefcount(entry[1]) <= BufferPool._FREE_ARRAY_REFERENCES):
+                    return entry[1]
+
+            self.allocations += 1
+            size = int(numpy.prod(shape)) * dtype.itemsize
+            raw = numpy.empty(size + mmap.PAGESIZE, dtype="uint8")
+            offset = (-raw.ctypes.data) % mmap.PAGESIZE
+            array = raw[offset:offset + size].view(dtype).reshape(shape)
+            if len(entries) < self.max_buffers:
+                entries.append((raw, array))
+            return array
+
+    def clear(self):
+        with self.lock:
+            self.buffers = {}
+
+
+class ImageAverager(object):
+    """
+    Average of the last images, updated in constant time per frame: the newest frame is added to a running sum and
+    the oldest, kept in a preallocated ring buffer, is subtracted. Alternatively an exponential moving average.
+    A frame with a different shape or type than the previous ones restarts the average.
+    """
+
+    def __init__(self, size, continuous=False, exponential=False):
+        """
+        :param size: Number of averaged images.
+        :param continuous: If True generates an output for every frame, averaging the last images. Otherwise one
+                           output every size frames.
+        :param exponential: If True calculates the exponential moving average, with smoothing factor 2/(size+1).
+                            Outputs are always continuous.
+        """
+        self.size = max(int(size), 1)
+        self.continuous = continuous or exponential
+        self.exponential = exponential
+        self.reset()
+
+    def reset(self):
+        self.ring = None
+        self.accumulator = None
+        self.count = 0
+        self.index = 0
+        self.updates = 0
+
+    def _get_accumulator_dtype(self, dtype):
+        if dtype.kind in "iu" and dtype.itemsize <= 2 and (self.size << (8 * dtype.itemsize)) <= (1 << 31):
+            # Exact and small: the sum of the images cannot overflow.
+            return numpy.dtype("uint32" if dtype.kind == "u" else "int32")
+        if dtype.kind in "biu":
+            return get_sum_dtype(numpy.zeros(1, dtype=dtype))
+        return numpy.dtype("float64")
+
+    def _start(self, image):
+        self.reset()
+        if self.exponential:
+            self.accumulator = image.astype("float64")
+        else:
+            self.accumulator = numpy.zeros(image.shape, dtype=self._get_accumulator_dtype(image.dtype))
+            if self.continuous:
+                self.ring = numpy.empty((self.size,) + image.shape, dtype=image.dtype)
+
+    def add(self, image, buffer_pool=None):
+        """
+        :param image: New frame. It is not referenced after the call (its contents are copied if needed).
+        :param buffer_pool: If provided (BufferPool), the output is created in a buffer of the pool.
+        :return: Average image (float64), or None if the average is not yet complete (non-continuous mode).
+        """
+        accumulator = self.accumulator
+        if (accumulator is None) or (image.shape != accumulator.shape) or \
+                ((self.ring is not None) and (image.dtype != self.ring.dtype)):
+            self._start(image)
+            accumulator = self.accumulator
+            if self.exponential:
+                self.count = 1
+                return self._get_output(accumulator, 1, buffer_pool)
+
+        if self.exponential:
+            alpha = 2.0 / (self.size + 1)
+            # accumulator += alpha * (image - accumulator)
+            difference = numpy.subtract(image, accumulator, out=self._get_buffer(accumulator, buffer_pool))
+            numpy.multiply(difference, alpha, out=difference)
+            numpy.add(accumulator, difference, out=accumulator)
+            self.count = min(self.count + 1, self.size)
+            return self._get_output(accumulator, 1, buffer_pool)
+
+        numpy.add(accumulator, image, out=accumulator, casting="unsafe")
+        if self.ring is None:
+            self.count += 1
+            if self.count < self.size:
+                return None
+            output = self._get_output(accumulator, self.count, buffer_pool)
+            accumulator.fill(0)
+            self.count = 0
+            return output
+
+        ring = self.ring
+        if self.count == self.size:
+            numpy.subtract(accumulator, ring[self.index], out=accumulator, casting="unsafe")
+        else:
+            self.count += 1
+        numpy.copyto(ring[self.index], image)
+        self.index = (self.index + 1) % self.size
+
+        if accumulator.dtype.kind == "f":
+            # Bound the rounding errors of the running sum: recalculate it once per window.
+            self.updates += 1
+            if self.updates >= self.size:
+                self.updates = 0
+                numpy.sum(ring[:self.count], axis=0, dtype=accumulator.dtype, out=accumulator)
+        return self._get_output(accumulator, self.count, buffer_pool)
+
+    @staticmethod
+    def _get_buffer(accumulator, buffer_pool):
+        if buffer_pool is None:
+            return numpy.empty(accumulator.shape, dtype="float64")
+        return buffer_pool.get(accumulator.shape, "float64")
+
+    @staticmethod
+    def _get_output(accumulator, count, buffer_pool):
+        output = ImageAverager._get_buffer(accumulator, buffer_pool)
+        numpy.true_divide(accumulator, count, out=output)
+        return output
+
+
 def subtract_background(image, background_image):
     # We do not want negative numbers int the image.
     if background_image is not None:
@@ -22,17 +184,30 @@ def subtract_background(image, background_image):
             raise RuntimeError("Invalid background_image size %s compared to image %s" % (background_image.shape,
                                                                                           image.shape))
 
-        mask_for_zeros = (background_image > image)
-        numpy.subtract(image, background_image, image)
-        image[mask_for_zeros] = 0
+        if image.dtype == background_image.dtype:
+            # Saturating subtraction in place: pixels below the background become 0.
+            numpy.maximum(image, background_image, out=image)
+            numpy.subtract(image, background_image, out=image)
+        else:
+            mask_for_zeros = (background_image > image)
+            numpy.subtract(image, background_image, image)
+            image[mask_for_zeros] = 0
     return image
 
-def subtract_background_signed(image, background_image):
+def subtract_background_signed(image, background_image, buffer_pool=None):
     # We do not want negative numbers int the image.
-    image = image.astype("int32")
+    if buffer_pool is None:
+        image = image.astype("int32")
+        if background_image is not None:
+            numpy.subtract(image, background_image, image)
+        return image
+
+    output = buffer_pool.get(image.shape, "int32")
     if background_image is not None:
-        numpy.subtract(image, background_image, image)
-    return image
+        numpy.subtract(image, background_image, out=output, dtype="int32")
+    else:
+        numpy.copyto(output, image, casting="unsafe")
+    return output
 
 
 def is_number(var):
@@ -43,22 +218,194 @@ def is_number(var):
         return False
 
 
-def rotate(image, degrees, order = 1, mode = "0.0"):
+def rotate(image, degrees, order = 1, mode = "0.0", buffer_pool=None):
     if mode == "ortho":
         output = numpy.rot90(image, int(degrees/90))
     else:
-        output = chunk_copy(image)
+        output = chunk_copy(image) if buffer_pool is None else buffer_pool.get(image.shape, image.dtype)
         scipy.ndimage.rotate(image, float(degrees), reshape=False, output=output, order=order,
                              mode="constant" if is_number(mode) else mode,
                              cval=float(mode) if is_number(mode)  else 0.0, prefilter=True)
     return output
 
+def get_rotation_transform(shape, degrees):
+    """
+    Affine transform of scipy.ndimage.rotate (without reshape): input coordinates = matrix . output + offset.
+    :param shape: Image shape.
+    :param degrees: Rotation angle.
+    :return: (matrix, offset)
+    """
+    c, s = scipy.special.cosdg(float(degrees)), scipy.special.sindg(float(degrees))
+    matrix = numpy.array([[c, s], [-s, c]])
+    center = (numpy.asarray(shape, dtype=float) - 1) / 2
+    offset = center - matrix @ center
+    return matrix, offset
+
+
+def rotate_region(image, matrix, offset, output_shape, order=1, mode="0.0", buffer_pool=None):
+    """
+    Rotates an image with a transform from get_rotation_transform, calculating only an output region.
+    :param matrix: Transform matrix.
+    :param offset: Transform offset, translated to the region origin and to the image origin.
+    :param output_shape: Shape of the output region.
+    """
+    if buffer_pool is None:
+        output = numpy.empty(output_shape, dtype=image.dtype)
+    else:
+        output = buffer_pool.get(output_shape, image.dtype)
+    scipy.ndimage.affine_transform(image, matrix, offset, output_shape, output, order=order,
+                                   mode="constant" if is_number(mode) else mode,
+                                   cval=float(mode) if is_number(mode) else 0.0, prefilter=True)
+    return output
+
+
+class ResamplingMap(object):
+    """
+    Source coordinates and interpolation weights of an affine transform (rotation) for a fixed input shape, computed
+    once and applied to every frame with a gather. Gives the same result as scipy.ndimage.affine_transform for
+    nearest (order 0) and bilinear (order 1) interpolation.
+    """
+
+    MODES = ("constant", "nearest", "reflect", "mirror")
+
+    @staticmethod
+    def is_supported(order, mode):
+        return (order in (0, 1)) and (is_number(mode) or (mode in ResamplingMap.MODES))
+
+    def __init__(self, input_shape, output_shape, matrix, offset, order=1, mode="0.0"):
+        """
+        :param input_shape: Shape of the images to be resampled.
+        :param output_shape: Shape of the output.
+        :param matrix: Transform matrix (input coordinates = matrix . output + offset).
+        :param offset: Transform offset.
+        :param order: Interpolation order: 0 or 1.
+        :param mode: Boundary mode (scipy.ndimage names) or the constant value outside the input (as mode "constant").
+        """
+        if not ResamplingMap.is_supported(order, mode):
+            raise ValueError("Resampling not supported for order %s and mode %s" % (order, mode))
+        self.input_shape = tuple(input_shape)
+        self.output_shape = tuple(output_shape)
+        self.order = order
+        self.cval = float(mode) if is_number(mode) else 0.0
+        mode = "constant" if is_number(mode) else mode
+
+        height, width = self.input_shape
+        output_y, output_x = numpy.arange(output_shape[0])[:, None], numpy.arange(output_shape[1])[None, :]
+        invalid = numpy.zeros(output_shape, dtype=bool)
+        indexes = []
+        fractions = []
+        for coordinate, size in ((matrix[0, 0] * output_y + matrix[0, 1] * output_x + offset[0], height),
+                                 (matrix[1, 0] * output_y + matrix[1, 1] * output_x + offset[1], width)):
+            coordinate = self._fold(coordinate, size, mode, invalid)
+            if order == 0:
+                # Same rounding as scipy.ndimage (half up).
+                indexes.append(numpy.floor(coordinate + 0.5).astype("int32").ravel())
+            else:
+                index = numpy.minimum(numpy.floor(coordinate), max(size - 2, 0)).astype("int32")
+                indexes.append(index.ravel())
+                fractions.append((coordinate - index).astype("float32").ravel())
+        self.invalid = invalid.ravel() if invalid.any() else None
+        if self.invalid is not None:
+            indexes[0][self.invalid] = -1
+            indexes[1][self.invalid] = 0
+        # Row and column (instead of flat) indexes: images do not need to be contiguous.
+        self.rows, self.columns = indexes
+        self.fractions = numpy.stack(fractions) if order == 1 else None
+        # Offsets of the interpolation neighbours (none along an axis of size 1).
+        self.x_step, self.y_step = int(width > 1), int(height > 1)
+
+    @staticmethod
+    def _fold(coordinate, size, mode, invalid):
+        # Maps coordinates outside of the input into [0, size-1], as the scipy.ndimage boundary modes do.
+        coordinate = numpy.broadcast_to(coordinate, invalid.shape).astype(float)
+        if mode == "constant":
+            invalid |= (coordinate < 0) | (coordinate > size - 1)
+        elif mode == "reflect":
+            coordinate = numpy.mod(coordinate + 0.5, 2 * size) - 0.5
+            coordinate = numpy.where(coordinate > size - 0.5, 2 * size - 1 - coordinate, coordinate)
+        elif mode == "mirror" and size > 1:
+            coordinate = numpy.mod(coordinate, 2 * size - 2)
+            coordinate = numpy.where(coordinate > size - 1, 2 * size - 2 - coordinate, coordinate)
+        return numpy.clip(coordinate, 0, size - 1)
+
+    def resample(self, image, buffer_pool=None):
+        """
+        :param image: Image of the map input shape.
+        :param buffer_pool: If provided (BufferPool), the output is created in a buffer of the pool.
+        :return: Resampled image, with the type of the input.
+        """
+        if image.shape != self.input_shape:
+            raise ValueError("Invalid image shape %s for resampling map of shape %s" % (image.shape,
+                                                                                         self.input_shape))
+        if buffer_pool is None:
+            output = numpy.empty(self.output_shape, dtype=image.dtype)
+        else:
+            output = buffer_pool.get(self.output_shape, image.dtype)
+        cval = image.dtype.type(self.cval) if image.dtype.kind in "iu" else self.cval
+
+        if (numba is not None) and output.size > 0:
+            if self.order == 0:
+                _resample_nearest_kernel(image, self.rows, self.columns, cval, output.reshape(-1))
+            else:
+                _resample_kernel(image, self.rows, self.columns, self.fractions, self.x_step, self.y_step, cval,
+                                 image.dtype.kind in "iu", output.reshape(-1))
+            return output
+
+        rows = self.rows if self.invalid is None else numpy.maximum(self.rows, 0)
+        if self.order == 0:
+            output.reshape(-1)[:] = image[rows, self.columns]
+        else:
+            columns = self.columns
+            fy, fx = self.fractions
+            top = image[rows, columns] * (1 - fx) + image[rows, columns + self.x_step] * fx
+            rows = rows + self.y_step
+            bottom = image[rows, columns] * (1 - fx) + image[rows, columns + self.x_step] * fx
+            value = top * (1 - fy) + bottom * fy
+            if image.dtype.kind in "iu":
+                # Same rounding as scipy.ndimage (half away from zero).
+                value = numpy.copysign(numpy.floor(numpy.abs(value) + 0.5), value)
+            numpy.copyto(output.reshape(-1), value, casting="unsafe")
+        if self.invalid is not None:
+            numpy.copyto(output.reshape(-1), cval, where=self.invalid)
+        return output
+
+
+if numba:
+    @lazy_jit(nogil=True)
+    def _resample_kernel(image, rows, columns, fractions, x_step, y_step, cval, round_output, output):
+        for i in range(output.shape[0]):
+            y = rows[i]
+            if y < 0:
+                output[i] = cval
+                continue
+            x = columns[i]
+            fy = fractions[0, i]
+            fx = fractions[1, i]
+            top = image[y, x] * (1.0 - fx) + image[y, x + x_step] * fx
+            bottom = image[y + y_step, x] * (1.0 - fx) + image[y + y_step, x + x_step] * fx
+            value = top * (1.0 - fy) + bottom * fy
+            if round_output:
+                value = numpy.floor(value + 0.5) if value >= 0 else -numpy.floor(0.5 - value)
+            output[i] = value
+
+    @lazy_jit(nogil=True)
+    def _resample_nearest_kernel(image, rows, columns, cval, output):
+        for i in range(output.shape[0]):
+            y = rows[i]
+            output[i] = cval if y < 0 else image[y, columns[i]]
+
+
 def get_region_of_interest(image, offset_x, size_x, offset_y, size_y):
     return image[offset_y:offset_y + size_y, offset_x:offset_x + size_x]
 
 
-def apply_threshold(image, threshold=1):
-    image[image < int(threshold)] = 0
+def apply_threshold(image, threshold=1, buffer_pool=None):
+    if buffer_pool is None:
+        image[image < int(threshold)] = 0
+    else:
+        mask = buffer_pool.get(image.shape, "bool")
+        numpy.less(image, int(threshold), out=mask)
+        numpy.copyto(image, 0, where=mask)
 
 
 def get_min_max(image):
@@ -75,6 +422,90 @@ def get_intensity(profile):
     return profile.sum()
 
 
+def get_sum_dtype(image):
+    # Accumulator type of numpy sum (e.g. uint64 for uint16 images).
+    return numpy.add.reduce(numpy.zeros(1, dtype=image.dtype)).dtype
+
+
+def get_integral_image(image):
+    """
+    Summed-area table of the image: integral_image[i, j] is the sum of image[:i, :j].
+    """
+    dtype = "float64" if image.dtype.kind == "f" else get_sum_dtype(image)
+    integral_image = numpy.zeros((image.shape[0] + 1, image.shape[1] + 1), dtype=dtype)
+    numpy.cumsum(image, axis=0, dtype=dtype, out=integral_image[1:, 1:])
+    numpy.cumsum(integral_image[1:, 1:], axis=1, out=integral_image[1:, 1:])
+    return integral_image
+
+
+def get_roi_statistics(integral_image, roi, x_axis, y_axis):
+    """
+    Statistics of a region of interest, calculated out of the integral image in O(ROI perimeter).
+    :param roi: [offset_x, size_x, offset_y, size_y], limited to the image size.
+    :return: intensity, x_profile, y_profile, x_center_of_mass, y_center_of_mass
+    """
+    height, width = integral_image.shape[0] - 1, integral_image.shape[1] - 1
+    offset_x, size_x, offset_y, size_y = roi
+    start_x, start_y = min(max(0, offset_x), width), min(max(0, offset_y), height)
+    end_x, end_y = min(max(start_x, offset_x + size_x), width), min(max(start_y, offset_y + size_y), height)
+
+    # Sums of the columns and rows of the ROI up to each index.
+    columns = integral_image[end_y, start_x:end_x + 1] - integral_image[start_y, start_x:end_x + 1]
+    rows = integral_image[start_y:end_y + 1, end_x] - integral_image[start_y:end_y + 1, start_x]
+    x_profile = numpy.diff(columns)
+    y_profile = numpy.diff(rows)
+    intensity = columns[-1] - columns[0]
+
+    if intensity:
+        x_center_of_mass = (x_axis[start_x:end_x] * x_profile).sum() / intensity
+        y_center_of_mass = (y_axis[start_y:end_y] * y_profile).sum() / intensity
+    else:
+        x_center_of_mass, y_center_of_mass = None, None
+
+    return intensity, x_profile, y_profile, x_center_of_mass, y_center_of_mass
+
+
+if numba:
+    @lazy_jit(nogil=True)
+    def _image_statistics_kernel(image, x_profile, y_profile):
+        # Single pass over the image, row by row: the x profile accumulator stays in cache.
+        min_value = image[0, 0]
+        max_value = image[0, 0]
+        for i in range(image.shape[0]):
+            row_sum = y_profile[i]
+            for j in range(image.shape[1]):
+                value = image[i, j]
+                if value < min_value:
+                    min_value = value
+                if value > max_value:
+                    max_value = value
+                row_sum += value
+                x_profile[j] += value
+            y_profile[i] = row_sum
+        return min_value, max_value
+
+
+def get_image_statistics(image):
+    """
+    Min, max, profiles and intensity of the image, as given by get_min_max, get_x_y_profile and get_intensity.
+    For integer images, if numba is available, they are calculated by a compiled kernel in a single pass.
+    :return: min_value, max_value, x_profile, y_profile, intensity
+    """
+    if (numba is not None) and (image.dtype.kind in "iu") and (image.ndim == 2) and (image.size > 0):
+        x_profile = numpy.zeros(image.shape[1], dtype=get_sum_dtype(image))
+        y_profile = numpy.zeros(image.shape[0], dtype=get_sum_dtype(image))
+        min_value, max_value = _image_statistics_kernel(image, x_profile, y_profile)
+        return image.dtype.type(min_value), image.dtype.type(max_value), x_profile, y_profile, x_profile.sum()
+
+    if image.dtype.kind in "iu":
+        # No NaNs in integer images.
+        min_value, max_value = image.min(), image.max()
+    else:
+        min_value, max_value = get_min_max(image)
+    x_profile, y_profile = get_x_y_profile(image)
+    return min_value, max_value, x_profile, y_profile, get_intensity(x_profile)
+
+
 def find_index(axis, item):
     """ Find the index of the axis value that corresponds to the passed value/item"""
 
@@ -120,18 +551,13 @@ def get_good_region_profile(profile, threshold=0.3, gfscale=1.8):
     # The center of the good region is defined by the index of the max value of the profile
     index_maximum = profile.argmax()
 
-    index_start = index_maximum
-    index_end = index_maximum
+    # First samples below the threshold on each side of the maximum (index 0 is not considered on the left side).
+    below_threshold = profile < threshold_value
+    left = numpy.flatnonzero(below_threshold[1:index_maximum + 1])
+    right = numpy.flatnonzero(below_threshold[index_maximum:])
 
-    for i in range(index_maximum, 0, -1):
-        if profile[i] < threshold_value:
-            index_start = i
-            break
-
-    for i in range(index_maximum, profile.shape[0]):
-        if profile[i] < threshold_value:
-            index_end = i
-            break
+    index_start = (left[-1] + 1) if left.size else index_maximum
+    index_end = (index_maximum + right[0]) if right.size else index_maximum
 
     # Extend the good region based on gfscale
     gf_extend = (index_end - index_start) * gfscale - (index_end - index_start)
@@ -145,7 +571,10 @@ def get_good_region_profile(profile, threshold=0.3, gfscale=1.8):
     return int(index_start), int(index_end)  # Start and end index of the good region
 
 
-def gauss_fit(profile, axis):
+def gauss_fit(profile, axis, fit_state=None, fit_name=None):
+    """
+    :param fit_state: Optional fitting.GaussFitState: the fit is warm started from the previous one with same fit_name.
+    """
     if axis.shape[0] != profile.shape[0]:
         raise RuntimeError("Invalid axis passed %d %d" % (axis.shape[0], profile.shape[0]))
 
@@ -153,7 +582,10 @@ def gauss_fit(profile, axis):
     center_of_mass_2 = (axis * axis * profile).sum() / profile.sum()
     rms = numpy.sqrt(numpy.abs(center_of_mass_2 - center_of_mass * center_of_mass))
 
-    offset, amplitude, center, standard_deviation = _gauss_fit(axis, profile)
+    if fit_state is not None:
+        offset, amplitude, center, standard_deviation = fit_state.fit(fit_name, axis, profile)
+    else:
+        offset, amplitude, center, standard_deviation = _gauss_fit(axis, profile)
     gauss_function = _gauss_function(axis, offset, amplitude, center, standard_deviation)
 
     return gauss_function, offset, amplitude, center, abs(standard_deviation), center_of_mass, rms
@@ -164,6 +596,21 @@ def _gauss_function(x, offset, amplitude, center, standard_deviation):
     return offset + amplitude * numpy.exp(-(x - center) ** 2 / (2 * standard_deviation ** 2))
 
 def _gauss_fit(axis, profile, center_of_mass=None):
+    initial_parameters = fitting.gauss_estimate(axis, profile, center_of_mass)
+    try:
+        optimal_parameter, _, _ = fitting.gauss_fit_lm(axis, profile, initial_parameters)
+    except BaseException as e:
+        # Make sure return always as same type
+        optimal_parameter = initial_parameters
+
+    return optimal_parameter
+
+
+def _gauss_fit_curve_fit(axis, profile, center_of_mass=None):
+    """
+    Former implementation of _gauss_fit, based on scipy.optimize.curve_fit with numerical derivatives.
+    Kept for compatibility and as reference for fitting.gauss_fit_lm.
+    """
 
     offset = profile.min()  # Minimum is good estimation of offset
     amplitude = profile.max() - offset  # Max value is a good estimation of amplitude
@@ -265,6 +712,29 @@ def calculate_slices(axis, center, standard_deviation, scaling=2, number_of_slic
     return list_slices_indexes, n_pixel_half_slice, slice_length
 
 
+def _get_slice_profiles(image, list_slices, vertical):
+    """
+    Profiles and intensities of the contiguous slices delimited by list_slices, summed in a single pass over the
+    sliced part of the image.
+    :param vertical: If True slices are ranges of rows, otherwise ranges of columns.
+    """
+    size = image.shape[0] if vertical else image.shape[1]
+    # Slices must be within the image (good region).
+    boundaries = [index for index in list_slices if index < size]
+    if len(boundaries) < 2:
+        return None, None
+    if len(boundaries) < len(list_slices):
+        _logging.info('Drop slice')
+
+    start = boundaries[0]
+    indexes = numpy.array(boundaries[:-1]) - start
+    if vertical:
+        profiles = numpy.add.reduceat(image[start:boundaries[-1], :], indexes, axis=0, dtype=get_sum_dtype(image))
+    else:
+        profiles = numpy.add.reduceat(image[:, start:boundaries[-1]], indexes, axis=1, dtype=get_sum_dtype(image)).T
+    return profiles, profiles.sum(1)
+
+
 def get_x_slices_data(image, x_axis, y_axis, x_center, x_standard_deviation, scaling=2, number_of_slices=11):
     """
     Calculate slices and their statistics
@@ -276,21 +746,15 @@ def get_x_slices_data(image, x_axis, y_axis, x_center, x_standard_deviation, sca
 
     slice_data = []
 
-    for i in range(len(list_slices) - 1):
-        if list_slices[i] < image.shape[-1] and list_slices[i + 1] < image.shape[-1]:
-            # slices are within good region
-            slice_n = image[:, list_slices[i]:list_slices[i + 1]]
-
-            slice_y_profile = slice_n.sum(1)
-            pixel_intensity = slice_n.sum()
-
-            # Does x need to be the middle of slice? - currently it is
-            center_x = x_axis[list_slices[i] + n_pixel_half_slice]
-
-            gauss_function, offset, amplitude, center_y, standard_deviation, _, _ = gauss_fit(slice_y_profile, y_axis)
-            slice_data.append(([center_x, center_y], standard_deviation, pixel_intensity))
-        else:
-            _logging.info('Drop slice')
+    slice_profiles, slice_intensities = _get_slice_profiles(image, list_slices, vertical=False)
+    if slice_profiles is not None:
+        # Does x need to be the middle of slice? - currently it is
+        slice_centers_x = x_axis[numpy.array(list_slices[:len(slice_profiles)]) + n_pixel_half_slice]
+        # Fit all the slices at once.
+        parameters, _, _ = fitting.gauss_fit_batch(y_axis, slice_profiles)
+        for center_x, (_, _, center_y, standard_deviation), pixel_intensity in \
+                zip(slice_centers_x, parameters, slice_intensities):
+            slice_data.append(([center_x, center_y], abs(standard_deviation), pixel_intensity))
 
     return slice_data, slice_length
 
@@ -306,21 +770,15 @@ def get_y_slices_data(image, x_axis, y_axis, y_center, y_standard_deviation, sca
 
     slice_data = []
 
-    for i in range(len(list_slices) - 1):
-        if list_slices[i] < image.shape[0] and list_slices[i + 1] < image.shape[0]:
-            # slices are within good region
-            slice_n = image[list_slices[i]:list_slices[i + 1], :]
-
-            slice_x_profile = slice_n.sum(0)
-            pixel_intensity = slice_n.sum()
-
-            gauss_function, offset, amplitude, center_x, standard_deviation, _, _ = gauss_fit(slice_x_profile, x_axis)
-
-            # Does x need to be the middle of slice? - currently it is
-            slice_data.append(([center_x, y_axis[list_slices[i] + n_pixel_half_slice]], standard_deviation,
-                               pixel_intensity))
-        else:
-            _logging.info('Drop slice')
+    slice_profiles, slice_intensities = _get_slice_profiles(image, list_slices, vertical=True)
+    if slice_profiles is not None:
+        # Does x need to be the middle of slice? - currently it is
+        slice_centers_y = y_axis[numpy.array(list_slices[:len(slice_profiles)]) + n_pixel_half_slice]
+        # Fit all the slices at once.
+        parameters, _, _ = fitting.gauss_fit_batch(x_axis, slice_profiles)
+        for center_y, (_, _, center_x, standard_deviation), pixel_intensity in \
+                zip(slice_centers_y, parameters, slice_intensities):
+            slice_data.append(([center_x, center_y], abs(standard_deviation), pixel_intensity))
 
     return slice_data, slice_length
 
@@ -414,26 +872,168 @@ def get_png_from_image(image_raw_bytes, scale=None, min_value=None, max_value=No
     return content
 
 
-def get_fwhm(x, y):
+# Colormap lookup tables (uint8 RGB), by colormap name.
+_colormap_luts = {}
+
+PREVIEW_FORMATS = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+def get_preview_format(image_format=None):
+    """
+    :return: Name of the preview image format ("png", "jpeg" or "webp"). Default: config.DEFAULT_CAMERA_IMAGE_FORMAT.
+    """
+    image_format = (image_format or config.DEFAULT_CAMERA_IMAGE_FORMAT).lower()
+    if image_format == "jpg":
+        image_format = "jpeg"
+    if image_format not in PREVIEW_FORMATS:
+        raise ValueError("Invalid image format '%s'. Available formats: %s." % (image_format,
+                                                                                ", ".join(PREVIEW_FORMATS)))
+    return image_format
+
+
+def get_colormap_lut(colormap_name=None):
+    """
+    :param colormap_name: Colormap to use. See http://matplotlib.org/examples/color/colormaps_reference.html
+    :return: uint8 RGB lookup table of the colormap (one row per colormap level).
+    """
+    colormap_name = colormap_name or config.DEFAULT_CAMERA_IMAGE_COLORMAP
+    lut = _colormap_luts.get(colormap_name)
+    if lut is None:
+        try:
+            colormap = getattr(cm, colormap_name)
+            # Same colors (truncated to uint8) as get_png_from_image.
+            lut = numpy.uint8(colormap(numpy.arange(colormap.N))[:, :3] * 255)
+        except:
+            raise ValueError("Unable to apply colormap '%s'. "
+                             "See http://matplotlib.org/examples/color/colormaps_reference.html for available "
+                             "colormaps." % colormap_name)
+        _colormap_luts[colormap_name] = lut
+    return lut
+
+
+def _apply_cutoffs(values, min_value, max_value):
+    if min_value:
+        values -= min_value
+        numpy.maximum(values, 0, out=values)
+    if max_value:
+        numpy.minimum(values, max_value, out=values)
+    return values
+
+
+def _get_colormap_levels(values, maximum, levels):
+    # Same scaling as get_png_from_image and the matplotlib colormaps (level = int(value / maximum * levels)).
+    if maximum:
+        values *= 1.0 / maximum
+        values *= levels
+    numpy.nan_to_num(values, copy=False)
+    numpy.clip(values, 0, levels - 1, out=values)
+    return values.astype("int32")
+
+
+def get_preview_from_image(image, scale=None, min_value=None, max_value=None, colormap_name=None,
+                           image_format=None, compression=None, quality=None, decimation=None):
+    """
+    Generate a preview image, with the colors of get_png_from_image but colormapping with a lookup table.
+    :param image: Image to render.
+    :param scale: Scale the image.
+    :param min_value: Min cutoff value.
+    :param max_value: Max cutoff value.
+    :param colormap_name: Colormap to use. See http://matplotlib.org/examples/color/colormaps_reference.html
+    :param image_format: "png", "jpeg" or "webp". Default: config.DEFAULT_CAMERA_IMAGE_FORMAT.
+    :param compression: PNG compression level (0-9). Default: config.DEFAULT_CAMERA_IMAGE_COMPRESSION.
+    :param quality: JPEG and WebP quality (1-100). Default: config.DEFAULT_CAMERA_IMAGE_QUALITY.
+    :param decimation: Integer factor: only every decimation-th pixel of each axis is rendered.
+    :return: Encoded image bytes.
+    """
+    image_format = get_preview_format(image_format)
+    lut = get_colormap_lut(colormap_name)
+
+    if decimation and int(decimation) > 1:
+        image = image[::int(decimation), ::int(decimation)]
+
+    if scale:
+        image = image.astype("float64")
+        shape_0 = int(image.shape[0] * scale)
+        shape_1 = int(image.shape[1] * scale)
+        sh = shape_0, image.shape[0] // shape_0, shape_1, image.shape[1] // shape_1
+        image = image.reshape(sh).mean(-1).mean(1)
+
+    if image.dtype in (numpy.uint8, numpy.uint16):
+        # Colors of all possible pixel values, then a single lookup over the image.
+        maximum = _apply_cutoffs(numpy.array([image.max()], dtype="float64"), min_value, max_value)[0]
+        values = _apply_cutoffs(numpy.arange(1 << (8 * image.dtype.itemsize), dtype="float64"), min_value, max_value)
+        rgb = numpy.take(lut[_get_colormap_levels(values, maximum, len(lut))], image, axis=0)
+    else:
+        values = _apply_cutoffs(image.astype("float64"), min_value, max_value)
+        maximum = numpy.nanmax(values) if values.size else 0
+        rgb = numpy.take(lut, _get_colormap_levels(values, maximum, len(lut)), axis=0)
+
+    if image_format == "png":
+        return _encode_png(rgb, config.DEFAULT_CAMERA_IMAGE_COMPRESSION if compression is None else int(compression))
+
+    options = {"quality": config.DEFAULT_CAMERA_IMAGE_QUALITY if quality is None else int(quality)}
+    if image_format == "webp":
+        # Fastest encoding method.
+        options["method"] = 0
+    with io.BytesIO() as output:
+        Image.fromarray(rgb).save(output, image_format, **options)
+        return output.getvalue()
+
+
+def _encode_png(rgb, compress_level):
+    # RGB PNG without row filtering: PIL always filters the rows, which is slower than the compression itself.
+    def chunk(chunk_type, data):
+        return struct.pack(">I", len(data)) + chunk_type + data + \
+               struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF)
+
+    height, width = rgb.shape[:2]
+    rows = numpy.zeros((height, width * 3 + 1), dtype="uint8")  # Filter type 0 (none) on every row.
+    rows[:, 1:] = rgb.reshape(height, width * 3)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows, compress_level)) + \
+        chunk(b"IEND", b"")
+
+
+def get_fwhm(x, y, interpolate=False):
+    """
+    Full width at half maximum of the profile.
+    :param interpolate: If True the half maximum crossings are linearly interpolated between samples,
+                        otherwise the positions of the first samples below the half maximum are used.
+    """
     try:
         ymax, ymin =  numpy.amax(y),  numpy.amin(y)
         hm =  (ymax - ymin) /2
         max_index, l_index, r_index = numpy.argmax(y), 0, len(x)-1
 
-        for i in range(max_index-1, 0, -1):
-            if (y[i] - ymin) <= hm:
-                l_index = i
-                break
-        for i in range(max_index+1, len(x), 1):
-            if (y[i] - ymin) <= hm:
-                r_index = i
-                break
+        # First samples at or below the half maximum on each side of the maximum (index 0 is not considered).
+        below = (y[:len(x)] - ymin) <= hm
+        left = numpy.flatnonzero(below[1:max_index])
+        right = numpy.flatnonzero(below[max_index + 1:])
+        if left.size:
+            l_index = left[-1] + 1
+        if right.size:
+            r_index = max_index + 1 + right[0]
+
+        if interpolate:
+            x_left, x_right = x[l_index], x[r_index]
+            if left.size:
+                x_left = _interpolate_crossing(x, y, l_index, l_index + 1, ymin + hm)
+            if right.size:
+                x_right = _interpolate_crossing(x, y, r_index, r_index - 1, ymin + hm)
+            return abs(x_left - x_right)
+
         fwhm = abs(x[l_index] - x[r_index])
         return fwhm
     except:
         return 0.0
 
 
+def _interpolate_crossing(x, y, index_below, index_above, value):
+    # Position where the line between the two samples crosses the value.
+    y_below, y_above = float(y[index_below]), float(y[index_above])
+    return x[index_below] + (value - y_below) / (y_above - y_below) * (x[index_above] - x[index_below])
+
+
 def _gauss_deriv(x, offset, amplitude, center, standard_deviation):
     fac = numpy.exp(-(x - center) ** 2 / (2 * standard_deviation ** 2))
     result = numpy.empty((4, x.size), dtype=x.dtype)
@@ -474,7 +1074,7 @@ def gauss_fit_psss(profile, axis, **kwargs):
     offset, amplitude, center, standard_deviation = optimal_parameter
     return offset, amplitude, center, abs(standard_deviation)
 
-def binning(image, x_axis, y_axis, bx, by, mean = False):
+def binning(image, x_axis, y_axis, bx, by, mean = False, buffer_pool=None):
     sy, sx = (len(y_axis), len(x_axis)) if (image is None) else image.shape
     _sx, _sy = int(sx/bx) * bx, int(sy/by) * by
     if (sx != _sx) or (sy != _sy):
@@ -492,15 +1092,45 @@ def binning(image, x_axis, y_axis, bx, by, mean = False):
         type = y_axis.dtype
         y_axis = y_axis.reshape(int(sy / by), int(by)).mean(axis=(1)).astype(type, copy=False)
     if image is not None:
-        image = image.reshape(int(sy / by), int(by), int(sx / bx), int(bx))
-        if mean:
-            image = image.mean(axis=(1, 3))
+        if buffer_pool is not None:
+            image = _binning_in_place(image, bx, by, mean, buffer_pool)
         else:
-            image = image.sum(axis=(1, 3))
-            numpy.clip(image, 0, 0xFFFF, out=image)
-        image = image.astype("uint16", copy=False)
+            image = image.reshape(int(sy / by), int(by), int(sx / bx), int(bx))
+            if mean:
+                image = image.mean(axis=(1, 3))
+            else:
+                image = image.sum(axis=(1, 3))
+                numpy.clip(image, 0, 0xFFFF, out=image)
+            image = image.astype("uint16", copy=False)
     return image, x_axis, y_axis
 
+
+def _binning_in_place(image, bx, by, mean, buffer_pool):
+    # Same operations as binning, accumulating in pool buffers (with the types used by numpy sum and mean).
+    sy, sx = image.shape
+    shape = (int(sy / by), int(sx / bx))
+    # 4D view of the (possibly cropped) image, without copying.
+    blocks = numpy.lib.stride_tricks.as_strided(image, shape=(shape[0], int(by), shape[1], int(bx)),
+                                                strides=(image.strides[0] * by, image.strides[0],
+                                                         image.strides[1] * bx, image.strides[1]),
+                                                writeable=False)
+    if mean:
+        if image.dtype.kind in "biu":
+            dtype = numpy.dtype("float64")
+        else:
+            dtype = numpy.dtype("float32") if image.dtype == numpy.float16 else image.dtype
+        accumulator = buffer_pool.get(shape, dtype)
+        numpy.sum(blocks, axis=(1, 3), dtype=dtype, out=accumulator)
+        numpy.true_divide(accumulator, int(by) * int(bx), out=accumulator)
+    else:
+        accumulator = buffer_pool.get(shape, get_sum_dtype(image))
+        numpy.sum(blocks, axis=(1, 3), dtype=accumulator.dtype, out=accumulator)
+        numpy.clip(accumulator, 0, 0xFFFF, out=accumulator)
+    output = buffer_pool.get(shape, "uint16")
+    numpy.copyto(output, accumulator, casting="unsafe")
+    return output
+
+
 def chunk_copy(image, max_chunk = 2000000):
     """
     Copies an image in slices so that each slice is never bigger than the hugepage size(2MB).
@@ -1,50 +1,212 @@
+import math
+from collections import namedtuple
 from logging import getLogger
-from cam_server.pipeline.data_processing.functions import rotate, subtract_background, subtract_background_signed, \
-    get_region_of_interest, apply_threshold, binning
+
+import numpy
+
+from cam_server import config
+from cam_server.pipeline.data_processing.functions import subtract_background, subtract_background_signed, \
+    apply_threshold, binning, get_rotation_transform, rotate_region, is_number, ResamplingMap, chunk_copy
 
 _logger = getLogger(__name__)
 
+# Rotation modes whose values outside the image do not depend on pixels far from the image border.
+_ROTATION_CLIPPED_MODES = ("constant", "grid-constant", "nearest")
+
+_Plan = namedtuple("_Plan", "shape input_window background ortho transform resampling_map roi mutates_input")
+
+
+class PreProcessingPlan(object):
+    """
+    Binning, background subtraction, rotation, region of interest and threshold of a pipeline configuration,
+    compiled into the minimal window of the input image needed to produce the region of interest: the pixels outside
+    of the window are not processed. The plan is compiled on the first frame and whenever the image shape changes.
+    """
+
+    def __init__(self, parameters, image_background_array=None):
+        """
+        :param parameters: Pipeline parameters.
+        :param image_background_array: Background image (binned if binning is configured).
+        """
+        self.parameters = parameters
+        self.image_background_array = image_background_array
+        self._plan = None
 
-def process_image(image, pulse_id, timestamp, x_axis, y_axis, parameters, image_background_array=None):
-    by, bx = int(parameters.get("binning_y", 1)), int(parameters.get("binning_x", 1))
-    bm = parameters.get("binning_mean", False)
-    if (by > 1) or (bx > 1):
-        image, x_axis, y_axis = binning(image, x_axis, y_axis, bx, by, bm)
+    def _compile(self, shape):
+        parameters = self.parameters
+        by, bx = int(parameters.get("binning_y", 1)), int(parameters.get("binning_x", 1))
+        height, width = shape
+        if (by > 1) or (bx > 1):
+            height, width = int(height / by), int(width / bx)
 
-    if image_background_array is not None:
-        if image.shape != image_background_array.shape:
-            _logger.debug(
-                "Bad background shape: %s instead of %s - %s" % (image_background_array.shape, image.shape, str(parameters.get("name"))))
+        if self.image_background_array is not None and self.image_background_array.shape != (height, width):
+            _logger.debug("Bad background shape: %s instead of %s - %s" % (self.image_background_array.shape,
+                                                                          (height, width), str(parameters.get("name"))))
             raise RuntimeError("Invalid background_image size")
-        if parameters.get("image_background_enable") == "passive":
-            parameters["background_data"] = image_background_array
-        elif parameters.get("image_background_enable") == "signed":
-            image = subtract_background_signed(image, image_background_array)
+
+        rotation = parameters.get("rotation")
+        ortho = None
+        if rotation and rotation["mode"] == "ortho":
+            ortho = int(rotation["angle"] / 90) % 4
+        output_height, output_width = (width, height) if (ortho in (1, 3)) else (height, width)
+
+        # Region of interest, limited to the size of the output image.
+        roi = None
+        image_region_of_interest = parameters.get("image_region_of_interest")
+        if image_region_of_interest:
+            offset_x, size_x, offset_y, size_y = image_region_of_interest
+            size_x, size_y = min(size_x, output_width), min(size_y, output_height)
+            offset_x, offset_y = min(offset_x, (output_width - size_x)), min(offset_y, (output_height - size_y))
+            offset_x, offset_y = max(0, offset_x), max(0, offset_y)
+            roi = offset_x, size_x, offset_y, size_y
+        else:
+            offset_x, size_x, offset_y, size_y = 0, output_width, 0, output_height
+
+        # Window of the (binned) image mapped to the region of interest.
+        transform, resampling_map = None, None
+        if not rotation:
+            window = offset_y, offset_y + size_y, offset_x, offset_x + size_x
+        elif ortho is not None:
+            if ortho == 0:
+                window = offset_y, offset_y + size_y, offset_x, offset_x + size_x
+            elif ortho == 1:
+                window = offset_x, offset_x + size_x, width - offset_y - size_y, width - offset_y
+            elif ortho == 2:
+                window = height - offset_y - size_y, height - offset_y, width - offset_x - size_x, width - offset_x
+            else:
+                window = height - offset_x - size_x, height - offset_x, offset_y, offset_y + size_y
         else:
-            image = subtract_background(image, image_background_array)
+            matrix, offset = get_rotation_transform((height, width), rotation["angle"])
+            window = self._get_rotation_footprint(matrix, offset, (offset_y, size_y, offset_x, size_x),
+                                                  (height, width), rotation["order"], rotation["mode"])
+            # Transform from the region of interest to the window.
+            offset = offset + matrix @ [offset_y, offset_x] - [window[0], window[2]]
+            if ResamplingMap.is_supported(rotation["order"], rotation["mode"]):
+                # Source coordinates and weights are calculated once, instead of on every frame.
+                resampling_map = ResamplingMap((window[1] - window[0], window[3] - window[2]), (size_y, size_x),
+                                               matrix, offset, rotation["order"], rotation["mode"])
+            else:
+                transform = matrix, offset, (size_y, size_x)
+
+        y_start, y_end, x_start, x_end = window
+        input_window = (slice(y_start * by, y_end * by), slice(x_start * bx, x_end * bx))
+
+        background = None
+        if self.image_background_array is not None and parameters.get("image_background_enable") != "passive":
+            background = numpy.ascontiguousarray(self.image_background_array[y_start:y_end, x_start:x_end])
 
-    # Check for rotation parameter
-    rotation = parameters.get("rotation")
-    if rotation:
-        image = rotate(image, rotation["angle"], rotation["order"], rotation["mode"])
+        # Stages modifying the image in place while it is still (a view of) the input image.
+        background_mode = parameters.get("image_background_enable") if self.image_background_array is not None else None
+        is_input = not ((by > 1) or (bx > 1))
+        mutates_input = is_input and (background_mode not in (None, "passive", "signed"))
+        if (background_mode == "signed") or (transform is not None) or (resampling_map is not None):
+            is_input = False
+        image_threshold = parameters.get("image_threshold")
+        if (image_threshold is not None) and (image_threshold > 0):
+            mutates_input = mutates_input or is_input
 
-    # Check for ROI
-    image_region_of_interest = parameters.get("image_region_of_interest")
-    if image_region_of_interest:
-        offset_x, size_x, offset_y, size_y = image_region_of_interest
-        # Limit ROI to image size
-        size_x, size_y = min(size_x, image.shape[1]), min(size_y, image.shape[0])
-        offset_x, offset_y = min(offset_x, (image.shape[1] - size_x)), min(offset_y, (image.shape[0] - size_y))
-        offset_x, offset_y = max(0, offset_x), max(0, offset_y)
+        self._plan = _Plan(shape, input_window, background, ortho, transform, resampling_map, roi, mutates_input)
 
-        image = get_region_of_interest(image, offset_x, size_x, offset_y, size_y)
+    @staticmethod
+    def _get_rotation_footprint(matrix, offset, roi, shape, order, mode):
+        offset_y, size_y, offset_x, size_x = roi
+        corners = numpy.array([[offset_y, offset_y, offset_y + size_y - 1, offset_y + size_y - 1],
+                               [offset_x, offset_x + size_x - 1, offset_x, offset_x + size_x - 1]], dtype=float)
+        coordinates = matrix @ corners + offset[:, numpy.newaxis]
+        margin = 1 if order <= 1 else config.PIPELINE_ROTATION_SPLINE_MARGIN
+        clipped = mode in _ROTATION_CLIPPED_MODES or is_number(mode)
+
+        window = []
+        for axis, size in enumerate(shape):
+            start = int(math.floor(coordinates[axis].min())) - margin
+            end = int(math.ceil(coordinates[axis].max())) + margin + 1
+            if (start < 0 or end > size) and not clipped:
+                # Values outside of the image are reflected or wrapped from anywhere in the image.
+                start, end = 0, size
+            start = min(max(start, 0), size - 1)
+            end = max(min(end, size), start + 1)
+            window.extend((start, end))
+        return tuple(window)
+
+    def _get_plan(self, shape):
+        plan = self._plan
+        if plan is None or plan.shape != shape:
+            self._compile(shape)
+            plan = self._plan
+        return plan
+
+    def is_copy_needed(self, image):
+        """
+        :return: True if the image is read-only and a stage modifies it in place: the processed window is copied.
+        """
+        return self._get_plan(image.shape).mutates_input and not image.flags.writeable
+
+    def process(self, image, x_axis, y_axis, buffer_pool=None):
+        """
+        :param image: Input image. If writeable it may be modified in place, otherwise only the window needed for
+                      the region of interest is copied, and only if a configured stage modifies it in place.
+        :param buffer_pool: If provided (functions.BufferPool), the intermediate images are created in buffers of the
+                            pool instead of being allocated on every frame.
+        :return: image, x_axis, y_axis
+        """
+        plan = self._get_plan(image.shape)
+        copy_needed = plan.mutates_input and not image.flags.writeable
+        _, input_window, background, ortho, transform, resampling_map, roi, _ = plan
+        parameters = self.parameters
+
+        image = image[input_window]
+        if copy_needed:
+            if buffer_pool is None:
+                image = chunk_copy(image)
+            else:
+                window, image = image, buffer_pool.get(image.shape, image.dtype)
+                numpy.copyto(image, window)
+
+        by, bx = int(parameters.get("binning_y", 1)), int(parameters.get("binning_x", 1))
+        bm = parameters.get("binning_mean", False)
+        if (by > 1) or (bx > 1):
+            image, _, _ = binning(image, None, None, bx, by, bm, buffer_pool)
+            _, x_axis, y_axis = binning(None, x_axis, y_axis, bx, by)
+
+        if self.image_background_array is not None:
+            if parameters.get("image_background_enable") == "passive":
+                parameters["background_data"] = self.image_background_array
+            elif parameters.get("image_background_enable") == "signed":
+                image = subtract_background_signed(image, background, buffer_pool)
+            else:
+                image = subtract_background(image, background)
+
+        rotation = parameters.get("rotation")
+        if ortho is not None:
+            image = numpy.rot90(image, ortho)
+        elif resampling_map is not None:
+            image = resampling_map.resample(image, buffer_pool)
+        elif transform is not None:
+            matrix, offset, output_shape = transform
+            image = rotate_region(image, matrix, offset, output_shape, rotation["order"], rotation["mode"],
+                                  buffer_pool)
 
         # Apply roi to geometry x_axis and y_axis
-        x_axis = x_axis[offset_x:offset_x + size_x]
-        y_axis = y_axis[offset_y:offset_y + size_y]
-
-    # Apply threshold
-    image_threshold = parameters.get("image_threshold")
-    if image_threshold is not None and image_threshold > 0:
-        apply_threshold(image, image_threshold)
-    return image, x_axis, y_axis
+        if roi:
+            offset_x, size_x, offset_y, size_y = roi
+            x_axis = x_axis[offset_x:offset_x + size_x]
+            y_axis = y_axis[offset_y:offset_y + size_y]
+
+        # Apply threshold
+        image_threshold = parameters.get("image_threshold")
+        if image_threshold is not None and image_threshold > 0:
+            apply_threshold(image, image_threshold, buffer_pool)
+        return image, x_axis, y_axis
+
+
+def process_image(image, pulse_id, timestamp, x_axis, y_axis, parameters, image_background_array=None,
+                  buffer_pool=None, plan=None):
+    """
+    :param buffer_pool: If provided (functions.BufferPool), the intermediate images are created in buffers of the
+                        pool instead of being allocated on every frame. The input image is modified in place.
+    :param plan: PreProcessingPlan of the parameters and background, kept across frames. If not provided, it is
+                 compiled for this image.
+    """
+    if plan is None:
+        plan = PreProcessingPlan(parameters, image_background_array)
+    return plan.process(image, x_axis, y_axis, buffer_pool)
@@ -6,26 +6,25 @@ from cam_server.pipeline.data_processing import functions
 _logger = getLogger(__name__)
 
 
-def process_image(image, pulse_id, timestamp, x_axis, y_axis, parameters, bsdata=None):
+def process_image(image, pulse_id, timestamp, x_axis, y_axis, parameters, bsdata=None, fit_state=None):
 
     # Add return values
     return_value = dict()
 
-    (min_value, max_value) = functions.get_min_max(image)
+    (min_value, max_value, x_profile, y_profile, intensity) = functions.get_image_statistics(image)
 
-    (x_profile, y_profile) = functions.get_x_y_profile(image)
+    # The fit state is owned by the caller (one per pipeline and processing thread).
+    warm_start_state = fit_state if parameters.get("fit_warm_start") else None
 
-    x_fit = functions.gauss_fit(x_profile, x_axis)
-    y_fit = functions.gauss_fit(y_profile, y_axis)
+    x_fit = functions.gauss_fit(x_profile, x_axis, warm_start_state, "x")
+    y_fit = functions.gauss_fit(y_profile, y_axis, warm_start_state, "y")
 
     x_fit_gauss_function, x_fit_offset, x_fit_amplitude, x_fit_mean, x_fit_standard_deviation, x_center_of_mass, x_rms = x_fit
     y_fit_gauss_function, y_fit_offset, y_fit_amplitude, y_fit_mean, y_fit_standard_deviation, y_center_of_mass, y_rms = y_fit
 
-    x_fwhm = functions.get_fwhm(x_axis, x_profile)
-    y_fwhm = functions.get_fwhm(y_axis, y_profile)
-
-    # Could be also y_profile.sum() -> it should give the same result.
-    intensity = x_profile.sum()
+    fwhm_interpolation = parameters.get("fwhm_interpolation", False)
+    x_fwhm = functions.get_fwhm(x_axis, x_profile, fwhm_interpolation)
+    y_fwhm = functions.get_fwhm(y_axis, y_profile, fwhm_interpolation)
 
     # Add return values
     return_value["x_axis"] = x_axis
@@ -68,6 +67,23 @@ def process_image(image, pulse_id, timestamp, x_axis, y_axis, parameters, bsdata
     return_value["y_fit_standard_deviation"] = y_fit_standard_deviation
     return_value["y_fit_mean"] = y_fit_mean
 
+    if warm_start_state is not None:
+        return_value["x_fit_iterations"] = warm_start_state.iterations.get("x")
+        return_value["y_fit_iterations"] = warm_start_state.iterations.get("y")
+
+    # Multiple ROIs out of a single pass over the image.
+    image_rois = parameters.get("image_rois")
+    if image_rois:
+        integral_image = functions.get_integral_image(image)
+        for name, roi in image_rois.items():
+            roi_intensity, roi_x_profile, roi_y_profile, roi_x_center_of_mass, roi_y_center_of_mass = \
+                functions.get_roi_statistics(integral_image, roi, x_axis, y_axis)
+            return_value[name + "_intensity"] = roi_intensity
+            return_value[name + "_x_profile"] = roi_x_profile
+            return_value[name + "_y_profile"] = roi_y_profile
+            return_value[name + "_x_center_of_mass"] = roi_x_center_of_mass
+            return_value[name + "_y_center_of_mass"] = roi_y_center_of_mass
+
     image_good_region = parameters.get("image_good_region")
     if image_good_region:
         try:
@@ -92,6 +108,9 @@ def process_image(image, pulse_id, timestamp, x_axis, y_axis, parameters, bsdata
                 return_value["gr_y_fit_standard_deviation"] = None
                 return_value["gr_y_fit_mean"] = None
                 return_value["gr_intensity"] = None
+                if warm_start_state is not None:
+                    return_value["gr_x_fit_iterations"] = None
+                    return_value["gr_y_fit_iterations"] = None
 
                 slices = parameters.get("image_slices")
                 if slices:
@@ -129,14 +148,14 @@ def process_image(image, pulse_id, timestamp, x_axis, y_axis, parameters, bsdata
             good_region_y_axis = y_axis[good_region_y_start:good_region_y_end]
 
             # Get profiles of the good region
-            (good_region_x_profile, good_region_y_profile) = functions.get_x_y_profile(good_region)
-
-            # Could be also good_region_y_profile.sum() -> it should give the same result.
-            good_region_intensity = good_region_x_profile.sum()
+            _, _, good_region_x_profile, good_region_y_profile, good_region_intensity = \
+                functions.get_image_statistics(good_region)
 
             # Fit the profiles
-            good_region_x_fit = functions.gauss_fit(good_region_x_profile, good_region_x_axis)
-            good_region_y_fit = functions.gauss_fit(good_region_y_profile, good_region_y_axis)
+            good_region_x_fit = functions.gauss_fit(good_region_x_profile, good_region_x_axis, warm_start_state,
+                                                    "gr_x")
+            good_region_y_fit = functions.gauss_fit(good_region_y_profile, good_region_y_axis, warm_start_state,
+                                                    "gr_y")
 
             gr_x_fit_gauss_function, gr_x_fit_offset, gr_x_fit_amplitude, gr_x_fit_mean, gr_x_fit_standard_deviation, _, _ = good_region_x_fit
             gr_y_fit_gauss_function, gr_y_fit_offset, gr_y_fit_amplitude, gr_y_fit_mean, gr_y_fit_standard_deviation, _, _ = good_region_y_fit
@@ -161,6 +180,9 @@ def process_image(image, pulse_id, timestamp, x_axis, y_axis, parameters, bsdata
             return_value["gr_y_fit_standard_deviation"] = gr_y_fit_standard_deviation
             return_value["gr_y_fit_mean"] = gr_y_fit_mean
             return_value["gr_intensity"] = good_region_intensity
+            if warm_start_state is not None:
+                return_value["gr_x_fit_iterations"] = warm_start_state.iterations.get("gr_x")
+                return_value["gr_y_fit_iterations"] = warm_start_state.iterations.get("gr_y")
 
             image_slices = parameters.get("image_slices")
 
@@ -184,13 +206,13 @@ def process_image(image, pulse_id, timestamp, x_axis, y_axis, parameters, bsdata
                                                                                scaling=scale,
                                                                                number_of_slices=slice_number)
 
-                    y_slice_data, y_slice_length = functions.get_y_slices_data(good_region, good_region_x_axis,
-                                                                               good_region_y_axis, gr_y_fit_mean,
-                                                                               gr_y_fit_standard_deviation,
-                                                                               scaling=scale,
-                                                                               number_of_slices=slice_number)
-
+                    # Horizontal slices are always needed for the coupling: vertical ones only if requested.
                     if orientation == "vertical":
+                        y_slice_data, y_slice_length = functions.get_y_slices_data(good_region, good_region_x_axis,
+                                                                                   good_region_y_axis, gr_y_fit_mean,
+                                                                                   gr_y_fit_standard_deviation,
+                                                                                   scaling=scale,
+                                                                                   number_of_slices=slice_number)
                         slice_data = y_slice_data
                         slice_length = y_slice_length
 
@@ -6,11 +6,11 @@ from cam_server.utils import create_thread_pvs, epics_lock
 import json
 
 import numpy
-import scipy.signal
-import scipy.optimize
-import numba
 
-numba.set_num_threads(4)
+from cam_server.lazy_import import lazy_import, lazy_jit
+
+scipy = lazy_import("scipy", ("signal", "optimize"))
+numba = lazy_import("numba")
 
 _logger = getLogger(__name__)
 
@@ -21,7 +21,7 @@ initialized = False
 sent_pid = -1
 
 
-@numba.njit(parallel=True)
+@lazy_jit(parallel=True)
 def get_spectrum(image, background):
     y = image.shape[0]
     x = image.shape[1]
@@ -43,6 +43,7 @@ def get_spectrum(image, background):
 def initialize(parameters):
     global ymin_pv, ymax_pv, axis_pv, output_pv, center_pv, fwhm_pv
     global channel_names
+    numba.set_num_threads(4)
     epics_pv_name_prefix = parameters["camera_name"]
     output_pv_name = epics_pv_name_prefix + ":SPECTRUM_Y"
     center_pv_name = epics_pv_name_prefix + ":SPECTRUM_CENTER"
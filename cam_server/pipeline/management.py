@@ -16,7 +16,7 @@ class PipelineInstanceManager(InstanceManager):
                  cam_server_client, hostname=None, port_range=None):
         super(PipelineInstanceManager, self).__init__(
             port_range=config.PIPELINE_STREAM_PORT_RANGE if (port_range is None) else port_range,
-            auto_delete_stopped=True)
+            auto_delete_stopped=True, preload_modules=config.PIPELINE_WORKER_PRELOAD_MODULES)
         self.config_manager = config_manager
         self.background_manager = background_manager
         self.user_scripts_manager = user_scripts_manager
@@ -30,6 +30,11 @@ class PipelineInstanceManager(InstanceManager):
     def _create_and_start_pipeline(self, instance_id, pipeline_config, read_only_pipeline):
         if pipeline_config.get_pipeline_type() == config.PIPELINE_TYPE_STREAM:
             camera_name = None
+        elif pipeline_config.get_pipeline_type() == config.PIPELINE_TYPE_MULTI_CAMERA:
+            camera_name = pipeline_config.get_camera_name()
+            for name in pipeline_config.get_configuration()["camera_names"]:
+                if not self.cam_server_client.is_camera_online(name):
+                    raise ValueError("Camera %s is not online. Cannot start pipeline." % name)
         else:
             camera_name = pipeline_config.get_camera_name()
             if not self.cam_server_client.is_camera_online(camera_name):
@@ -213,6 +218,10 @@ class PipelineInstance(InstanceWrapper):
         if self.is_running() and self.pipeline_config.get_camera_name() != configuration.get("camera_name"):
             raise ValueError("Cannot change the camera name on a running instance. Stop the instance first.")
 
+        if self.is_running() and self.pipeline_config.get_configuration().get("camera_names") != \
+                configuration.get("camera_names"):
+            raise ValueError("Cannot change the camera names on a running instance. Stop the instance first.")
+
         self.pipeline_config.set_configuration(configuration)
 
         # The set configuration sets the default parameters.
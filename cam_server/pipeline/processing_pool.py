@@ -0,0 +1,229 @@
+import mmap
+from collections import deque, namedtuple
+from logging import getLogger
+from multiprocessing import Pipe
+from multiprocessing.connection import wait
+from threading import Thread, Lock
+
+import numpy
+
+from epics.multiproc import CAProcess as Process
+
+from cam_server import config
+
+_logger = getLogger(__name__)
+
+# Result arrays smaller than this are returned pickled instead of through the ring.
+_MIN_SHARED_ARRAY_SIZE = 4096
+_SLOT_ALIGNMENT = 4096
+_ARRAY_ALIGNMENT = 64
+
+# Array stored in the output area of a ring slot.
+_SharedArray = namedtuple("_SharedArray", ["offset", "shape", "dtype"])
+
+
+def _align(size, alignment):
+    return ((size + alignment - 1) // alignment) * alignment
+
+
+class ProcessingPool(object):
+    """
+    Runs the processing of the frames in a pool of worker processes, so that it is not serialized by the GIL as with
+    processing threads. Frames are copied into the slots of a shared memory ring instead of being pickled, and the
+    large arrays of the results come back through the output area of the same slot. Frames are dispatched to the
+    least loaded worker and the results are delivered in the order the frames were submitted.
+    The workers are forked, so the process and update functions can be closures over the state of the pipeline.
+    """
+
+    def __init__(self, workers, frame_size, process_function, on_result, update_function=None, slots=None,
+                 stop_event=None):
+        """
+        :param workers: Number of worker processes.
+        :param frame_size: Size in bytes of the frames. Bigger frames are pickled.
+        :param process_function: Called in the workers as process_function(image, x_axis, y_axis, pulse_id,
+                                 timestamp, bsdata), returning the processed data or None.
+        :param on_result: Called in the order of submission as on_result(pulse_id, processed_data, context), from
+                          the result thread. Frames processed to None are not delivered.
+        :param update_function: Called in every worker with the arguments of update().
+        :param slots: Number of slots of the ring (maximum number of frames being processed). If None,
+                      config.PIPELINE_WORKER_SLOTS per worker.
+        :param stop_event: Event set if a worker fails.
+        """
+        self.workers = int(workers)
+        self.slots = int(slots) if slots else self.workers * config.PIPELINE_WORKER_SLOTS
+        self.input_size = _align(int(frame_size), _SLOT_ALIGNMENT)
+        # The processed images can be bigger than the frame (e.g. background subtraction to a signed type).
+        self.output_size = 2 * self.input_size
+        self.slot_size = self.input_size + self.output_size
+        self.dropped = 0
+
+        self._process_function = process_function
+        self._update_function = update_function
+        self._on_result = on_result
+        self._stop_event = stop_event
+        self._ring = mmap.mmap(-1, self.slot_size * self.slots)
+        self._free_slots = deque(range(self.slots))
+        self._submitted = {}
+        self._results = {}
+        self._sequence = 0
+        self._next_sequence = 0
+        self._pending = [0] * self.workers
+        self._lock = Lock()
+        self._closed = False
+
+        self._connections = []
+        self._processes = []
+        for index in range(self.workers):
+            connection, worker_connection = Pipe()
+            self._connections.append(connection)
+            process = Process(target=self._run_worker, args=(index, worker_connection))
+            process.daemon = True
+            process.start()
+            worker_connection.close()
+            self._processes.append(process)
+
+        self._result_thread = Thread(target=self._receive_results, daemon=True)
+        self._result_thread.start()
+
+    def submit(self, image, pulse_id, timestamp, x_axis, y_axis, bsdata=None, context=None):
+        """
+        :param context: Passed back to on_result.
+        :return: False if the frame was dropped because all slots are busy.
+        """
+        try:
+            slot = self._free_slots.popleft()
+        except IndexError:
+            self.dropped += 1
+            _logger.debug("No free processing slot: dropping PID %s" % (pulse_id,))
+            return False
+
+        if image.nbytes <= self.input_size:
+            frame = numpy.ndarray(image.shape, image.dtype, self._ring, slot * self.slot_size)
+            numpy.copyto(frame, image)
+            image = (image.shape, image.dtype.str)
+
+        with self._lock:
+            sequence = self._sequence
+            self._sequence += 1
+            self._submitted[sequence] = (slot, pulse_id, context)
+            index = min(range(self.workers), key=self._pending.__getitem__)
+            self._pending[index] += 1
+        self._connections[index].send(("frame", (sequence, slot, pulse_id, timestamp, x_axis, y_axis, bsdata, image)))
+        return True
+
+    def update(self, *args):
+        """
+        Calls update_function(*args) in all workers before they process the next submitted frame.
+        """
+        for connection in self._connections:
+            connection.send(("update", args))
+
+    def _run_worker(self, index, connection):
+        for other in self._connections:
+            other.close()
+        try:
+            while True:
+                message = connection.recv()
+                if message is None:
+                    break
+                kind, arguments = message
+                if kind == "update":
+                    self._update_function(*arguments)
+                    continue
+                sequence, slot, pulse_id, timestamp, x_axis, y_axis, bsdata, image = arguments
+                if not isinstance(image, numpy.ndarray):
+                    shape, dtype = image
+                    image = numpy.ndarray(shape, dtype, self._ring, slot * self.slot_size)
+                try:
+                    processed_data = self._process_function(image, x_axis, y_axis, pulse_id, timestamp, bsdata)
+                    connection.send((sequence, self._store_result(slot, processed_data), None))
+                except Exception as e:
+                    connection.send((sequence, None, str(e)))
+        except (KeyboardInterrupt, EOFError):
+            pass
+        finally:
+            connection.close()
+
+    def _store_result(self, slot, processed_data):
+        if not isinstance(processed_data, dict):
+            return processed_data
+        processed_data = processed_data.copy()
+        offset = slot * self.slot_size + self.input_size
+        end = offset + self.output_size
+        for key, value in processed_data.items():
+            if isinstance(value, numpy.ndarray) and (value.nbytes >= _MIN_SHARED_ARRAY_SIZE) and \
+                    (not value.dtype.hasobject) and (offset + value.nbytes <= end):
+                numpy.copyto(numpy.ndarray(value.shape, value.dtype, self._ring, offset), value)
+                processed_data[key] = _SharedArray(offset, value.shape, value.dtype.str)
+                offset += _align(value.nbytes, _ARRAY_ALIGNMENT)
+        return processed_data
+
+    def _load_result(self, processed_data):
+        if isinstance(processed_data, dict):
+            for key, value in processed_data.items():
+                if isinstance(value, _SharedArray):
+                    processed_data[key] = numpy.ndarray(value.shape, value.dtype, self._ring, value.offset).copy()
+        return processed_data
+
+    def _receive_results(self):
+        connections = list(self._connections)
+        while connections:
+            for connection in wait(connections, timeout=config.PROCESS_POLL_INTERVAL):
+                try:
+                    sequence, processed_data, error = connection.recv()
+                except (EOFError, OSError):
+                    connections.remove(connection)
+                    if not self._closed:
+                        _logger.error("Processing worker %d exited" % (self._connections.index(connection),))
+                        if self._stop_event is not None:
+                            self._stop_event.set()
+                    continue
+                with self._lock:
+                    self._pending[self._connections.index(connection)] -= 1
+                    slot, pulse_id, context = self._submitted.pop(sequence)
+                if error is not None:
+                    _logger.error("Error processing PID %d: %s" % (pulse_id, error))
+                    if self._stop_event is not None:
+                        self._stop_event.set()
+                    processed_data = None
+                self._results[sequence] = (pulse_id, self._load_result(processed_data), context)
+                # Once the result is copied out of the ring the slot can be reused.
+                self._free_slots.append(slot)
+                self._deliver_results()
+
+    def _deliver_results(self):
+        while self._next_sequence in self._results:
+            pulse_id, processed_data, context = self._results.pop(self._next_sequence)
+            self._next_sequence += 1
+            if processed_data is not None:
+                try:
+                    self._on_result(pulse_id, processed_data, context)
+                except Exception as e:
+                    _logger.error("Error delivering result of PID %d: %s" % (pulse_id, str(e)))
+                    if self._stop_event is not None:
+                        self._stop_event.set()
+
+    def close(self, timeout=config.PROCESS_COMMUNICATION_TIMEOUT):
+        """
+        Stops the workers. Frames still being processed are delivered if the workers finish them within the timeout.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except:
+                pass
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._result_thread.join(timeout)
+        for connection in self._connections:
+            connection.close()
+        try:
+            self._ring.close()
+        except BufferError:
+            # Arrays still referencing the ring: released when garbage collected.
+            pass
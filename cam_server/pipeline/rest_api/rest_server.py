@@ -1,4 +1,3 @@
-import base64
 import json
 import logging
 import pickle
@@ -6,12 +5,13 @@ import bottle
 import numpy
 from bottle import request, response
 from io import BytesIO
-from PIL import Image
 
 from cam_server import config
 from cam_server.instance_management import rest_api
-from cam_server.pipeline.data_processing.functions import get_png_from_image
-from cam_server.utils import register_logs_rest_interface
+from cam_server.pipeline.data_processing.functions import get_png_from_image, get_preview_from_image, \
+    get_preview_format, PREVIEW_FORMATS
+from cam_server.utils import register_logs_rest_interface, get_image_bytes_response
+from cam_server_client.utils import get_image_bytes
 
 _logger = logging.getLogger(__name__)
 
@@ -243,11 +243,13 @@ def register_rest_interface(app, instance_manager, interface_prefix=None):
     @app.get(api_root_address + '/background/<background_name>/image')
     def get_background_image(background_name):
         """
-        Return a background file in PNG format. URL parameters available:
-        scale=[float], min_value=[float], max_value[float], colormap[string].
+        Return a background file in PNG (default), JPEG or WebP format. URL parameters available:
+        scale=[float], min_value=[float], max_value[float], colormap[string],
+        format=[png|jpeg|webp], compression=[0-9] (PNG), quality=[1-100] (JPEG/WebP), decimation=[int],
+        legacy (previous PNG renderer).
         Colormap: See http://matplotlib.org/examples/color/colormaps_reference.html
         :param background_name: Background file name.
-        :return: PNG image.
+        :return: Image (PNG, JPEG or WebP).
         """
 
         scale = float(request.params["scale"]) if "scale" in request.params else None
@@ -257,28 +259,38 @@ def register_rest_interface(app, instance_manager, interface_prefix=None):
 
         image_raw_bytes = instance_manager.background_manager.get_background(background_name)
 
-        image = get_png_from_image(image_raw_bytes, scale, min_value, max_value, colormap_name)
+        if "legacy" in request.params:
+            image = get_png_from_image(image_raw_bytes, scale, min_value, max_value, colormap_name)
+            response.set_header('Content-type', 'image/png')
+            return image
 
-        response.set_header('Content-type', 'image/png')
+        image_format = get_preview_format(request.params.get("format"))
+        compression = int(request.params["compression"]) if "compression" in request.params else None
+        quality = int(request.params["quality"]) if "quality" in request.params else None
+        decimation = int(request.params["decimation"]) if "decimation" in request.params else None
+        image = get_preview_from_image(image_raw_bytes, scale, min_value, max_value, colormap_name, image_format,
+                                       compression, quality, decimation)
+
+        response.set_header('Content-type', PREVIEW_FORMATS[image_format])
         return image
 
     @app.get(api_root_address + '/background/<background_name>/image_bytes')
     def get_background_image_bytes(background_name):
         """
-        Return the bytes of aa a background file.
+        Return the bytes of aa a background file. URL parameters available: format=[raw|npy] (binary response, also
+        selected with the Accept header, compressed according to Accept-Encoding: bitshuffle_lz4 or lz4).
         :param background_name: Background file name.
-        :return: JSON with details and byte stream.
+        :return: JSON with details and byte stream, or binary image.
         """
         image_bytes = instance_manager.background_manager.get_background(background_name)
 
-        base64_bytes = base64.b64encode(image_bytes)
-        image_shape = image_bytes.shape
-        image_dtype = image_bytes.dtype.descr[0][1]
+        binary_response = get_image_bytes_response(image_bytes)
+        if binary_response is not None:
+            return binary_response
+
         return {"state": "ok",
                 "status": "Background file '%s'." % background_name,
-                "image": {"bytes": base64_bytes.decode("utf-8"),
-                          "shape": image_shape,
-                          "dtype": image_dtype}}
+                "image": get_image_bytes(image_bytes)}
 
 
     @app.put(api_root_address + '/background/<background_name>/image_bytes')
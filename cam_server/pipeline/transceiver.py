@@ -4,8 +4,9 @@ from imp import load_source
 import time
 import sys
 import os
-from collections import deque, OrderedDict
+from collections import OrderedDict, deque
 from threading import Thread, Event, RLock
+from multiprocessing import Value
 
 import numpy
 import json
@@ -16,10 +17,13 @@ from bsread.sender import Sender
 
 from cam_server import config
 from cam_server.pipeline.data_processing.processor import process_image as default_image_process_function
-from cam_server.pipeline.data_processing.pre_processor import process_image as pre_process_image
-from cam_server.utils import get_host_port_from_stream_address, set_statistics, on_message_sent, init_statistics, MaxLenDict
+from cam_server.pipeline.data_processing.pre_processor import process_image as pre_process_image, PreProcessingPlan
+from cam_server.pipeline.data_processing.fitting import GaussFitState
+from cam_server.utils import get_host_port_from_stream_address, set_statistics, on_message_sent, init_statistics, FrameQueue, \
+    ReorderBuffer, PulseIdJoin
 from cam_server.writer import WriterSender, UNDEFINED_NUMBER_OF_RECORDS, LAYOUT_DEFAULT, LOCALTIME_DEFAULT, CHANGE_DEFAULT
-from cam_server.pipeline.data_processing.functions import chunk_copy, is_number, binning
+from cam_server.pipeline.data_processing.functions import chunk_copy, is_number, binning, BufferPool, ImageAverager
+from cam_server.pipeline.processing_pool import ProcessingPool
 
 from cam_server.ipc import IpcSource
 
@@ -144,6 +148,8 @@ def get_function(pipeline_parameters, user_scripts_manager, log_tag):
     if not name:
         if pipeline_parameters.get("pipeline_type") == config.PIPELINE_TYPE_STREAM:
             return None
+        if pipeline_parameters.get("pipeline_type") == config.PIPELINE_TYPE_MULTI_CAMERA:
+            return merge_images
         return default_image_process_function
     try:
         f = functions.get(name)
@@ -170,6 +176,14 @@ def get_function(pipeline_parameters, user_scripts_manager, log_tag):
         _logger.exception("Could not import function: %s. %s" % (str(name), log_tag))
         return None
 
+def get_image_averager(pipeline_parameters):
+    averaging = pipeline_parameters.get("averaging")
+    if not averaging:
+        return None
+    return ImageAverager(abs(averaging), continuous=averaging < 0,
+                         exponential=pipeline_parameters.get("averaging_mode") == "exponential")
+
+
 def create_source(camera_stream_address, receive_timeout=config.PIPELINE_RECEIVE_TIMEOUT, mode=SUB):
     source_host, source_port = get_host_port_from_stream_address(camera_stream_address)
     if camera_stream_address.startswith("ipc"):
@@ -188,7 +202,16 @@ def processing_pipeline(stop_event, statistics, parameter_queue,
     sender = None
     number_processing_threads = 0
     processing_thread_index = 0
+    number_processing_workers = 0
+    processing_pool = None
     exit_code = 0
+    # Work buffers of the pre-processing, reused across frames.
+    buffer_pool = BufferPool()
+    # Warm start state of the gaussian fits of the default function, per processing thread index.
+    fit_states = {}
+    # Frames processed without copying the received image. In shared memory, as it is counted by the processing
+    # threads and also by the processing workers.
+    copies_avoided = Value("q", 0)
 
 
     def connect_to_camera():
@@ -213,10 +236,9 @@ def processing_pipeline(stop_event, statistics, parameter_queue,
         sender = create_sender(pipeline_parameters, output_stream_port, stop_event, log_tag)
         try:
             while not stop_event.is_set():
-                if len(message_buffer) == 0:
-                    time.sleep(0.01)
-                else:
-                    (processed_data, timestamp, pulse_id) = message_buffer.popleft()
+                message = message_buffer.get(config.PROCESS_POLL_INTERVAL)
+                if message is not None:
+                    (processed_data, timestamp, pulse_id) = message
                     send(sender, processed_data, timestamp, pulse_id, pipeline_parameters, statistics)
 
         except Exception as e:
@@ -230,29 +252,16 @@ def processing_pipeline(stop_event, statistics, parameter_queue,
                     pass
             _logger.info("Exit message buffer send thread")
 
-    def process_bsbuffer(bs_buffer, bs_img_buffer, sender):
-        i = 0
-        while i < len(bs_buffer):
-            bs_pid, bsdata = bs_buffer[i]
-            for j in range(len(bs_img_buffer)):
-                img_pid = bs_img_buffer[0][0]
-                if img_pid < bs_pid:
-                    bs_img_buffer.popleft()
-                elif img_pid == bs_pid:
-                    [pulse_id, [function, global_timestamp, global_timestamp_float, image, pulse_id, x_axis, y_axis, pipeline_parameters]] = bs_img_buffer.popleft()
-                    stream_data = OrderedDict()
-                    for key, value in bsdata.items():
-                        stream_data[key] = value.value
-                    on_receive_data(function, global_timestamp, global_timestamp_float, sender, None, image, pulse_id, x_axis, y_axis, pipeline_parameters, stream_data)
-                    for k in range(i):
-                        bs_buffer.popleft()
-                    i = -1
-                    break
-                else:
-                    break
-            i = i + 1
+    def process_bs_join(joined, sender):
+        # The join is completed either by the image (receive thread) or by the data (bs send thread).
+        function, global_timestamp, global_timestamp_float, image, pulse_id, x_axis, y_axis, pipeline_parameters = joined["image"]
+        stream_data = OrderedDict()
+        for key, value in joined["data"].items():
+            stream_data[key] = value.value
+        with bs_lock:
+            on_receive_data(function, global_timestamp, global_timestamp_float, sender, None, image, pulse_id, x_axis, y_axis, pipeline_parameters, stream_data)
 
-    def bs_send_task(bs_buffer, bs_img_buffer, bsread_address, bsread_channels, bsread_mode, dispatcher_parameters, stop_event):
+    def bs_send_task(bs_join, bsread_address, bsread_channels, bsread_mode, dispatcher_parameters, stop_event):
         dispatcher_url, dispatcher_verify_request, dispatcher_disable_compression = dispatcher_parameters
         nonlocal sender
         if bsread_address:
@@ -280,11 +289,12 @@ def processing_pipeline(stop_event, statistics, parameter_queue,
                     message = stream.receive()
                     if not message or stop_event.is_set():
                         continue
-                    bs_buffer.append([message.data.pulse_id, message.data.data])
-                    try:
-                        process_bsbuffer(bs_buffer, bs_img_buffer, sender)
-                    except Exception as e:
-                        _logger.error("Error processing bs buffer: " + str(e))
+                    joined = bs_join.put("data", message.data.pulse_id, message.data.data)
+                    if joined is not None:
+                        try:
+                            process_bs_join(joined, sender)
+                        except Exception as e:
+                            _logger.error("Error processing bs data: " + str(e))
 
         except Exception as e:
             _logger.error("Error on bs_send_task: " + str(e))
@@ -300,6 +310,8 @@ def processing_pipeline(stop_event, statistics, parameter_queue,
 
     def process_pipeline_parameters():
         parameters = get_pipeline_parameters(pipeline_config)
+        buffer_pool.clear()
+        fit_states.clear()
         _logger.debug("Processing pipeline parameters %s. %s" % (parameters, log_tag))
 
         background_array = None
@@ -376,27 +388,18 @@ def processing_pipeline(stop_event, statistics, parameter_queue,
             else:
                 parameters["bsread_data_buf"] =config.BSREAD_DATA_BUFFER_SIZE_DEFAULT
 
-        return parameters, background_array
+        return parameters, background_array, PreProcessingPlan(parameters, background_array)
 
-    def process_thread_task(thread_buffer, tx_buffer, tx_buffer_lock, stop_event, index):
+    def process_thread_task(thread_buffer, reorder_buffer, stop_event, index):
         _logger.info("Start processing thread %d" % index)
         try:
             while not stop_event.is_set():
-                if len(thread_buffer) == 0:
-                    time.sleep(0.01)
-                else:
-                    (function, global_timestamp, global_timestamp_float, sender, message_buffer, image, pulse_id, x_axis, y_axis, parameters, bsdata) = thread_buffer.popleft()
+                frame = thread_buffer.get(config.PROCESS_POLL_INTERVAL)
+                if frame is not None:
+                    (function, global_timestamp, global_timestamp_float, sender, message_buffer, image, pulse_id, x_axis, y_axis, parameters, bsdata) = frame
 
                     processed_data = process_image(image, x_axis, y_axis, pulse_id, global_timestamp_float, bsdata, thread_index=index)
-                    if processed_data is None:
-                        with tx_buffer_lock:
-                            try:
-                                received_pids.remove(pulse_id)
-                            except:
-                                _logger.warning("Error removing PID %d at %d" % (pulse_id, index))
-                    else:
-                        with tx_buffer_lock:
-                            tx_buffer[pulse_id]= (processed_data, global_timestamp, pulse_id, message_buffer)
+                    reorder_buffer.put(pulse_id, None if (processed_data is None) else (processed_data, global_timestamp, message_buffer))
 
         except Exception as e:
             _logger.error("Error on processing thread %d: %s" % (index, str(e)))
@@ -404,32 +407,17 @@ def processing_pipeline(stop_event, statistics, parameter_queue,
             stop_event.set()
             _logger.info("Exit processing thread %d" % index)
 
-    def threaded_processing_send_task(tx_buffer, tx_buffer_lock, stop_event):
+    def threaded_processing_send_task(reorder_buffer, stop_event):
         nonlocal sender
         _logger.info("Start threaded processing send thread")
         sender = create_sender(pipeline_parameters, output_stream_port, stop_event, log_tag)
-        #last_pid = None
-        #interval = 1
-        #threshold = int(tx_buffer.maxlen * 0.5)
         try:
             while not stop_event.is_set():
-                tx = None
-                popped = False
-                with tx_buffer_lock:
-                    size = len(tx_buffer)
-                    if (size > 0) and (len(received_pids) > 0):
-                        pid = received_pids[0]
-                        if pid in tx_buffer.keys():
-                            received_pids.popleft()
-                            tx = (processed_data, global_timestamp, pulse_id, message_buffer) = tx_buffer.pop(pid)
-                        else:
-                            if size >= tx_buffer.maxlen:
-                                received_pids.popleft()
-                                popped = True
-                if tx is not None:
+                # Woken up by the processing threads when a frame is processed, or at the deadline of the next PID.
+                released = reorder_buffer.get(config.PROCESS_POLL_INTERVAL)
+                if released is not None:
+                    pulse_id, (processed_data, global_timestamp, message_buffer) = released
                     send_data(sender, processed_data, global_timestamp, pulse_id, message_buffer)
-                elif not popped:
-                    time.sleep(0.001)
 
         except Exception as e:
             _logger.error("Error on threaded processing send thread" + str(e))
@@ -459,16 +447,37 @@ def processing_pipeline(stop_event, statistics, parameter_queue,
                     processed_data.pop(field, None)
 
             last_sent_timestamp = time.time()
-            if message_buffer:
+            if message_buffer is not None:
                 message_buffer.append((processed_data, global_timestamp, pulse_id))
             else:
                 send(sender, processed_data, global_timestamp, pulse_id, pipeline_parameters, statistics)
             _logger.debug("Sent PID %d" % (pulse_id,))
 
+    def get_fit_state(thread_index):
+        # The fits of a thread continue from its own previous frame.
+        fit_state = fit_states.get(thread_index)
+        if fit_state is None:
+            fit_state = fit_states[thread_index] = GaussFitState()
+        return fit_state
+
     def process_image(image, x_axis, y_axis, pulse_id, global_timestamp_float, bsdata, thread_index=0):
         try:
-            image, x_axis, y_axis = pre_process_image(image, pulse_id, global_timestamp_float, x_axis, y_axis, pipeline_parameters, image_background_array)
-            processed_data = function(image, pulse_id, global_timestamp_float, x_axis, y_axis, pipeline_parameters, bsdata)
+            copied = pre_processing_plan.is_copy_needed(image)
+            image, x_axis, y_axis = pre_process_image(image, pulse_id, global_timestamp_float, x_axis, y_axis, pipeline_parameters, image_background_array, buffer_pool, pre_processing_plan)
+            if (not image.flags.writeable) and (function is not default_image_process_function):
+                # User functions may modify the image in place.
+                # If image is greater that the huge page size (2MB) then image copy makesCPU consumption increase by orders
+                # of magnitude. Perform a copy in chunks instead, where each chunk is smaller than 2MB
+                image = chunk_copy(image)
+                copied = True
+            if not copied:
+                with copies_avoided.get_lock():
+                    copies_avoided.value += 1
+            if function is default_image_process_function:
+                processed_data = function(image, pulse_id, global_timestamp_float, x_axis, y_axis, pipeline_parameters,
+                                          bsdata, fit_state=get_fit_state(thread_index))
+            else:
+                processed_data = function(image, pulse_id, global_timestamp_float, x_axis, y_axis, pipeline_parameters, bsdata)
             _logger.debug("Processed PID %d at thread %d" % (pulse_id, thread_index))
             return processed_data
         except Exception as e:
@@ -476,18 +485,39 @@ def processing_pipeline(stop_event, statistics, parameter_queue,
             if pipeline_parameters.get("abort_on_error", config.ABORT_ON_ERROR):
                 raise
 
-    def on_receive_data(function, global_timestamp, global_timestamp_float, sender, message_buffer, image, pulse_id, x_axis, y_axis, parameters, bsdata=None):
-        nonlocal number_processing_threads, processing_thread_index, received_pids
+    def update_processing(parameters, background_array):
+        # Called in the processing workers when the pipeline parameters change.
+        nonlocal pipeline_parameters, image_background_array, pre_processing_plan, function
+        buffer_pool.clear()
+        fit_states.clear()
+        pipeline_parameters, image_background_array = parameters, background_array
+        pre_processing_plan = PreProcessingPlan(parameters, background_array)
+        function = get_function(parameters, user_scripts_manager, log_tag)
+
+    def on_processed_data(pulse_id, processed_data, context):
+        global_timestamp, message_buffer = context
+        send_data(sender, processed_data, global_timestamp, pulse_id, message_buffer)
 
+    def on_receive_data(function, global_timestamp, global_timestamp_float, sender, message_buffer, image, pulse_id, x_axis, y_axis, parameters, bsdata=None):
+        nonlocal number_processing_threads, processing_thread_index, processing_pool
+
+        if number_processing_workers > 0:
+            if processing_pool is None:
+                # Created with the first frame, when the frame size is known. The workers are forked with the current
+                # processing state and then follow the parameter changes.
+                processing_pool = ProcessingPool(number_processing_workers, image.nbytes, process_image,
+                                                 on_processed_data, update_processing, stop_event=stop_event)
+            processing_pool.submit(image, pulse_id, global_timestamp_float, x_axis, y_axis, bsdata,
+                                   (global_timestamp, message_buffer))
+            return
         if number_processing_threads > 0:
             thread_buffer = thread_buffers[processing_thread_index]
             processing_thread_index = processing_thread_index+1
             if processing_thread_index>=number_processing_threads:
                 processing_thread_index = 0
-            #Deque append and popleft are supposed to be thread safe
+            # The PID is registered before the frame is handed over: it can be processed immediately.
+            reorder_buffer.expect(pulse_id)
             thread_buffer.append((function, global_timestamp, global_timestamp_float, sender, message_buffer, image, pulse_id, x_axis, y_axis, parameters, bsdata))
-            with tx_buffer_lock:
-                received_pids.append(pulse_id)
             return
         processed_data = process_image(image, x_axis, y_axis, pulse_id, global_timestamp_float, bsdata)
         if processed_data is not None:
@@ -496,20 +526,24 @@ def processing_pipeline(stop_event, statistics, parameter_queue,
 
     source, sender = None, None
     message_buffer, message_buffer_send_thread  = None, None
-    bs_buffer, bs_img_buffer, bs_send_thread = None, None, None
+    bs_join, bs_send_thread = None, None
+    bs_lock = RLock()
     processing_threads = []
+    # Hand-off queues between the threads, reported in the statistics.
+    queues = []
 
     try:
         init_statistics(statistics)
 
-        pipeline_parameters, image_background_array = process_pipeline_parameters()
+        pipeline_parameters, image_background_array, pre_processing_plan = process_pipeline_parameters()
 
         current_pid, former_pid = None, None
         connect_to_camera()
 
         _logger.debug("Opening output stream on port %d. %s" % (output_stream_port, log_tag))
 
-        number_processing_threads = pipeline_parameters.get("processing_threads", 0)
+        number_processing_workers = pipeline_parameters.get("processing_workers") or 0
+        number_processing_threads = 0 if number_processing_workers > 0 else pipeline_parameters.get("processing_threads", 0)
         thread_buffers = None if number_processing_threads==0 else []
         bsread_address = pipeline_parameters.get("bsread_address")
         bsread_channels = pipeline_parameters.get("bsread_channels")
@@ -527,29 +561,39 @@ def processing_pipeline(stop_event, statistics, parameter_queue,
 
         image_with_stream = bsread_address or (bsread_channels is not None)
         if image_with_stream:
-            bs_buffer = deque(maxlen=pipeline_parameters["bsread_data_buf"] )
-            bs_img_buffer = deque(maxlen=pipeline_parameters["bsread_image_buf"] )
-            bs_send_thread = Thread(target=bs_send_task, args=(bs_buffer, bs_img_buffer, bsread_address, bsread_channels, bsread_mode, dispatcher_parameters, stop_event))
+            # Images and bsread data waiting to be merged, joined by pulse id.
+            bs_join = PulseIdJoin(["image", "data"],
+                                  max_age=pipeline_parameters.get("bsread_timeout", config.BSREAD_JOIN_TIMEOUT),
+                                  pid_window=pipeline_parameters.get("bsread_pid_window", config.BSREAD_JOIN_PID_WINDOW),
+                                  max_length={"image": pipeline_parameters.get("bsread_image_buf", config.BSREAD_IMAGE_BUFFER_SIZE_DEFAULT),
+                                              "data": pipeline_parameters.get("bsread_data_buf", config.BSREAD_DATA_BUFFER_SIZE_DEFAULT)},
+                                  max_bytes={"image": pipeline_parameters.get("bsread_image_buf_mb", config.BSREAD_IMAGE_BUFFER_MB_DEFAULT) * 1024 * 1024})
+            queues.append(bs_join)
+            bs_send_thread = Thread(target=bs_send_task, args=(bs_join, bsread_address, bsread_channels, bsread_mode, dispatcher_parameters, stop_event))
             bs_send_thread.start()
 
         else:
             buffer_size = pipeline_parameters.get("buffer_size")
             if buffer_size:
-                message_buffer = deque(maxlen=buffer_size)
+                message_buffer = FrameQueue(maxlen=buffer_size)
+                queues.append(message_buffer)
                 message_buffer_send_thread = Thread(target=message_buffer_send_task, args=(message_buffer, stop_event))
                 message_buffer_send_thread.start()
             elif number_processing_threads > 0:
-                tx_buffer_lock = RLock()
                 processing_thread_index=0
                 thread_buffer_size = pipeline_parameters.get("thread_buffer_size", 10)
-                received_pids = deque()
-                tx_buffer = MaxLenDict(maxlen=(thread_buffer_size * number_processing_threads))
-                message_buffer_send_thread = Thread(target=threaded_processing_send_task, args=(tx_buffer, tx_buffer_lock, stop_event))
+                reorder_timeout = pipeline_parameters.get("reorder_timeout")
+                reorder_buffer = ReorderBuffer(maxlen=(thread_buffer_size * number_processing_threads),
+                                               timeout=(reorder_timeout / 1000.0) if reorder_timeout else None,
+                                               emit_late=pipeline_parameters.get("reorder_mode") == "emit")
+                queues.append(reorder_buffer)
+                message_buffer_send_thread = Thread(target=threaded_processing_send_task, args=(reorder_buffer, stop_event))
                 message_buffer_send_thread.start()
                 for i in range(number_processing_threads):
-                    thread_buffer = deque(maxlen=thread_buffer_size)
+                    thread_buffer = FrameQueue(maxlen=thread_buffer_size)
                     thread_buffers.append(thread_buffer)
-                    processing_thread = Thread(target=process_thread_task, args=(thread_buffer, tx_buffer, tx_buffer_lock, stop_event, i))
+                    queues.append(thread_buffer)
+                    processing_thread = Thread(target=process_thread_task, args=(thread_buffer, reorder_buffer, stop_event, i))
                     processing_threads.append(processing_thread)
                     processing_thread.start()
             else:
@@ -560,14 +604,17 @@ def processing_pipeline(stop_event, statistics, parameter_queue,
         last_sent_timestamp = 0
         last_rcvd_timestamp = time.time()
 
-        image_buffer = []
+        image_averager = get_image_averager(pipeline_parameters)
 
         while not stop_event.is_set():
             try:
                 while not parameter_queue.empty():
                     new_parameters = parameter_queue.get()
                     pipeline_config.set_configuration(new_parameters)
-                    pipeline_parameters, image_background_array = process_pipeline_parameters()
+                    pipeline_parameters, image_background_array, pre_processing_plan = process_pipeline_parameters()
+                    image_averager = get_image_averager(pipeline_parameters)
+                    if processing_pool is not None:
+                        processing_pool.update(pipeline_parameters, image_background_array)
                 frame_shape = None
                 data = source.receive()
                 if data:
@@ -575,7 +622,7 @@ def processing_pipeline(stop_event, statistics, parameter_queue,
                     if image is not None:
                         frame_shape = str(image.shape[1]) + "x" + str(image.shape[0]) + "x" + str(image.itemsize)
                     last_rcvd_timestamp = time.time()
-                set_statistics(statistics, sender, data.statistics.total_bytes_received if data else statistics.total_bytes,  1 if data else 0, frame_shape)
+                set_statistics(statistics, sender, data.statistics.total_bytes_received if data else statistics.total_bytes,  1 if data else 0, frame_shape, copies_avoided.value, queues)
 
                 if not data:
                     timeout = pipeline_parameters.get("camera_timeout")
@@ -643,39 +690,26 @@ def processing_pipeline(stop_event, statistics, parameter_queue,
                 if function is None:
                     return
 
-                # Make a copy if the original image (can be used by multiple pipelines)
-                # image = numpy.array(image)
-
-                # If image is greater that the huge page size (2MB) then image copy makesCPU consumption increase by orders
-                # of magnitude. Perform a copy in chunks instead, where each chunk is smaller than 2MB
-                image = chunk_copy(image)
-
-                averaging = pipeline_parameters.get("averaging")
-                if averaging:
-                    continuous = averaging < 0
-                    averaging = abs(averaging)
-                    if continuous and (len(image_buffer) >= averaging):
-                        image_buffer.pop(0)
-                    image_buffer.append(image)
-                    if (len(image_buffer) >= averaging) or (continuous):
-                        try:
-                            frames = numpy.array(image_buffer)
-                            image = numpy.average(frames, 0)
-                        except:
-                            #Different shapes
-                            image_buffer = []
-                            continue
-                    else:
+                if image_averager is not None:
+                    # The averager copies the image into its own buffers.
+                    image = image_averager.add(image, buffer_pool)
+                    if image is None:
                         continue
-                if (not averaging) or (not continuous):
-                    image_buffer = []
+                elif not getattr(source, "copy", True):
+                    # The receive buffer is not private: it must not be modified in place. The image is only copied
+                    # if a processing stage would modify it (a read-only image is never modified in place).
+                    image = image.view()
+                    image.flags.writeable = False
 
                 # image, x_axis, y_axis = pre_process_image(image, x_axis, y_axis, image_background_array, pipeline_parameters)
                 if image_with_stream:
-                    bs_img_buffer.append([pulse_id,
-                                          [function, global_timestamp, global_timestamp_float, image, pulse_id, x_axis,
-                                           y_axis,
-                                           pipeline_parameters]])
+                    joined = bs_join.put("image", pulse_id, [function, global_timestamp, global_timestamp_float, image,
+                                                             pulse_id, x_axis, y_axis, pipeline_parameters], image.nbytes)
+                    if joined is not None:
+                        try:
+                            process_bs_join(joined, sender)
+                        except Exception as e:
+                            _logger.error("Error processing bs data: " + str(e))
                 else:
                     on_receive_data(function, global_timestamp, global_timestamp_float, sender, message_buffer, image,
                                  pulse_id, x_axis, y_axis, pipeline_parameters)
@@ -701,6 +735,12 @@ def processing_pipeline(stop_event, statistics, parameter_queue,
             except:
                 pass
 
+        if processing_pool is not None:
+            try:
+                processing_pool.close()
+            except:
+                pass
+
         if message_buffer_send_thread:
             try:
                 message_buffer_send_thread.join(0.1)
@@ -911,10 +951,177 @@ def stream_pipeline(stop_event, statistics, parameter_queue,
         sys.exit(exit_code)
 
 
+def merge_images(images, pulse_id, timestamp, x_axis, y_axis, parameters):
+    # Default function of the multi camera pipelines: forwards the synchronized images.
+    merged_data = OrderedDict()
+    for camera_name, image in images.items():
+        merged_data[camera_name + config.EPICS_PV_SUFFIX_IMAGE] = image
+        merged_data[camera_name + ":x_axis"] = x_axis[camera_name]
+        merged_data[camera_name + ":y_axis"] = y_axis[camera_name]
+    return merged_data
+
+
+def multi_camera_pipeline(stop_event, statistics, parameter_queue,
+                          cam_client, pipeline_config, output_stream_port, background_manager, user_scripts_manager=None):
+    sender = None
+    exit_code = 0
+    receive_threads = []
+    # Protects the synchronization, the parameters and the statistics.
+    lock = RLock()
+    # Serializes the processing and sending of the synchronized frames, done outside of lock.
+    process_lock = RLock()
+    # Synchronized frames waiting to be processed, in the order they were joined.
+    joined_frames = deque()
+
+    parameters = get_pipeline_parameters(pipeline_config)
+    camera_names = list(parameters["camera_names"])
+    log_tag = " [" + ",".join(camera_names) + " | " + str(pipeline_config.get_name()) + ":" + str(output_stream_port) + "]"
+    total_bytes = [0] * len(camera_names)
+    # Parameters of the synchronization: changing them recreates it.
+    sync_parameters = ("sync_timeout", "sync_pid_window", "sync_buffer_mb")
+
+    def get_sync(parameters):
+        # Frames of the cameras waiting for the frames of the other cameras with the same pulse id.
+        return PulseIdJoin(camera_names,
+                           max_age=parameters.get("sync_timeout", config.PIPELINE_SYNC_TIMEOUT),
+                           pid_window=parameters.get("sync_pid_window", config.PIPELINE_SYNC_PID_WINDOW),
+                           max_bytes=parameters.get("sync_buffer_mb", config.PIPELINE_SYNC_BUFFER_MB) * 1024 * 1024)
+
+    def process_frames(frames, pulse_id):
+        parameters = get_parameters()
+        images, x_axis, y_axis = OrderedDict(), OrderedDict(), OrderedDict()
+        for camera_name in camera_names:
+            images[camera_name], x_axis[camera_name], y_axis[camera_name], _ = frames[camera_name]
+        global_timestamp, global_timestamp_float = frames[camera_names[0]][3]
+        function = get_function(parameters, user_scripts_manager, log_tag)
+        if function is None:
+            return
+        try:
+            processed_data = function(images, pulse_id, global_timestamp_float, x_axis, y_axis, parameters)
+        except Exception as e:
+            _logger.warning("Error processing PID %d: %s. %s" % (pulse_id, str(e), log_tag))
+            if parameters.get("abort_on_error", config.ABORT_ON_ERROR):
+                raise
+            return
+        if processed_data is not None:
+            send(sender, processed_data, global_timestamp, pulse_id, parameters, statistics)
+
+    def get_parameters():
+        with lock:
+            return parameters
+
+    def receive_task(index, camera_name):
+        source = None
+        _logger.info("Start receive thread of camera %s. %s" % (camera_name, log_tag))
+        try:
+            source = create_source(cam_client.get_instance_stream(camera_name))
+            source.connect()
+            last_rcvd_timestamp = time.time()
+            while not stop_event.is_set():
+                data = source.receive()
+                with lock:
+                    if data:
+                        total_bytes[index] = data.statistics.total_bytes_received
+                    set_statistics(statistics, sender, sum(total_bytes), 1 if data else 0, queues=[sync])
+                if not data:
+                    timeout = parameters.get("camera_timeout", 10.0)
+                    if timeout and (timeout > 0) and (time.time() - last_rcvd_timestamp) > timeout:
+                        _logger.warning("Camera %s timeout. %s" % (camera_name, log_tag))
+                        source.disconnect()
+                        source = create_source(cam_client.get_instance_stream(camera_name))
+                        source.connect()
+                        last_rcvd_timestamp = time.time()
+                    continue
+                last_rcvd_timestamp = time.time()
+                image = data.data.data["image"].value
+                if (image is None) or parameters.get("pause"):
+                    continue
+                if not getattr(source, "copy", True):
+                    # The receive buffer is reused: the image must be copied to wait for the other cameras.
+                    image = chunk_copy(image)
+                pulse_id = data.data.pulse_id
+                frame = (image, data.data.data["x_axis"].value, data.data.data["y_axis"].value,
+                         ((data.data.global_timestamp, data.data.global_timestamp_offset),
+                          data.data.data["timestamp"].value))
+                with lock:
+                    frames = sync.put(camera_name, pulse_id, frame, image.nbytes)
+                    if frames is not None:
+                        joined_frames.append((frames, pulse_id))
+                if frames is not None:
+                    # The frames are processed by the receive thread of the last camera, one pulse id at a time,
+                    # while the other receive threads keep on synchronizing.
+                    with process_lock:
+                        while joined_frames:
+                            process_frames(*joined_frames.popleft())
+        except ProcessingCompleated:
+            pass
+        except Exception as e:
+            _logger.exception("Error on receive thread of camera %s: %s. %s" % (camera_name, str(e), log_tag))
+        finally:
+            stop_event.set()
+            if source:
+                try:
+                    source.disconnect()
+                except:
+                    pass
+            _logger.info("Exit receive thread of camera %s. %s" % (camera_name, log_tag))
+
+    try:
+        init_statistics(statistics)
+        sync = get_sync(parameters)
+
+        _logger.debug("Opening output stream on port %d. %s" % (output_stream_port, log_tag))
+        sender = create_sender(parameters, output_stream_port, stop_event, log_tag)
+
+        # Indicate that the startup was successful.
+        stop_event.clear()
+
+        for index, camera_name in enumerate(camera_names):
+            receive_thread = Thread(target=receive_task, args=(index, camera_name))
+            receive_threads.append(receive_thread)
+            receive_thread.start()
+
+        _logger.debug("Transceiver started. %s" % log_tag)
+
+        while not stop_event.is_set():
+            if parameter_queue.empty():
+                stop_event.wait(config.PROCESS_POLL_INTERVAL)
+                continue
+            new_parameters = parameter_queue.get()
+            pipeline_config.set_configuration(new_parameters)
+            with lock:
+                previous_parameters, parameters = parameters, get_pipeline_parameters(pipeline_config)
+                if any(parameters.get(name) != previous_parameters.get(name) for name in sync_parameters):
+                    _logger.info("Synchronization parameters changed: discarding %d frames. %s" % (len(sync), log_tag))
+                    sync = get_sync(parameters)
+
+        _logger.info("Stopping transceiver. %s" % log_tag)
+
+    except:
+        _logger.exception("Exception while trying to start the receive and process threads. %s" % log_tag)
+        exit_code = 1
+        raise
+
+    finally:
+        stop_event.set()
+        for t in receive_threads:
+            try:
+                t.join(config.PIPELINE_RECEIVE_TIMEOUT / 1000.0 + 0.1)
+            except:
+                pass
+        if sender:
+            try:
+                sender.close()
+            except:
+                pass
+        sys.exit(exit_code)
+
+
 pipeline_name_to_pipeline_function_mapping = {
     config.PIPELINE_TYPE_PROCESSING: processing_pipeline,
     config.PIPELINE_TYPE_STORE: store_pipeline,
-    config.PIPELINE_TYPE_STREAM: stream_pipeline
+    config.PIPELINE_TYPE_STREAM: stream_pipeline,
+    config.PIPELINE_TYPE_MULTI_CAMERA: multi_camera_pipeline
 }
 
 
@@ -2,10 +2,11 @@ from itertools import cycle
 import logging
 from logging import getLogger
 from mflow.tools import ConnectionCountMonitor
-from cam_server_client.utils import get_host_port_from_stream_address
+from cam_server_client.utils import get_host_port_from_stream_address, encode_image, IMAGE_CONTENT_TYPES
 import os
 import collections
-from bottle import response
+import heapq
+from bottle import request, response
 
 try:
     import psutil
@@ -15,6 +16,9 @@ except:
 import os
 import shutil
 import time
+import math
+import ctypes
+from multiprocessing.sharedctypes import RawValue
 import numpy
 import ast
 from bottle import ServerAdapter
@@ -84,13 +88,85 @@ def get_clients(sender):
     return 0
 
 
+class _StatisticsRecord(ctypes.Structure):
+    _fields_ = [("total_bytes", ctypes.c_int64),
+                ("clients", ctypes.c_int64),
+                ("update_timestamp", ctypes.c_double),
+                ("throughput", ctypes.c_double),
+                ("frame_rate", ctypes.c_double),
+                ("rx_count", ctypes.c_int64),
+                ("tx_count", ctypes.c_int64),
+                ("tx_rate", ctypes.c_double),
+                ("frame_shape", ctypes.c_char * 32),
+                ("copies_avoided", ctypes.c_int64),
+                ("copies_avoided_rate", ctypes.c_double),
+                ("timestamp", ctypes.c_double),
+                ("pid", ctypes.c_int64),
+                ("cpu", ctypes.c_double),
+                ("memory", ctypes.c_int64),
+                ("queue_depth", ctypes.c_int64),
+                ("queue_wait", ctypes.c_double),
+                ("queue_dropped", ctypes.c_int64),
+                ("join_rate", ctypes.c_double),
+                ("join_miss_rate", ctypes.c_double),
+                ("join_expiry_rate", ctypes.c_double),
+                ("_frame_count", ctypes.c_int64),
+                ("_tx_count", ctypes.c_int64),
+                ("_last_proc_total_bytes", ctypes.c_int64)]
+
+
+_STATISTICS_FIELDS = dict(_StatisticsRecord._fields_)
+# Values representing None in the record.
+_STATISTICS_NULL = {ctypes.c_double: math.nan, ctypes.c_int64: -1}
+
+
+class Statistics(object):
+    """
+    Statistics of an instance, in a fixed-layout record in shared memory: the instance process writes the fields and
+    the manager process reads them, without a Manager server process. Same attributes as the statistics Namespace.
+    Each field is written by a single process, and the reads are not synchronized.
+    Attributes which are not fields of the record (e.g. _process) are local to each process.
+    """
+
+    def __init__(self):
+        object.__setattr__(self, "_record", RawValue(_StatisticsRecord))
+        object.__setattr__(self, "_process", None)
+
+    def __getstate__(self):
+        return {"_record": self._record}
+
+    def __setstate__(self, state):
+        object.__setattr__(self, "_record", state["_record"])
+        object.__setattr__(self, "_process", None)
+
+    def __getattr__(self, name):
+        field_type = _STATISTICS_FIELDS.get(name)
+        if field_type is None:
+            raise AttributeError(name)
+        value = getattr(self._record, name)
+        if name == "frame_shape":
+            return value.decode() or None
+        if (value == -1 and field_type == ctypes.c_int64) or (field_type == ctypes.c_double and math.isnan(value)):
+            return None
+        return value
+
+    def __setattr__(self, name, value):
+        field_type = _STATISTICS_FIELDS.get(name)
+        if field_type is None:
+            object.__setattr__(self, name, value)
+        elif name == "frame_shape":
+            self._record.frame_shape = str(value).encode()[:31] if value else b""
+        else:
+            setattr(self._record, name, _STATISTICS_NULL[field_type] if (value is None) else value)
+
+
 def on_message_sent(statistics):
     statistics.tx_count = statistics.tx_count + 1
 
-def set_statistics(statistics, sender, total_bytes, frame_count, frame_shape = None):
+def set_statistics(statistics, sender, total_bytes, frame_count, frame_shape = None, copies_avoided = None, queues = None):
     now = time.time()
     timespan = now - statistics.timestamp
-    statistics.update_timestamp = time.localtime()
+    statistics.update_timestamp = now
     statistics.total_bytes = total_bytes
     statistics.rx_count = statistics.rx_count + frame_count
     statistics._frame_count = statistics._frame_count + frame_count
@@ -104,6 +180,21 @@ def set_statistics(statistics, sender, total_bytes, frame_count, frame_shape = N
         statistics._frame_count = 0
         statistics.tx_rate = ((statistics.tx_count - statistics._tx_count) / timespan) if (timespan > 0) else 0
         statistics._tx_count = statistics.tx_count
+        if copies_avoided is not None:
+            statistics.copies_avoided_rate = ((copies_avoided - statistics.copies_avoided) / timespan) if (timespan > 0) else 0
+            statistics.copies_avoided = copies_avoided
+        if queues:
+            # Depth and dropped items of all the hand-off queues, and the longest mean wait time.
+            metrics = [queue.get_metrics() for queue in queues]
+            statistics.queue_depth = sum(m["max_depth"] for m in metrics)
+            statistics.queue_wait = max(m["wait_time"] for m in metrics)
+            statistics.queue_dropped = sum(m["dropped"] for m in metrics)
+            # Pulse id joins: rates of joined (hits), late (misses) and expired items.
+            joins = [m for m in metrics if "hits" in m]
+            if joins and (timespan > 0):
+                statistics.join_rate = sum(m["hits"] for m in joins) / timespan
+                statistics.join_miss_rate = sum(m["misses"] for m in joins) / timespan
+                statistics.join_expiry_rate = sum(m["expired"] for m in joins) / timespan
         statistics.timestamp = now
         if psutil and statistics._process:
             statistics.cpu = statistics._process.cpu_percent()
@@ -124,9 +215,17 @@ def init_statistics(statistics):
     statistics.tx_count = 0
     statistics._tx_count = 0
     statistics.frame_shape = None
+    statistics.copies_avoided = 0
+    statistics.copies_avoided_rate = 0
     statistics.pid = os.getpid()
     statistics.cpu = 0
     statistics.memory = 0
+    statistics.queue_depth = None
+    statistics.queue_wait = None
+    statistics.queue_dropped = None
+    statistics.join_rate = None
+    statistics.join_miss_rate = None
+    statistics.join_expiry_rate = None
     statistics.timestamp = time.time()
     if psutil:
         statistics._process = psutil.Process(os.getpid())
@@ -194,6 +293,30 @@ def register_logs_rest_interface(app, api_root_address):
         return logs
 
 
+def get_image_bytes_response(image):
+    """
+    Binary response of the image_bytes endpoints, if requested with the format parameter (raw or npy) or the Accept
+    header. The image is compressed according to Accept-Encoding.
+    :param image: Image to return.
+    :return: Response body, or None if the image must be returned as base64 in JSON.
+    """
+    image_format = request.params.get("format")
+    if image_format not in IMAGE_CONTENT_TYPES:
+        accept = request.headers.get("Accept", "")
+        image_format = None
+        for name, content_type in IMAGE_CONTENT_TYPES.items():
+            if content_type in accept:
+                image_format = name
+                break
+    if image_format is None:
+        return None
+
+    body, headers = encode_image(image, image_format, request.headers.get("Accept-Encoding"))
+    for name, value in headers.items():
+        response.set_header(name, value)
+    return body
+
+
 def remove(path, simulated=False):
     """
     Removes a file or directory.
@@ -261,6 +384,504 @@ class MaxLenDict(collections.OrderedDict):
                 self.popitem(last=False)
 
 
+class FrameQueue(object):
+    """
+    Bounded queue handing frames over between threads. The consumer blocks on a condition variable until an item is
+    available instead of polling, and when the queue is full the oldest item is dropped (as a deque with maxlen).
+    Keeps metrics of the depth, the dropped items and the time the items wait in the queue.
+    """
+
+    def __init__(self, maxlen):
+        self.maxlen = maxlen
+        self.dropped = 0
+        self.max_depth = 0
+        self._items = collections.deque()
+        self._condition = threading.Condition(threading.Lock())
+        self._wait_time = 0.0
+        self._wait_count = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def append(self, item):
+        with self._condition:
+            if (self.maxlen is not None) and (len(self._items) >= self.maxlen):
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append((time.perf_counter(), item))
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """
+        :param timeout: Maximum time to wait for an item in seconds. If None, waits forever.
+        :return: Oldest item, or None if the timeout expired.
+        """
+        with self._condition:
+            if not self._condition.wait_for(self._items.__len__, timeout):
+                return None
+            timestamp, item = self._items.popleft()
+            self._wait_time += time.perf_counter() - timestamp
+            self._wait_count += 1
+            return item
+
+    def clear(self):
+        with self._condition:
+            self._items.clear()
+
+    def get_metrics(self):
+        """
+        :return: Dict with the current depth, the maximum depth and the mean wait time in seconds since the last call,
+                 and the total dropped items.
+        """
+        with self._condition:
+            metrics = {"depth": len(self._items), "max_depth": self.max_depth, "dropped": self.dropped,
+                       "wait_time": (self._wait_time / self._wait_count) if self._wait_count else 0.0}
+            self.max_depth = len(self._items)
+            self._wait_time, self._wait_count = 0.0, 0
+        return metrics
+
+
+# Item of a ReorderBuffer entry not available yet.
+_PENDING = object()
+
+
+class ReorderBuffer(object):
+    """
+    Buffer releasing items in pulse id order. The order is either declared with expect() (e.g. the order frames are
+    received before being processed in parallel), or, for items put without being expected, given by the pulse id.
+    The head is released when its item is available (and, if not expected, it follows the last released pulse id),
+    when its deadline expires or when the buffer is full: then it is dropped if its item is not available yet, and
+    the item is late if it arrives later (dropped, or emitted out of order if emit_late).
+    Items are kept in an ordered dict: expecting, putting and releasing are O(1), except for items put out of order
+    without being expected, which are moved before the items with greater pulse ids.
+    """
+
+    def __init__(self, maxlen=None, timeout=None, emit_late=False, increment=1):
+        """
+        :param maxlen: Maximum number of entries: when exceeded the head is released.
+        :param timeout: Time in seconds an entry waits for its item, or for the previous pulse ids, before the head
+                        is released. If None, no deadline.
+        :param emit_late: If True late items are released out of order, otherwise they are dropped.
+        :param increment: Pulse id increment between consecutive items.
+        """
+        self.maxlen = maxlen
+        self.timeout = timeout
+        self.emit_late = emit_late
+        self.increment = increment
+        self.last_pulse_id = None
+        self.released = 0
+        self.dropped = 0
+        self.late = 0
+        self.max_depth = 0
+        self._entries = collections.OrderedDict()
+        self._late = collections.deque()
+        self._condition = threading.Condition(threading.Lock())
+        self._wait_time = 0.0
+        self._wait_count = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _add(self, pulse_id, item, expected):
+        now = time.perf_counter()
+        greater = []
+        if not expected:
+            for key in reversed(self._entries):
+                if key < pulse_id:
+                    break
+                greater.append(key)
+        # Entry: [deadline, item, expected, insertion time]
+        self._entries[pulse_id] = [None if self.timeout is None else now + self.timeout, item, expected, now]
+        for key in reversed(greater):
+            self._entries.move_to_end(key)
+        self.max_depth = max(self.max_depth, len(self._entries))
+
+    def _is_late(self, pulse_id):
+        return (self.last_pulse_id is not None) and (pulse_id <= self.last_pulse_id)
+
+    def expect(self, pulse_id):
+        """
+        Declares the pulse id of an item to be put later: expected items are released in the order of declaration.
+        """
+        with self._condition:
+            if self._is_late(pulse_id):
+                # Pulse id reset (e.g. camera restarted).
+                self.last_pulse_id = None
+            self._add(pulse_id, _PENDING, True)
+            self._condition.notify()
+
+    def put(self, pulse_id, item):
+        """
+        :param item: Item to release. If None the pulse id is discarded (e.g. a frame processed to None).
+        """
+        with self._condition:
+            entry = self._entries.get(pulse_id)
+            if entry is not None:
+                if item is None:
+                    del self._entries[pulse_id]
+                else:
+                    entry[1] = item
+            elif self._is_late(pulse_id):
+                if item is not None:
+                    self.late += 1
+                    if self.emit_late:
+                        self._late.append((pulse_id, item))
+            elif item is not None:
+                self._add(pulse_id, item, False)
+            self._condition.notify()
+
+    def _release(self):
+        if self._late:
+            return self._late.popleft()
+        now = time.perf_counter()
+        while self._entries:
+            pulse_id = next(iter(self._entries))
+            deadline, item, expected, timestamp = self._entries[pulse_id]
+            forced = ((self.maxlen is not None) and (len(self._entries) > self.maxlen)) or \
+                     ((deadline is not None) and (now >= deadline))
+            if item is not _PENDING:
+                if not (forced or expected or (self.last_pulse_id is None) or
+                        (pulse_id <= self.last_pulse_id + self.increment)):
+                    return None
+            elif not forced:
+                return None
+            self._entries.popitem(last=False)
+            self.last_pulse_id = pulse_id
+            if item is _PENDING:
+                self.dropped += 1
+                continue
+            self.released += 1
+            self._wait_time += now - timestamp
+            self._wait_count += 1
+            return pulse_id, item
+        return None
+
+    def _next_deadline(self):
+        if self._entries:
+            return self._entries[next(iter(self._entries))][0]
+
+    def pop(self):
+        """
+        :return: (pulse_id, item) of the next released item, or None if there is no item to release.
+        """
+        with self._condition:
+            return self._release()
+
+    def get(self, timeout=None):
+        """
+        :param timeout: Maximum time to wait for an item to release in seconds. If None, waits forever.
+        :return: (pulse_id, item) of the next released item, or None if the timeout expired.
+        """
+        end = None if timeout is None else time.perf_counter() + timeout
+        with self._condition:
+            while True:
+                released = self._release()
+                if released is not None:
+                    return released
+                now = time.perf_counter()
+                wait = None if end is None else end - now
+                if (wait is not None) and (wait <= 0):
+                    return None
+                deadline = self._next_deadline()
+                if deadline is not None:
+                    wait = max(deadline - now, 0) if wait is None else max(min(wait, deadline - now), 0)
+                self._condition.wait(wait)
+
+    def clear(self):
+        with self._condition:
+            self._entries.clear()
+            self._late.clear()
+            self.last_pulse_id = None
+
+    def get_metrics(self):
+        """
+        :return: Dict with the current depth, the maximum depth and the mean wait time in seconds since the last call,
+                 and the total released, dropped (not available at release time) and late items.
+        """
+        with self._condition:
+            metrics = {"depth": len(self._entries), "max_depth": self.max_depth, "released": self.released,
+                       "dropped": self.dropped, "late": self.late,
+                       "wait_time": (self._wait_time / self._wait_count) if self._wait_count else 0.0}
+            self.max_depth = len(self._entries)
+            self._wait_time, self._wait_count = 0.0, 0
+        return metrics
+
+
+class JitterBuffer(object):
+    """
+    Jitter buffer merging frames received out of order (e.g. from several connections to a camera): a min-heap on
+    the pulse id. The first frame is released when it follows the last released pulse id, when it has waited for
+    the target latency, or when the buffer is full. Frames older than the last released pulse id arrive too late and
+    are dropped, unless many arrive in a row (pulse id reset, e.g. camera restarted): then the frames received before
+    the reset are released first, and the pulse id increment is detected again. The pulse id increment is detected
+    from the released frames.
+    """
+
+    def __init__(self, latency, maxlen=None, increment_window=16):
+        """
+        :param latency: Maximum time in seconds a frame waits for the previous pulse ids.
+        :param maxlen: Maximum number of frames: when exceeded the first frame is released.
+        :param increment_window: Number of released frames considered to detect the pulse id increment (the
+                                 smallest difference of consecutive pulse ids), and of consecutive late frames
+                                 considered a pulse id reset.
+        """
+        self.latency = latency
+        self.maxlen = maxlen
+        self.increment = None
+        self.last_pulse_id = None
+        self.released = 0
+        self.late = 0
+        self.reordered = 0
+        self.max_depth = 0
+        self._heap = []
+        # Frames received before a pulse id reset, released before the heap.
+        self._flush = collections.deque()
+        self._sequence = 0
+        self._consecutive_late = 0
+        self._last_received = None
+        self._increments = collections.deque(maxlen=increment_window)
+        self._condition = threading.Condition(threading.Lock())
+        self._wait_time = 0.0
+        self._wait_count = 0
+
+    def __len__(self):
+        return len(self._heap) + len(self._flush)
+
+    def put(self, pulse_id, item):
+        """
+        :return: False if the frame was dropped because it is late.
+        """
+        with self._condition:
+            if (self.last_pulse_id is not None) and (pulse_id <= self.last_pulse_id):
+                self.late += 1
+                self._consecutive_late += 1
+                if self._consecutive_late <= self._increments.maxlen:
+                    return False
+                _logger.info("Pulse id reset: %d after %d" % (pulse_id, self.last_pulse_id))
+                while self._heap:
+                    self._flush.append(heapq.heappop(self._heap))
+                self._reset()
+            self._consecutive_late = 0
+            if (self._last_received is not None) and (pulse_id < self._last_received):
+                self.reordered += 1
+            else:
+                self._last_received = pulse_id
+            heapq.heappush(self._heap, (pulse_id, self._sequence, time.perf_counter(), item))
+            self._sequence += 1
+            self.max_depth = max(self.max_depth, len(self))
+            self._condition.notify()
+            return True
+
+    def _reset(self):
+        self._increments.clear()
+        self._consecutive_late = 0
+        self.increment, self.last_pulse_id, self._last_received = None, None, None
+
+    def _release(self):
+        now = time.perf_counter()
+        if self._flush:
+            pulse_id, _, timestamp, item = self._flush.popleft()
+            self.released += 1
+            self._wait_time += now - timestamp
+            self._wait_count += 1
+            return pulse_id, item
+        if not self._heap:
+            return None
+        pulse_id, _, timestamp, item = self._heap[0]
+        if not (((self.maxlen is not None) and (len(self._heap) > self.maxlen)) or (now - timestamp >= self.latency) or
+                ((self.increment is not None) and (self.last_pulse_id is not None) and
+                 (pulse_id <= self.last_pulse_id + self.increment))):
+            return None
+        heapq.heappop(self._heap)
+        if self.last_pulse_id is not None:
+            self._increments.append(pulse_id - self.last_pulse_id)
+            self.increment = min(self._increments)
+        self.last_pulse_id = pulse_id
+        self.released += 1
+        self._wait_time += now - timestamp
+        self._wait_count += 1
+        return pulse_id, item
+
+    def pop(self):
+        """
+        :return: (pulse_id, item) of the next released frame, or None if there is no frame to release.
+        """
+        with self._condition:
+            return self._release()
+
+    def get(self, timeout=None):
+        """
+        :param timeout: Maximum time to wait for a frame to release in seconds. If None, waits forever.
+        :return: (pulse_id, item) of the next released frame, or None if the timeout expired.
+        """
+        end = None if timeout is None else time.perf_counter() + timeout
+        with self._condition:
+            while True:
+                released = self._release()
+                if released is not None:
+                    return released
+                now = time.perf_counter()
+                wait = None if end is None else end - now
+                if (wait is not None) and (wait <= 0):
+                    return None
+                if self._heap and not self._flush:
+                    deadline = self._heap[0][2] + self.latency - now
+                    wait = max(deadline, 0) if wait is None else max(min(wait, deadline), 0)
+                self._condition.wait(wait)
+
+    def clear(self):
+        with self._condition:
+            self._heap.clear()
+            self._flush.clear()
+            self._reset()
+
+    def get_metrics(self):
+        """
+        :return: Dict with the current depth, the maximum depth and the mean wait time in seconds since the last call,
+                 the detected pulse id increment, and the total released, late (dropped) and reordered frames.
+        """
+        with self._condition:
+            metrics = {"depth": len(self), "max_depth": self.max_depth, "released": self.released,
+                       "dropped": self.late, "late": self.late, "reordered": self.reordered,
+                       "increment": self.increment,
+                       "wait_time": (self._wait_time / self._wait_count) if self._wait_count else 0.0}
+            self.max_depth = len(self)
+            self._wait_time, self._wait_count = 0.0, 0
+        return metrics
+
+
+class PulseIdJoin(object):
+    """
+    Joins the items of several streams by pulse id (e.g. images and bsread data): a dict per stream, so that an item
+    is matched in constant time. A join sets the watermark to its pulse id: the unmatched items with lower pulse ids
+    cannot be joined anymore and are expired, and items put later with lower pulse ids are late and discarded.
+    The items of each stream are kept in the order they are put, and evicted from the oldest when they exceed the
+    maximum age, fall out of the pulse id window, or the stream exceeds its maximum length or size in bytes.
+    """
+
+    def __init__(self, streams, max_age=None, pid_window=None, max_length=None, max_bytes=None):
+        """
+        :param streams: Names of the joined streams.
+        :param max_age: Maximum time in seconds an item waits to be joined.
+        :param pid_window: Items with pulse ids older than the newest pulse id by more than this are expired. Late
+                           pulse ids older than the watermark by more than this are considered a pulse id reset.
+        :param max_length: Maximum number of items of each stream: dict stream -> number, or number for all streams.
+        :param max_bytes: Maximum size in bytes of the items of each stream: dict stream -> bytes, or bytes for all.
+        """
+        self.streams = tuple(streams)
+        self.max_age = max_age
+        self.pid_window = pid_window
+        self.max_length = self._get_limits(max_length)
+        self.max_bytes = self._get_limits(max_bytes)
+        self.watermark = None
+        self.newest_pulse_id = None
+        self.joined = 0
+        self.late = 0
+        self.expired = 0
+        self.max_depth = 0
+        self._items = {stream: collections.OrderedDict() for stream in self.streams}
+        self._bytes = dict.fromkeys(self.streams, 0)
+        self._lock = threading.Lock()
+        self._counters = (0, 0, 0)
+        self._wait_time = 0.0
+        self._wait_count = 0
+
+    def _get_limits(self, limits):
+        if isinstance(limits, dict):
+            return {stream: limits.get(stream) for stream in self.streams}
+        return dict.fromkeys(self.streams, limits)
+
+    def __len__(self):
+        return sum(len(items) for items in self._items.values())
+
+    def put(self, stream, pulse_id, item, size=0):
+        """
+        :param size: Size of the item in bytes, if the stream is bounded by max_bytes.
+        :return: Dict stream -> item if the pulse id is joined (all streams have it), otherwise None.
+        """
+        with self._lock:
+            now = time.perf_counter()
+            if (self.watermark is not None) and (pulse_id <= self.watermark):
+                if (self.pid_window is None) or (pulse_id >= self.watermark - self.pid_window):
+                    self.late += 1
+                    return None
+                _logger.info("Pulse id reset: %d after %d" % (pulse_id, self.watermark))
+                self._reset()
+            if (self.newest_pulse_id is None) or (pulse_id > self.newest_pulse_id):
+                self.newest_pulse_id = pulse_id
+
+            items = self._items[stream]
+            former = items.pop(pulse_id, None)
+            if former is not None:
+                self._bytes[stream] -= former[2]
+            items[pulse_id] = (now, item, size)
+            self._bytes[stream] += size
+
+            joined = None
+            if all(pulse_id in self._items[other] for other in self.streams):
+                joined = {}
+                for other in self.streams:
+                    timestamp, joined[other], size = self._items[other].pop(pulse_id)
+                    self._bytes[other] -= size
+                    self._wait_time += now - timestamp
+                self._wait_count += len(self.streams)
+                self.joined += 1
+                self.watermark = pulse_id
+            self._evict(now)
+            self.max_depth = max(self.max_depth, len(self))
+            return joined
+
+    def _evict(self, now):
+        for stream, items in self._items.items():
+            max_length, max_bytes = self.max_length[stream], self.max_bytes[stream]
+            while items:
+                pulse_id, (timestamp, _, size) = next(iter(items.items()))
+                if ((self.watermark is not None) and (pulse_id <= self.watermark)) or \
+                        ((self.max_age is not None) and (now - timestamp > self.max_age)) or \
+                        ((self.pid_window is not None) and (pulse_id < self.newest_pulse_id - self.pid_window)) or \
+                        ((max_length is not None) and (len(items) > max_length)) or \
+                        ((max_bytes is not None) and (self._bytes[stream] > max_bytes)):
+                    items.popitem(last=False)
+                    self._bytes[stream] -= size
+                    self.expired += 1
+                else:
+                    break
+
+    def _reset(self):
+        for stream, items in self._items.items():
+            self.expired += len(items)
+            items.clear()
+            self._bytes[stream] = 0
+        self.watermark, self.newest_pulse_id = None, None
+
+    def get_size(self, stream):
+        """
+        :return: Size in bytes of the items of the stream waiting to be joined.
+        """
+        return self._bytes[stream]
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def get_metrics(self):
+        """
+        :return: Dict with the current depth, the maximum depth and the mean wait time in seconds of the joined items
+                 since the last call, the total expired and late (dropped) items, and the number of joined (hits),
+                 late (misses) and expired items since the last call.
+        """
+        with self._lock:
+            joined, late, expired = self._counters
+            metrics = {"depth": len(self), "max_depth": self.max_depth, "dropped": self.expired + self.late,
+                       "wait_time": (self._wait_time / self._wait_count) if self._wait_count else 0.0,
+                       "hits": self.joined - joined, "misses": self.late - late, "expired": self.expired - expired}
+            self._counters = (self.joined, self.late, self.expired)
+            self.max_depth = len(self)
+            self._wait_time, self._wait_count = 0.0, 0
+        return metrics
+
+
 class CherryPyV9Server(ServerAdapter):
     def run(self, handler): # pragma: no cover
         from cheroot.wsgi import Server as WSGIServer
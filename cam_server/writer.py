@@ -3,8 +3,8 @@ import logging
 from cam_server.utils import get_host_port_from_stream_address
 from bsread.handlers.compact import Value
 from bsread.data.helpers import get_channel_specs
+from cam_server.lazy_import import lazy_import
 
-import h5py
 import numpy
 import socket
 import datetime
@@ -14,6 +14,9 @@ import json
 
 _logger = logging.getLogger(__name__)
 
+# Only imported by the store pipelines.
+h5py = lazy_import("h5py")
+
 GENERAL_GROUP = "/general/"
 
 LAYOUT_DEFAULT = "DEFAULT"
@@ -107,9 +107,16 @@ class CamClient(InstanceManagementClient):
         :return: JSON with bytes and metadata.
         """
         rest_endpoint = "/%s/image_bytes" % camera_name
+        return self._get_image(rest_endpoint, image_bytes=True)
 
-        server_response = requests.get(self.api_address_format % rest_endpoint, timeout=self.timeout).json()
-        return self.validate_response(server_response)["image"]
+    def get_camera_image_array(self, camera_name):
+        """
+        Return the cam image.
+        :param camera_name: Camera name.
+        :return: Image array.
+        """
+        rest_endpoint = "/%s/image_bytes" % camera_name
+        return self._get_image(rest_endpoint)
 
     def get_instance_stream(self, camera_name):
         """
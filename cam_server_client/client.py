@@ -1,7 +1,11 @@
+import base64
 import requests
 import time
 
+import numpy
+
 from cam_server_client import config
+from cam_server_client.utils import get_image_request_headers, decode_image, get_image_bytes, IMAGE_CONTENT_TYPES
 
 
 class Client(object):
@@ -19,6 +23,24 @@ class Client(object):
         return server_response
 
 
+    def _get_image(self, rest_endpoint, image_bytes=False):
+        """
+        Get an image from an image_bytes endpoint, transferred in binary if the server supports it.
+        :param image_bytes: If True return the image in the JSON format (base64 bytes, shape and dtype).
+        :return: Image array, or dictionary if image_bytes.
+        """
+        server_response = requests.get(self.api_address_format % rest_endpoint, headers=get_image_request_headers(),
+                                       timeout=self.timeout)
+        if server_response.headers.get("Content-Type", "").startswith(tuple(IMAGE_CONTENT_TYPES.values())):
+            image = decode_image(server_response.content, server_response.headers)
+            return get_image_bytes(image) if image_bytes else image
+
+        # Server without binary transfer.
+        image = self.validate_response(server_response.json())["image"]
+        if image_bytes:
+            return image
+        return numpy.frombuffer(base64.b64decode(image["bytes"].encode()), dtype=image["dtype"]).reshape(image["shape"])
+
     def get_address(self):
         """
         Return the REST api endpoint address.
@@ -268,9 +268,16 @@ class PipelineClient(InstanceManagementClient):
         :return: JSON with bytes and metadata.
         """
         rest_endpoint = "/background/%s/image_bytes" % background_name
+        return self._get_image(rest_endpoint, image_bytes=True)
 
-        server_response = requests.get(self.api_address_format % rest_endpoint, timeout=self.timeout).json()
-        return self.validate_response(server_response)["image"]
+    def get_background_image_array(self, background_name):
+        """
+        Return a background file.
+        :param background_name: Background file name.
+        :return: Image array.
+        """
+        rest_endpoint = "/background/%s/image_bytes" % background_name
+        return self._get_image(rest_endpoint)
 
 
     def set_background_image_bytes(self, background_name, image_bytes):
@@ -1,3 +1,19 @@
+import base64
+import io
+
+import numpy
+
+try:
+    import bitshuffle
+except:
+    bitshuffle = None
+
+try:
+    import lz4.frame as lz4_frame
+except:
+    lz4_frame = None
+
+
 def get_host_port_from_stream_address(stream_address):
     if stream_address.startswith("ipc"):
         return stream_address.split("//")[1], -1
@@ -6,3 +22,103 @@ def get_host_port_from_stream_address(stream_address):
     source_host = source_host.split("//")[1]
     return source_host, int(source_port)
 
+
+
+# Binary image transfer: raw bytes (shape and dtype in headers) or .npy, optionally compressed.
+IMAGE_CONTENT_TYPES = {"raw": "application/octet-stream", "npy": "application/x-npy"}
+IMAGE_SHAPE_HEADER = "X-Image-Shape"
+IMAGE_DTYPE_HEADER = "X-Image-Dtype"
+
+
+def get_image_encodings():
+    """
+    :return: Compressions of binary images available in this environment, by order of preference.
+    """
+    encodings = []
+    if bitshuffle is not None:
+        encodings.append("bitshuffle_lz4")
+    if lz4_frame is not None:
+        encodings.append("lz4")
+    return encodings
+
+
+def get_image_request_headers():
+    """
+    :return: Headers requesting a binary image, compressed if possible, or JSON for servers not supporting it.
+    """
+    headers = {"Accept": IMAGE_CONTENT_TYPES["raw"] + ", application/json"}
+    headers["Accept-Encoding"] = ", ".join(get_image_encodings() + ["identity"])
+    return headers
+
+
+def encode_image(image, image_format="raw", accept_encoding=None):
+    """
+    :param image: Image to encode.
+    :param image_format: "raw" or "npy".
+    :param accept_encoding: Accept-Encoding header of the request: the first supported compression is used.
+    :return: body, headers
+    """
+    image = numpy.ascontiguousarray(image)
+    accepted = [e.split(";")[0].strip() for e in accept_encoding.split(",")] if accept_encoding else []
+    encoding = None
+    for candidate in get_image_encodings():
+        # Bitshuffle needs the item size: not used with the npy header.
+        if (candidate in accepted) and not (candidate == "bitshuffle_lz4" and image_format == "npy"):
+            encoding = candidate
+            break
+
+    if encoding == "bitshuffle_lz4":
+        body = bitshuffle.compress_lz4(image).tobytes()
+    else:
+        if image_format == "npy":
+            stream = io.BytesIO()
+            numpy.save(stream, image, allow_pickle=False)
+            body = stream.getvalue()
+        else:
+            body = image.tobytes()
+        if encoding == "lz4":
+            body = lz4_frame.compress(body)
+
+    headers = {"Content-Type": IMAGE_CONTENT_TYPES[image_format],
+               IMAGE_SHAPE_HEADER: ",".join(str(size) for size in image.shape),
+               IMAGE_DTYPE_HEADER: image.dtype.str}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return body, headers
+
+
+def decode_image(body, headers):
+    """
+    :param body: Response content.
+    :param headers: Response headers.
+    :return: Image array.
+    """
+    encoding = headers.get("Content-Encoding")
+    shape = tuple(int(size) for size in headers[IMAGE_SHAPE_HEADER].split(",") if size)
+    dtype = numpy.dtype(headers[IMAGE_DTYPE_HEADER])
+
+    if encoding == "bitshuffle_lz4":
+        if bitshuffle is None:
+            raise RuntimeError("Bitshuffle not available")
+        return bitshuffle.decompress_lz4(numpy.frombuffer(body, dtype=numpy.uint8), shape, dtype)
+    if encoding == "lz4":
+        if lz4_frame is None:
+            raise RuntimeError("LZ4 not available")
+        body = lz4_frame.decompress(body, return_bytearray=True)
+    elif encoding not in (None, "identity"):
+        raise ValueError("Unsupported image encoding: %s" % encoding)
+    else:
+        body = bytearray(body)
+
+    if headers.get("Content-Type", "").startswith(IMAGE_CONTENT_TYPES["npy"]):
+        return numpy.load(io.BytesIO(body), allow_pickle=False)
+    return numpy.frombuffer(body, dtype=dtype).reshape(shape)
+
+
+def get_image_bytes(image):
+    """
+    :return: Image in the format of the image_bytes JSON responses: base64 bytes, shape and dtype.
+    """
+    return {"bytes": base64.b64encode(numpy.ascontiguousarray(image)).decode("utf-8"),
+            "shape": list(image.shape),
+            "dtype": image.dtype.descr[0][1]}
@@ -0,0 +1,96 @@
+import os
+import time
+import unittest
+from threading import Thread
+
+import numpy
+
+from cam_server.camera.configuration import CameraConfig
+from cam_server.camera.receivers import ConnectionReceivers
+from cam_server.camera.source.common import transform_image
+
+try:
+    import bitshuffle
+except:
+    bitshuffle = None
+
+SIZE_X, SIZE_Y = 2048, 2048
+FRAMES_PER_CONNECTION = 40
+
+camera_config = CameraConfig("simulation", {"source": "simulation", "source_type": "simulation", "mirror_x": True,
+                                             "rotate": 1})
+raw_image = numpy.random.randint(0, 4096, (SIZE_Y, SIZE_X), dtype="uint16")
+if bitshuffle is not None:
+    compressed_image = bitshuffle.compress_lz4(raw_image)
+else:
+    compressed_image = raw_image.tobytes()
+
+
+def decode():
+    # Decoding of the image channel of a bsread message.
+    if bitshuffle is not None:
+        image = bitshuffle.decompress_lz4(compressed_image, raw_image.shape, raw_image.dtype)
+    else:
+        image = numpy.frombuffer(compressed_image, dtype=raw_image.dtype).reshape(raw_image.shape).copy()
+    return transform_image(image, camera_config)
+
+
+def create_receiver(index):
+    pulse_ids = iter(range(FRAMES_PER_CONNECTION))
+
+    def receive():
+        pulse_id = next(pulse_ids, None)
+        if pulse_id is None:
+            time.sleep(0.01)
+            return None
+        return pulse_id, decode(), index
+    return receive
+
+
+class ConnectionReceiversPerformanceTest(unittest.TestCase):
+
+    def receive_threads(self, connections):
+        received = [0] * connections
+
+        def receive_task(index):
+            receive = create_receiver(index)
+            for _ in range(FRAMES_PER_CONNECTION):
+                receive()
+                received[index] += 1
+
+        threads = [Thread(target=receive_task, args=(index,)) for index in range(connections)]
+        start_time = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(received) / (time.time() - start_time)
+
+    def receive_processes(self, connections):
+        received = []
+
+        def on_frame(pulse_id, image, metadata, release):
+            received.append(pulse_id)
+            release()
+
+        start_time = time.time()
+        receivers = ConnectionReceivers(connections, raw_image.nbytes, create_receiver, on_frame)
+        try:
+            while len(received) < connections * FRAMES_PER_CONNECTION:
+                time.sleep(0.001)
+            return len(received) / (time.time() - start_time)
+        finally:
+            receivers.close()
+
+    def test_frame_rate_versus_connections(self):
+        print("Image %s, %d CPUs, %s decoding" % (raw_image.shape, os.cpu_count(),
+                                                  "bitshuffle/lz4" if bitshuffle is not None else "raw"))
+        for connections in [1, 2, 4]:
+            thread_rate = self.receive_threads(connections)
+            process_rate = self.receive_processes(connections)
+            print("%d connections: threads %.1f frames/s - processes %.1f frames/s (%.2fx)" %
+                  (connections, thread_rate, process_rate, process_rate / thread_rate))
+
+
+if __name__ == '__main__':
+    unittest.main()
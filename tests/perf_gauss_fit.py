@@ -0,0 +1,94 @@
+import time
+import unittest
+
+import numpy
+
+from cam_server.pipeline.data_processing import functions, fitting
+
+
+def get_simulated_profiles(n_profiles=200, size=2048, seed=0):
+    random = numpy.random.RandomState(seed)
+    axis = numpy.arange(size).astype("f")
+    profiles = []
+    for _ in range(n_profiles):
+        center = random.uniform(size * 0.2, size * 0.8)
+        standard_deviation = random.uniform(size * 0.01, size * 0.1)
+        amplitude = random.uniform(1e3, 1e6)
+        profile = 100 + amplitude * numpy.exp(-(axis - center) ** 2 / (2 * standard_deviation ** 2))
+        profile += random.normal(0, amplitude * 0.02, size)
+        profiles.append(profile)
+    return axis, profiles
+
+
+class GaussFitPerformanceTest(unittest.TestCase):
+
+    def test_gauss_fit_performance(self):
+        for size in [256, 1024, 2048, 4096]:
+            axis, profiles = get_simulated_profiles(size=size)
+
+            start_time = time.time()
+            reference = [functions._gauss_fit_curve_fit(axis, profile) for profile in profiles]
+            curve_fit_time = time.time() - start_time
+
+            start_time = time.time()
+            results = [fitting.gauss_fit_lm(axis, profile) for profile in profiles]
+            lm_time = time.time() - start_time
+
+            deviation = max(numpy.max(numpy.abs(numpy.abs(result[0]) - numpy.abs(ref)) / numpy.abs(ref[[1, 1, 3, 3]]))
+                            for result, ref in zip(results, reference))
+            iterations = numpy.mean([result[1] for result in results])
+
+            print("Profile size %d: curve_fit %.1f us/fit - LM %.1f us/fit (%.2fx) - mean iterations %.1f - "
+                  "max relative deviation %g" % (size, curve_fit_time / len(profiles) * 1e6,
+                                                  lm_time / len(profiles) * 1e6, curve_fit_time / lm_time,
+                                                  iterations, deviation))
+
+
+    def test_gauss_fit_batch_performance(self):
+        for size, n_slices in [(256, 11), (1024, 11), (2048, 21), (2048, 101)]:
+            axis, profiles = get_simulated_profiles(n_profiles=n_slices, size=size)
+            repetitions = 20
+
+            start_time = time.time()
+            for _ in range(repetitions):
+                reference = [fitting.gauss_fit_lm(axis, profile) for profile in profiles]
+            loop_time = (time.time() - start_time) / repetitions
+
+            start_time = time.time()
+            for _ in range(repetitions):
+                parameters, iterations, converged = fitting.gauss_fit_batch(axis, numpy.array(profiles))
+            batch_time = (time.time() - start_time) / repetitions
+
+            deviation = max(numpy.max(numpy.abs(row - ref[0]) / numpy.abs(ref[0][[1, 1, 3, 3]]))
+                            for row, ref in zip(parameters, reference))
+            print("Profile size %d, %d slices: LM loop %.2f ms - batch %.2f ms (%.2fx) - max relative deviation %g" %
+                  (size, n_slices, loop_time * 1e3, batch_time * 1e3, loop_time / batch_time, deviation))
+
+    def test_gauss_fit_warm_start_performance(self):
+        size, n_frames = 1024, 200
+        axis = numpy.arange(size).astype("f")
+        random = numpy.random.RandomState(0)
+        for noise in [0.01, 0.1, 0.3]:
+            # Stable beam: center jitter of a fraction of the standard deviation.
+            profiles = [100 + 1e4 * numpy.exp(-(axis - 500 - random.normal(0, 2)) ** 2 / (2 * 40 ** 2)) +
+                        random.normal(0, 1e4 * noise, size) for _ in range(n_frames)]
+
+            start_time = time.time()
+            cold_iterations = sum(fitting.gauss_fit_lm(axis, profile)[1] for profile in profiles)
+            cold_time = time.time() - start_time
+
+            fit_state = fitting.GaussFitState()
+            warm_iterations = 0
+            start_time = time.time()
+            for profile in profiles:
+                fit_state.fit("x", axis, profile)
+                warm_iterations += fit_state.iterations["x"]
+            warm_time = time.time() - start_time
+
+            print("Noise %.2f: cold %.1f us/fit %.2f iterations - warm start %.1f us/fit %.2f iterations "
+                  "(%d warm starts)" % (noise, cold_time / n_frames * 1e6, cold_iterations / n_frames,
+                                        warm_time / n_frames * 1e6, warm_iterations / n_frames,
+                                        fit_state.warm_starts))
+
+if __name__ == '__main__':
+    unittest.main()
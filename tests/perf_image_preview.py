@@ -0,0 +1,36 @@
+import time
+import unittest
+
+import numpy
+
+from cam_server.pipeline.data_processing.functions import get_png_from_image, get_preview_from_image
+
+
+class ImagePreviewPerformanceTest(unittest.TestCase):
+
+    def test_image_preview_performance(self):
+        size = 2048
+        y, x = numpy.mgrid[:size, :size]
+        random = numpy.random.RandomState(0)
+        image = (1000 * numpy.exp(-((x - size / 2) ** 2 + (y - size / 2) ** 2) / (2 * (size / 8) ** 2)) +
+                 random.randint(0, 100, size=(size, size))).astype("uint16")
+        repetitions = 5
+
+        start_time = time.time()
+        for _ in range(repetitions):
+            content = get_png_from_image(image)
+        legacy_time = (time.time() - start_time) / repetitions
+        print("Image %dx%d: legacy PNG %.1f ms (%d KB)" % (size, size, legacy_time * 1e3, len(content) / 1024))
+
+        for parameters in [{}, {"compression": 1}, {"image_format": "jpeg"}, {"image_format": "webp"},
+                           {"decimation": 2}, {"decimation": 4, "image_format": "jpeg"}]:
+            start_time = time.time()
+            for _ in range(repetitions):
+                content = get_preview_from_image(image, **parameters)
+            preview_time = (time.time() - start_time) / repetitions
+            print("Preview %s: %.1f ms (%.2fx) (%d KB)" % (parameters, preview_time * 1e3, legacy_time / preview_time,
+                                                          len(content) / 1024))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import time
+import unittest
+
+import numpy
+
+from cam_server.pipeline.data_processing import functions
+
+
+class ImageStatisticsPerformanceTest(unittest.TestCase):
+
+    def test_image_statistics_performance(self):
+        if functions.numba is None:
+            print("numba not available: get_image_statistics uses NumPy")
+
+        random = numpy.random.RandomState(0)
+        image = random.randint(0, 4096, size=(2048, 2048)).astype("uint16")
+        repetitions = 20
+
+        # Compile the kernel.
+        functions.get_image_statistics(image)
+
+        start_time = time.time()
+        for _ in range(repetitions):
+            min_value, max_value = functions.get_min_max(image)
+            x_profile, y_profile = functions.get_x_y_profile(image)
+            intensity = x_profile.sum()
+        separate_time = (time.time() - start_time) / repetitions
+
+        start_time = time.time()
+        for _ in range(repetitions):
+            statistics = functions.get_image_statistics(image)
+        fused_time = (time.time() - start_time) / repetitions
+
+        self.assertEqual(statistics[0], min_value)
+        self.assertEqual(statistics[1], max_value)
+        numpy.testing.assert_array_equal(statistics[2], x_profile)
+        numpy.testing.assert_array_equal(statistics[3], y_profile)
+        self.assertEqual(statistics[4], intensity)
+
+        # Separate reductions read the image 4 times (nanmin, nanmax, sum(0), sum(1)), the fused kernel only once.
+        size = image.nbytes / 1e6
+        print("Image 2048x2048 uint16: separate %.2f ms (%d MB read, %.0f MB/s) - fused %.2f ms (%d MB read, "
+              "%.0f MB/s) - %.2fx" % (separate_time * 1e3, size * 4, size * 4 / separate_time, fused_time * 1e3,
+                                      size, size / fused_time, separate_time / fused_time))
+
+
+if __name__ == '__main__':
+    unittest.main()
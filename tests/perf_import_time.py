@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+import unittest
+
+
+def get_import_times(module_name):
+    """
+    :return: List of (cumulative time in seconds, module name) of the modules imported by the module, sorted by time.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module_name], env=env,
+                            stderr=subprocess.PIPE, check=True).stderr.decode()
+    import_times = []
+    for line in output.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                import_times.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(import_times, reverse=True)
+
+
+class ImportTimePerformanceTest(unittest.TestCase):
+
+    def test_import_time_report(self):
+        for module_name in ("cam_server.start_camera_worker", "cam_server.start_camera_proxy",
+                            "cam_server.start_pipeline_worker", "cam_server.pipeline.transceiver",
+                            "cam_server.pipeline.data_processing.functions"):
+            import_times = get_import_times(module_name)
+            total = dict((name, cumulative) for cumulative, name in import_times)[module_name]
+            top_level = [(cumulative, name) for cumulative, name in import_times
+                         if "." not in name and name != module_name][:5]
+            print("%s: %.0f ms (%s)" % (module_name, total * 1e3,
+                                        ", ".join("%s %.0f ms" % (name, t * 1e3) for t, name in top_level)))
+
+
+if __name__ == '__main__':
+    unittest.main()
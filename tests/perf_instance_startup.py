@@ -0,0 +1,90 @@
+import os
+import time
+import unittest
+from multiprocessing import Process
+
+from bsread import source, SUB
+
+from cam_server import CamClient, PipelineClient
+from cam_server import config
+from cam_server.start_camera_worker import start_camera_worker
+from cam_server.start_pipeline_worker import start_pipeline_worker
+from cam_server.start_camera_manager import start_camera_manager
+from cam_server.start_pipeline_manager import start_pipeline_manager
+from cam_server.utils import get_host_port_from_stream_address
+from tests import test_cleanup, require_folder
+
+
+class InstanceStartupPerformanceTest(unittest.TestCase):
+
+    def start_servers(self, worker_pool_size):
+        # The servers are forked: their instance managers use this pool size.
+        config.WORKER_POOL_SIZE = worker_pool_size
+        host = "0.0.0.0"
+        cam_port, pipeline_port, cam_manager_port, pipeline_manager_port = 8880, 8881, 8888, 8889
+
+        test_base_dir = os.path.split(os.path.abspath(__file__))[0]
+        self.temp_folder = os.path.join(test_base_dir, "temp/")
+        self.background_config_folder = os.path.join(test_base_dir, "background_config/")
+        self.user_scripts_folder = os.path.join(test_base_dir, "user_scripts/")
+        for folder in self.temp_folder, self.background_config_folder, self.user_scripts_folder:
+            require_folder(folder)
+
+        cam_server_address = "http://%s:%s" % (host, cam_port)
+        pipeline_server_address = "http://%s:%s" % (host, pipeline_port)
+        cam_server_proxy_address = "http://%s:%s" % (host, cam_manager_port)
+        pipeline_server_proxy_address = "http://%s:%s" % (host, pipeline_manager_port)
+
+        self.processes = [
+            Process(target=start_camera_worker, args=(host, cam_port)),
+            Process(target=start_pipeline_worker, args=(host, pipeline_port, self.temp_folder, self.temp_folder,
+                                                        cam_server_proxy_address)),
+            Process(target=start_camera_manager, args=(host, cam_manager_port, cam_server_address,
+                                                       os.path.join(test_base_dir, "camera_config/"))),
+            Process(target=start_pipeline_manager, args=(host, pipeline_manager_port, pipeline_server_address,
+                                                         os.path.join(test_base_dir, "pipeline_config/"),
+                                                         self.background_config_folder,
+                                                         config.DEFAULT_BACKGROUND_FILES_DAYS_TO_LIVE,
+                                                         self.user_scripts_folder, cam_server_proxy_address))]
+        for process in self.processes:
+            process.start()
+        self.cam_client = CamClient(cam_server_proxy_address)
+        self.pipeline_client = PipelineClient(pipeline_server_proxy_address)
+        time.sleep(1.0)
+
+    def stop_servers(self):
+        test_cleanup([self.pipeline_client, self.cam_client], self.processes,
+                     [self.background_config_folder, self.temp_folder])
+
+    def test_instance_startup_performance(self):
+        # Time from the REST call creating a pipeline to the first message received from its output stream.
+        repetitions = 5
+        for worker_pool_size in (0, 2):
+            self.start_servers(worker_pool_size)
+            try:
+                # The camera is started once: only the pipeline startup is measured.
+                self.cam_client.get_instance_stream("simulation")
+                # Let the pool workers preload the modules.
+                time.sleep(5.0)
+                create_times, first_message_times = [], []
+                for i in range(repetitions):
+                    start_time = time.time()
+                    instance_id, stream_address = self.pipeline_client.create_instance_from_config(
+                        {"camera_name": "simulation"})
+                    create_times.append(time.time() - start_time)
+                    stream_host, stream_port = get_host_port_from_stream_address(stream_address)
+                    with source(host=stream_host, port=stream_port, mode=SUB) as stream:
+                        data = stream.receive()
+                        self.assertIsNotNone(data)
+                    first_message_times.append(time.time() - start_time)
+                    self.pipeline_client.stop_instance(instance_id)
+                    time.sleep(1.0)
+            finally:
+                self.stop_servers()
+            print("Worker pool size %d: create_pipeline %.1f ms, first message %.1f ms" %
+                  (worker_pool_size, 1e3 * sum(create_times) / repetitions,
+                   1e3 * sum(first_message_times) / repetitions))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import random
+import time
+import unittest
+
+from cam_server.utils import JitterBuffer, MaxLenDict
+
+
+def get_arrivals(n_frames, connections, seed=0):
+    # Frames of each connection in order, connections interleaved with a random delay.
+    random.seed(seed)
+    arrivals = [(pulse_id + random.uniform(0, connections * 4), pulse_id) for pulse_id in range(n_frames)]
+    return [pulse_id for _, pulse_id in sorted(arrivals)]
+
+
+def sorted_scan(arrivals, depth):
+    # Former message buffer of the bsread cameras: sorts the keys to find the first pulse id.
+    message_buffer = MaxLenDict(maxlen=depth * 2)
+    last_pid, sent = None, 0
+    for pulse_id in arrivals:
+        message_buffer[pulse_id] = pulse_id
+        while message_buffer:
+            pids = sorted(message_buffer.keys())
+            first = pids[0]
+            if (last_pid is not None) and (first <= last_pid):
+                message_buffer.pop(first)
+            elif (last_pid is None) or (first <= last_pid + 1) or (len(message_buffer) > depth):
+                message_buffer.pop(first)
+                last_pid = first
+                sent += 1
+            else:
+                break
+    return sent
+
+
+def jitter_buffer(arrivals, depth):
+    buffer = JitterBuffer(latency=1000.0, maxlen=depth)
+    sent = 0
+    for pulse_id in arrivals:
+        buffer.put(pulse_id, pulse_id)
+        while buffer.pop() is not None:
+            sent += 1
+    return sent
+
+
+class JitterBufferPerformanceTest(unittest.TestCase):
+
+    def test_buffer_performance(self):
+        n_frames = 20000
+        for connections in [2, 4, 8]:
+            arrivals = get_arrivals(n_frames, connections)
+            for depth in [100, 500, 1000]:
+                # Frames kept in the buffer: a missing pulse id holds the following ones until the buffer is full.
+                arrivals_with_gaps = [pulse_id for pulse_id in arrivals if pulse_id % 2000 != 1]
+                times = []
+                for function in (sorted_scan, jitter_buffer):
+                    start = time.time()
+                    function(arrivals_with_gaps, depth)
+                    times.append((time.time() - start) / len(arrivals_with_gaps) * 1e6)
+                print("%d connections, depth %4d: sorted scan %.1f us/frame - heap %.1f us/frame (%.1fx)" %
+                      (connections, depth, times[0], times[1], times[0] / times[1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
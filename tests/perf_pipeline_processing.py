@@ -8,6 +8,7 @@ from cam_server.camera.source.simulation import CameraSimulation
 from cam_server.pipeline.data_processing import functions
 from cam_server.pipeline.data_processing.processor import process_image
 from cam_server.pipeline.data_processing.functions import calculate_slices
+from cam_server.pipeline.data_processing.pre_processor import PreProcessingPlan
 
 
 class PipelinePerformanceTest(unittest.TestCase):
@@ -74,6 +75,39 @@ class PipelinePerformanceTest(unittest.TestCase):
 
         profile.print_stats()
 
+    def test_rotation_performance(self):
+        simulated_camera = CameraSimulation(CameraConfig("simulation"), size_x=2048, size_y=2048)
+        x_axis, y_axis = simulated_camera.get_x_y_axis()
+        images = [simulated_camera.get_image() for _ in range(10)]
+
+        for order in [0, 1]:
+            for roi in [None, [600, 800, 600, 800]]:
+                rotation = {"angle": 30, "order": order, "mode": "0.0"}
+                parameters = {"rotation": rotation}
+                if roi:
+                    parameters["image_region_of_interest"] = roi
+
+                start_time = time.time()
+                for image in images:
+                    image = functions.rotate(image, rotation["angle"], rotation["order"], rotation["mode"])
+                    if roi:
+                        image = image[roi[2]:roi[2] + roi[3], roi[0]:roi[0] + roi[1]]
+                scipy_time = (time.time() - start_time) / len(images)
+
+                plan = PreProcessingPlan(parameters)
+                start_time = time.time()
+                plan.process(images[0], x_axis, y_axis)
+                compile_time = time.time() - start_time
+
+                start_time = time.time()
+                for image in images:
+                    plan.process(image, x_axis, y_axis)
+                plan_time = (time.time() - start_time) / len(images)
+
+                print("Rotation order %d, ROI %s: scipy %.1f fps - cached resampling map %.1f fps (%.2fx), "
+                      "first frame %.1f ms" % (order, roi, 1.0 / scipy_time, 1.0 / plan_time, scipy_time / plan_time,
+                                               compile_time * 1e3))
+
     def test_single_function(self):
         # Profile only if LineProfiler present.
         # To install: conda install line_profiler
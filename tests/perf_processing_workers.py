@@ -0,0 +1,52 @@
+import os
+import time
+import unittest
+
+from cam_server.camera.configuration import CameraConfig
+from cam_server.camera.source.simulation import CameraSimulation
+from cam_server.pipeline.configuration import PipelineConfig
+from cam_server.pipeline.data_processing.processor import process_image
+from cam_server.pipeline.processing_pool import ProcessingPool
+
+
+class ProcessingWorkersPerformanceTest(unittest.TestCase):
+
+    def test_frame_rate_versus_workers(self):
+        simulated_camera = CameraSimulation(CameraConfig("simulation"), size_x=1024, size_y=1024)
+        x_axis, y_axis = simulated_camera.get_x_y_axis()
+        parameters = PipelineConfig("test_pipeline", {"camera_name": "simulation",
+                                                      "image_good_region": {"threshold": 0.3, "gfscale": 1.8},
+                                                      "image_slices": {"number_of_slices": 5}}).get_configuration()
+        images = [simulated_camera.get_image() for _ in range(20)]
+        n_frames = 200
+
+        def process_frame(image, x_axis, y_axis, pulse_id, timestamp, bsdata):
+            return process_image(image, pulse_id, timestamp, x_axis, y_axis, parameters, bsdata)
+
+        start_time = time.time()
+        for pulse_id in range(n_frames):
+            process_frame(images[pulse_id % len(images)], x_axis, y_axis, pulse_id, 0.0, None)
+        inline_rate = n_frames / (time.time() - start_time)
+        print("Image %s, %d CPUs: inline %.1f frames/s" % (images[0].shape, os.cpu_count(), inline_rate))
+
+        for workers in [1, 2, 4, 8]:
+            received = []
+            pool = ProcessingPool(workers, images[0].nbytes, process_frame,
+                                  lambda pulse_id, processed_data, context: received.append(pulse_id))
+            try:
+                start_time = time.time()
+                for pulse_id in range(n_frames):
+                    # Waits for a free slot instead of dropping the frame, to measure the maximum rate.
+                    while not pool.submit(images[pulse_id % len(images)], pulse_id, 0.0, x_axis, y_axis):
+                        time.sleep(0.0001)
+                while len(received) < n_frames:
+                    time.sleep(0.0001)
+                rate = n_frames / (time.time() - start_time)
+            finally:
+                pool.close()
+            self.assertEqual(received, list(range(n_frames)))
+            print("%d workers: %.1f frames/s (%.2fx)" % (workers, rate, rate / inline_rate))
+
+
+if __name__ == '__main__':
+    unittest.main()
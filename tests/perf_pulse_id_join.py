@@ -0,0 +1,80 @@
+import time
+import unittest
+from collections import deque
+
+from cam_server.utils import PulseIdJoin
+
+
+def process_bsbuffer(bs_buffer, bs_img_buffer, on_join):
+    # Former merge of images and bsread data in the pipelines: scans the data and image deques.
+    i = 0
+    while i < len(bs_buffer):
+        bs_pid, bsdata = bs_buffer[i]
+        for j in range(len(bs_img_buffer)):
+            img_pid = bs_img_buffer[0][0]
+            if img_pid < bs_pid:
+                bs_img_buffer.popleft()
+            elif img_pid == bs_pid:
+                pulse_id, image = bs_img_buffer.popleft()
+                on_join(pulse_id, image, bsdata)
+                for k in range(i):
+                    bs_buffer.popleft()
+                i = -1
+                break
+            else:
+                break
+        i = i + 1
+
+
+def get_messages(n_messages, delay, loss, delayed="data"):
+    # Images and data of the same pulse ids, one of them delayed by a number of pulses and with lost pulse ids.
+    messages = []
+    other = "image" if delayed == "data" else "data"
+    for pulse_id in range(n_messages):
+        messages.append((other, pulse_id))
+        if pulse_id >= delay:
+            delayed_pulse_id = pulse_id - delay
+            if (loss == 0) or (delayed_pulse_id % loss != 0):
+                messages.append((delayed, delayed_pulse_id))
+    return messages
+
+
+class PulseIdJoinPerformanceTest(unittest.TestCase):
+
+    def test_join_versus_scan(self):
+        n_messages = 20000
+        for delayed, delay, loss in [("data", 0, 0), ("data", 50, 0), ("data", 500, 10), ("image", 50, 0),
+                                     ("image", 500, 0), ("image", 50, 10), ("image", 500, 10)]:
+            messages = get_messages(n_messages, delay, loss, delayed)
+
+            joined = []
+            bs_buffer, bs_img_buffer = deque(maxlen=1000), deque(maxlen=1000)
+            start_time = time.time()
+            for stream, pulse_id in messages:
+                if stream == "image":
+                    bs_img_buffer.append([pulse_id, pulse_id])
+                else:
+                    bs_buffer.append([pulse_id, pulse_id])
+                    process_bsbuffer(bs_buffer, bs_img_buffer, lambda pulse_id, image, data: joined.append(pulse_id))
+            scan_time = time.time() - start_time
+            scan_joined = len(joined)
+
+            joined = []
+            join = PulseIdJoin(["image", "data"], max_length=1000)
+            start_time = time.time()
+            for stream, pulse_id in messages:
+                if join.put(stream, pulse_id, pulse_id) is not None:
+                    joined.append(pulse_id)
+            join_time = time.time() - start_time
+            metrics = join.get_metrics()
+            # The scan only merges when data is received, so it can not merge the last images if they are delayed.
+            self.assertGreaterEqual(len(joined), scan_joined)
+
+            print("%s delay %d, 1/%d lost: scan %.2fus - join %.2fus per message (%.1fx) - "
+                  "hits %d - misses %d - expired %d" %
+                  (delayed.capitalize(), delay, loss, scan_time * 1e6 / len(messages), join_time * 1e6 / len(messages),
+                   scan_time / join_time, metrics["hits"], metrics["misses"], metrics["expired"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import time
+import unittest
+from collections import deque
+from threading import Thread
+
+import numpy
+
+from cam_server.utils import FrameQueue
+
+
+def polling_consumer(poll_interval):
+    def consume(buffer, latencies, count):
+        while len(latencies) < count:
+            if len(buffer) == 0:
+                time.sleep(poll_interval)
+            else:
+                latencies.append(time.perf_counter() - buffer.popleft())
+    return consume
+
+
+def blocking_consumer(buffer, latencies, count):
+    while len(latencies) < count:
+        timestamp = buffer.get(0.1)
+        if timestamp is not None:
+            latencies.append(time.perf_counter() - timestamp)
+
+
+class QueueLatencyPerformanceTest(unittest.TestCase):
+
+    def measure(self, buffer, consume, frame_rate=100, count=300):
+        latencies = []
+        cpu_time = []
+
+        def run_consumer():
+            start = time.thread_time()
+            consume(buffer, latencies, count)
+            cpu_time.append(time.thread_time() - start)
+
+        consumer = Thread(target=run_consumer)
+        consumer.start()
+        for _ in range(count):
+            time.sleep(1.0 / frame_rate)
+            buffer.append(time.perf_counter())
+        consumer.join()
+        latencies = numpy.array(latencies) * 1e3
+        return numpy.mean(latencies), numpy.percentile(latencies, 99), cpu_time[0] / (count / frame_rate) * 100
+
+    def test_hand_off_latency(self):
+        for name, buffer, consume in [("polling 10ms", deque(maxlen=100), polling_consumer(0.01)),
+                                      ("polling 1ms", deque(maxlen=100), polling_consumer(0.001)),
+                                      ("FrameQueue", FrameQueue(maxlen=100), blocking_consumer)]:
+            mean, p99, cpu = self.measure(buffer, consume)
+            print("%-12s latency mean %.3f ms - p99 %.3f ms - consumer CPU %.2f%%" % (name, mean, p99, cpu))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import multiprocessing
+import time
+import unittest
+
+import numpy
+
+from cam_server.camera.frame_cache import LatestFrameCache
+
+
+def publish_frames(frame_cache, count):
+    for i in range(count):
+        frame_cache.publish(numpy.full((20, 30), i, dtype="uint16"), timestamp=float(i), pulse_id=i)
+
+
+class CameraFrameCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.frame_cache = LatestFrameCache(1024 * 1024)
+
+    def tearDown(self):
+        self.frame_cache.close()
+
+    def test_publish_and_get(self):
+        self.assertIsNone(self.frame_cache.get())
+
+        image = numpy.arange(200, dtype="float32").reshape(10, 20)
+        self.assertTrue(self.frame_cache.publish(image, timestamp=123.5, pulse_id=1000))
+        cached_image, timestamp, pulse_id = self.frame_cache.get()
+        numpy.testing.assert_array_equal(cached_image, image)
+        self.assertEqual(cached_image.dtype, image.dtype)
+        self.assertEqual(timestamp, 123.5)
+        self.assertEqual(pulse_id, 1000)
+
+        # The returned image is a copy.
+        cached_image[0, 0] = -1
+        self.assertEqual(self.frame_cache.get()[0][0, 0], 0)
+
+        # Shape change.
+        image = numpy.ones((30, 5), dtype="uint8")
+        self.assertTrue(self.frame_cache.publish(image))
+        cached_image, timestamp, pulse_id = self.frame_cache.get()
+        numpy.testing.assert_array_equal(cached_image, image)
+        self.assertIsNone(timestamp)
+        self.assertIsNone(pulse_id)
+
+        # Frames bigger than the cache are not published.
+        self.assertFalse(self.frame_cache.publish(numpy.zeros((1024, 1024), dtype="uint16")))
+        self.assertEqual(self.frame_cache.get()[0].shape, (30, 5))
+
+    def test_ttl_and_interval(self):
+        self.frame_cache.publish(numpy.zeros((10, 10)))
+        self.assertIsNotNone(self.frame_cache.get(ttl=1.0))
+        time.sleep(0.05)
+        self.assertIsNone(self.frame_cache.get(ttl=0.01))
+        self.assertIsNotNone(self.frame_cache.get())
+
+        frame_cache = LatestFrameCache(1024, interval=10.0)
+        try:
+            self.assertTrue(frame_cache.publish(numpy.zeros((4, 4))))
+            self.assertFalse(frame_cache.publish(numpy.ones((4, 4))))
+            self.assertEqual(frame_cache.get()[0].sum(), 0)
+        finally:
+            frame_cache.close()
+
+    def test_other_process(self):
+        process = multiprocessing.Process(target=publish_frames, args=(self.frame_cache, 100))
+        process.start()
+        process.join()
+        image, timestamp, pulse_id = self.frame_cache.get()
+        self.assertEqual(pulse_id, 99)
+        self.assertEqual(timestamp, 99.0)
+        self.assertTrue((image == 99).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
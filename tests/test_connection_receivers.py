@@ -0,0 +1,99 @@
+import multiprocessing
+import time
+import unittest
+
+import numpy
+
+from cam_server.camera.receivers import ConnectionReceivers
+
+CONNECTIONS = 3
+FRAMES = 30
+value_offset = 0
+
+
+def create_receiver(index):
+    pulse_ids = iter(range(index, FRAMES * CONNECTIONS, CONNECTIONS))
+
+    def receive():
+        pulse_id = next(pulse_ids, None)
+        if pulse_id is None:
+            time.sleep(0.01)
+            return None
+        if pulse_id == 4:
+            return pulse_id, None, index
+        return pulse_id, numpy.full((50, 60), pulse_id + value_offset, dtype="uint16"), index
+    return receive
+
+
+def set_value_offset(value):
+    global value_offset
+    value_offset = value
+
+
+class ConnectionReceiversTest(unittest.TestCase):
+
+    def setUp(self):
+        self.frames = {}
+        self.stop_event = multiprocessing.Event()
+        self.release = True
+        self.receivers = None
+
+    def tearDown(self):
+        if self.receivers:
+            self.receivers.close()
+
+    def on_frame(self, pulse_id, image, metadata, release):
+        slot = None if release is None else release.args[0]
+        self.frames[pulse_id] = (None if image is None else image.copy(), metadata, slot)
+        if self.release and release:
+            release()
+
+    def wait_frames(self, count, timeout=10.0):
+        start = time.time()
+        while (len(self.frames) < count) and (time.time() - start < timeout):
+            time.sleep(0.01)
+
+    def test_receive(self):
+        self.receivers = ConnectionReceivers(CONNECTIONS, 50 * 60 * 2, create_receiver, self.on_frame, set_value_offset,
+                                             slots=2, stop_event=self.stop_event)
+        self.wait_frames(FRAMES * CONNECTIONS)
+        self.assertEqual(sorted(self.frames.keys()), list(range(FRAMES * CONNECTIONS)))
+        for pulse_id, (image, index, slot) in self.frames.items():
+            self.assertEqual(index, pulse_id % CONNECTIONS)
+            if pulse_id == 4:
+                self.assertIsNone(image)
+                self.assertIsNone(slot)
+            else:
+                self.assertTrue((image == pulse_id).all())
+                # Each receiver uses its own slots.
+                self.assertEqual(slot // self.receivers.slots, index)
+        self.assertFalse(self.stop_event.is_set())
+
+    def test_not_released(self):
+        self.release = False
+        self.receivers = ConnectionReceivers(CONNECTIONS, 50 * 60 * 2, create_receiver, self.on_frame, slots=2,
+                                             stop_event=self.stop_event)
+        self.wait_frames(2 * CONNECTIONS + 1)
+        time.sleep(0.2)
+        # The receivers wait for a free slot when all their slots are in use (PID 4 does not use a slot).
+        self.assertEqual(sorted(self.frames.keys()), [0, 1, 2, 3, 4, 5, 7])
+        self.assertFalse(self.stop_event.is_set())
+
+        for _, _, slot in list(self.frames.values()):
+            if slot is not None:
+                self.receivers._release(slot)
+        self.wait_frames(4 * CONNECTIONS + 1)
+        time.sleep(0.2)
+        self.assertEqual(sorted(self.frames.keys()), list(range(12)) + [13])
+
+    def test_stop(self):
+        self.receivers = ConnectionReceivers(CONNECTIONS, 50 * 60 * 2, create_receiver, self.on_frame,
+                                             stop_event=self.stop_event)
+        self.stop_event.set()
+        start = time.time()
+        self.receivers.close()
+        self.assertLess(time.time() - start, 5.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
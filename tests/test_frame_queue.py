@@ -0,0 +1,61 @@
+import time
+import unittest
+from threading import Thread
+
+from cam_server.utils import FrameQueue, Statistics, init_statistics, set_statistics
+
+
+class FrameQueueTest(unittest.TestCase):
+
+    def test_drop_oldest(self):
+        queue = FrameQueue(maxlen=3)
+        for i in range(5):
+            queue.append(i)
+        self.assertEqual(len(queue), 3)
+        self.assertEqual(queue.dropped, 2)
+        self.assertEqual([queue.get(0), queue.get(0), queue.get(0)], [2, 3, 4])
+        self.assertIsNone(queue.get(0))
+
+        metrics = queue.get_metrics()
+        self.assertEqual(metrics["depth"], 0)
+        self.assertEqual(metrics["max_depth"], 3)
+        self.assertEqual(metrics["dropped"], 2)
+        self.assertGreater(metrics["wait_time"], 0)
+        # The depth and wait time are measured since the last call.
+        self.assertEqual(queue.get_metrics()["max_depth"], 0)
+        self.assertEqual(queue.get_metrics()["wait_time"], 0)
+
+    def test_blocking_get(self):
+        queue = FrameQueue(maxlen=10)
+        start = time.time()
+        self.assertIsNone(queue.get(0.05))
+        self.assertGreaterEqual(time.time() - start, 0.04)
+
+        def produce():
+            time.sleep(0.05)
+            queue.append("frame")
+        thread = Thread(target=produce)
+        thread.start()
+        start = time.time()
+        self.assertEqual(queue.get(5.0), "frame")
+        # Woken up when the item is appended, not at the timeout.
+        self.assertLess(time.time() - start, 1.0)
+        thread.join()
+
+    def test_statistics(self):
+        queues = [FrameQueue(maxlen=2), FrameQueue(maxlen=2)]
+        for i in range(3):
+            queues[0].append(i)
+        queues[1].append(0)
+        statistics = Statistics()
+        init_statistics(statistics)
+        self.assertIsNone(statistics.queue_depth)
+        statistics.timestamp = 0
+        set_statistics(statistics, None, 0, 0, queues=queues)
+        self.assertEqual(statistics.queue_depth, 3)
+        self.assertEqual(statistics.queue_dropped, 1)
+        self.assertEqual(statistics.queue_wait, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,16 @@
+import io
 import logging
 import unittest
 import numpy
+from PIL import Image
 from scipy import signal
 
-from cam_server.pipeline.data_processing.functions import gauss_fit, calculate_slices, linear_fit, find_index, chunk_copy
+from cam_server.pipeline.data_processing.functions import gauss_fit, calculate_slices, linear_fit, find_index, chunk_copy, \
+    _gauss_fit_curve_fit, get_image_statistics, get_min_max, get_x_y_profile, get_fwhm, get_good_region_profile, \
+    ResamplingMap, get_rotation_transform, rotate_region, ImageAverager, BufferPool, get_png_from_image, \
+    get_preview_from_image
+from cam_server.pipeline.data_processing.fitting import gauss_fit_lm, gauss_estimate, gauss_fit_batch, \
+    gauss_estimate_batch
 
 
 class FunctionsTest(unittest.TestCase):
@@ -25,6 +32,101 @@ class FunctionsTest(unittest.TestCase):
         self.assertAlmostEqual(standart_deviation_set, standard_deviation, delta=0.0001)
         self.assertAlmostEqual(int(size / 2) + center_set, center, delta=0.0001)
 
+    def test_gauss_fit_lm(self):
+        size = 1001
+        axis = numpy.linspace(-250, 250, size)
+        random = numpy.random.RandomState(0)
+
+        for center_set, standard_deviation_set, noise in [(0, 30, 0), (-60.5, 12.3, 5), (120, 70, 50)]:
+            data = 10 + 1000 * numpy.exp(-(axis - center_set) ** 2 / (2 * standard_deviation_set ** 2))
+            data += random.normal(0, noise, size) if noise else 0
+
+            offset, amplitude, center, standard_deviation = gauss_estimate(axis, data)
+            self.assertAlmostEqual(center_set, center, delta=standard_deviation_set * 0.2)
+            self.assertAlmostEqual(standard_deviation_set, standard_deviation, delta=standard_deviation_set * 0.2)
+
+            parameters, iterations, converged = gauss_fit_lm(axis, data)
+            self.assertTrue(converged)
+            self.assertLessEqual(iterations, 10)
+
+            # Must be equivalent to the former curve_fit implementation.
+            reference = _gauss_fit_curve_fit(axis, data)
+            numpy.testing.assert_allclose(parameters[1:3], reference[1:3], rtol=1e-5, atol=1e-5)
+            self.assertAlmostEqual(abs(parameters[3]), abs(reference[3]), delta=abs(reference[3]) * 1e-5)
+            self.assertAlmostEqual(parameters[0], reference[0], delta=reference[1] * 1e-5)
+
+    def test_gauss_fit_batch(self):
+        size = 501
+        axis = numpy.linspace(-250, 250, size)
+        random = numpy.random.RandomState(0)
+
+        profiles = [10 + 1000 * numpy.exp(-(axis - center) ** 2 / (2 * standard_deviation ** 2)) +
+                    random.normal(0, 5, size) for center, standard_deviation in [(0, 30), (-60.5, 12.3), (120, 70)]]
+        # Flat profile cannot be fitted.
+        profiles.append(numpy.zeros(size))
+        profiles = numpy.array(profiles)
+
+        estimation = gauss_estimate_batch(axis, profiles)
+        for profile, row in zip(profiles[:3], estimation[:3]):
+            numpy.testing.assert_allclose(row, gauss_estimate(axis, profile), rtol=1e-9)
+
+        parameters, iterations, converged = gauss_fit_batch(axis, profiles)
+        self.assertEqual(parameters.shape, (4, 4))
+        self.assertListEqual(list(converged), [True, True, True, False])
+
+        # Each row must be equivalent to the single profile fit.
+        for profile, row, row_iterations in zip(profiles[:3], parameters[:3], iterations[:3]):
+            reference, reference_iterations, _ = gauss_fit_lm(axis, profile)
+            numpy.testing.assert_allclose(row, reference, rtol=1e-9)
+            self.assertEqual(row_iterations, reference_iterations)
+
+        with self.assertRaises(RuntimeError):
+            gauss_fit_batch(axis, profiles[:, 1:])
+
+    def test_get_image_statistics(self):
+        random = numpy.random.RandomState(0)
+        image = random.randint(0, 4096, size=(300, 400)).astype("uint16")
+        float_image = image.astype("float64")
+        float_image[10, 20] = numpy.nan
+
+        # Also on views, as good regions.
+        for data in [image, image[10:200, 50:300], image.astype("int32"), float_image]:
+            min_value, max_value, x_profile, y_profile, intensity = get_image_statistics(data)
+            self.assertEqual((min_value, max_value), get_min_max(data))
+            reference_x_profile, reference_y_profile = get_x_y_profile(data)
+            numpy.testing.assert_array_equal(x_profile, reference_x_profile)
+            numpy.testing.assert_array_equal(y_profile, reference_y_profile)
+            self.assertEqual(x_profile.dtype, reference_x_profile.dtype)
+            if data.dtype.kind != "f":
+                self.assertEqual(intensity, reference_x_profile.sum())
+
+    def test_get_fwhm(self):
+        standard_deviation = 10
+        expected_fwhm = 2 * numpy.sqrt(2 * numpy.log(2)) * standard_deviation
+        for size in [41, 1001]:
+            axis = numpy.linspace(-50, 50, size)
+            profile = 100 + 1000 * numpy.exp(-axis ** 2 / (2 * standard_deviation ** 2))
+            step = axis[1] - axis[0]
+
+            # First samples below the half maximum.
+            self.assertAlmostEqual(get_fwhm(axis, profile), expected_fwhm, delta=2 * step)
+            self.assertAlmostEqual(get_fwhm(axis[::-1], profile), get_fwhm(axis, profile))
+            self.assertAlmostEqual(get_fwhm(axis, profile, interpolate=True), expected_fwhm, delta=step * 0.05)
+
+        # Half maximum not crossed on the right side: uses the last sample.
+        axis = numpy.arange(10.0)
+        profile = numpy.array([0, 1, 2, 10, 9, 8, 7, 7, 6, 6])
+        self.assertEqual(get_fwhm(axis, profile), 7.0)
+        self.assertEqual(get_fwhm(axis, profile, interpolate=True), 9 - (2 + 3 / 8))
+
+    def test_get_good_region_profile(self):
+        profile = numpy.array([0, 0, 1, 2, 5, 9, 10, 8, 4, 1, 0, 0, 0, 0, 0, 0])
+        self.assertEqual(get_good_region_profile(profile, threshold=0.3, gfscale=1.0), (3, 9))
+        # Extended by gfscale.
+        self.assertEqual(get_good_region_profile(profile, threshold=0.3, gfscale=2.0), (0, 12))
+        # Threshold not crossed on the left side.
+        self.assertEqual(get_good_region_profile(profile[5:], threshold=0.3, gfscale=1.0), (1, 4))
+
     def test_calculate_slices(self):
         size = 1000
         center = 300
@@ -94,6 +196,107 @@ class FunctionsTest(unittest.TestCase):
         self.assertEqual(indexes, [0, 2])
         print(indexes)
 
+    def test_resampling_map(self):
+        random = numpy.random.RandomState(0)
+        image = random.randint(0, 4000, size=(60, 80)).astype("uint16")
+        for order in [0, 1]:
+            for mode in ["0.0", "10", "constant", "nearest", "reflect", "mirror"]:
+                for angle in [30, -115]:
+                    matrix, offset = get_rotation_transform(image.shape, angle)
+                    offset = offset + [-5, 12]
+                    expected = rotate_region(image, matrix, offset, (50, 90), order, mode)
+                    resampling_map = ResamplingMap(image.shape, (50, 90), matrix, offset, order, mode)
+                    for _ in range(2):
+                        result = resampling_map.resample(image)
+                        self.assertEqual(result.dtype, image.dtype)
+                        # Bilinear weights are kept in single precision: rounding may differ by one.
+                        numpy.testing.assert_allclose(result, expected, atol=1 if order else 0, rtol=0)
+
+        # Images do not need to be contiguous.
+        window = image[5:45, 10:70]
+        matrix, offset = get_rotation_transform(window.shape, 45)
+        resampling_map = ResamplingMap(window.shape, window.shape, matrix, offset, 1, "nearest")
+        numpy.testing.assert_allclose(resampling_map.resample(window),
+                                      rotate_region(window, matrix, offset, window.shape, 1, "nearest"), atol=1, rtol=0)
+
+        self.assertFalse(ResamplingMap.is_supported(3, "0.0"))
+        self.assertFalse(ResamplingMap.is_supported(1, "wrap"))
+        with self.assertRaises(ValueError):
+            resampling_map.resample(image)
+
+    def test_image_averager(self):
+        random = numpy.random.RandomState(0)
+        frames = [random.randint(0, 0xFFFF, size=(20, 30)).astype("uint16") for _ in range(12)]
+
+        # Continuous: average of the last images.
+        for buffer_pool in [None, BufferPool()]:
+            averager = ImageAverager(5, continuous=True)
+            for i, frame in enumerate(frames):
+                result = averager.add(frame, buffer_pool)
+                self.assertEqual(result.dtype, numpy.float64)
+                numpy.testing.assert_allclose(result, numpy.average(frames[max(0, i - 4):i + 1], 0))
+
+        # Not continuous: one output every size frames.
+        averager = ImageAverager(4)
+        results = [averager.add(frame) for frame in frames]
+        for i, result in enumerate(results):
+            if (i + 1) % 4:
+                self.assertIsNone(result)
+            else:
+                numpy.testing.assert_allclose(result, numpy.average(frames[i - 3:i + 1], 0))
+
+        # Float images.
+        averager = ImageAverager(3, continuous=True)
+        float_frames = [frame.astype("float32") / 7 for frame in frames]
+        for i, frame in enumerate(float_frames):
+            result = averager.add(frame)
+        numpy.testing.assert_allclose(result, numpy.average(float_frames[-3:], 0), rtol=1e-6)
+
+        # A different shape restarts the average.
+        averager = ImageAverager(3, continuous=True)
+        for frame in frames[:5]:
+            averager.add(frame)
+        small_frames = [frame[:10, :10].copy() for frame in frames[5:7]]
+        averager.add(small_frames[0])
+        numpy.testing.assert_allclose(averager.add(small_frames[1]), numpy.average(small_frames, 0))
+
+        # Exponential moving average.
+        averager = ImageAverager(4, exponential=True)
+        expected = frames[0].astype("float64")
+        numpy.testing.assert_allclose(averager.add(frames[0]), expected)
+        for frame in frames[1:]:
+            expected = expected + 0.4 * (frame - expected)
+            numpy.testing.assert_allclose(averager.add(frame), expected)
+
+    def test_get_preview_from_image(self):
+        random = numpy.random.RandomState(0)
+
+        def decode(content):
+            return numpy.array(Image.open(io.BytesIO(content)))
+
+        for image in [random.randint(0, 4000, size=(60, 80)).astype("uint16"),
+                      random.randint(0, 255, size=(60, 80)).astype("uint8"),
+                      random.randint(-100, 4000, size=(60, 80)).astype("int32"),
+                      random.rand(60, 80).astype("float32") * 100]:
+            for parameters in [{}, {"min_value": 50}, {"min_value": 10, "max_value": 30}, {"scale": 0.5},
+                               {"colormap_name": "viridis"}]:
+                expected = decode(get_png_from_image(image.copy(), **parameters))[:, :, :3]
+                preview = decode(get_preview_from_image(image.copy(), **parameters))
+                numpy.testing.assert_array_equal(preview, expected)
+
+        image = random.randint(0, 4000, size=(60, 80)).astype("uint16")
+        self.assertEqual(decode(get_preview_from_image(image, decimation=3)).shape, (20, 27, 3))
+        expected = decode(get_preview_from_image(image))
+        for image_format in ["jpeg", "jpg", "webp"]:
+            preview = decode(get_preview_from_image(image, image_format=image_format, quality=100))
+            self.assertEqual(preview.shape, expected.shape)
+        numpy.testing.assert_array_equal(decode(get_preview_from_image(image, compression=9)), expected)
+
+        with self.assertRaises(ValueError):
+            get_preview_from_image(image, image_format="bmp")
+        with self.assertRaises(ValueError):
+            get_preview_from_image(image, colormap_name="invalid")
+
     def test_find_index(self):
         size = 300
         axis = numpy.array(range(size)).astype('f')
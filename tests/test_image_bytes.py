@@ -0,0 +1,80 @@
+import base64
+import unittest
+from threading import Thread
+from types import SimpleNamespace
+from wsgiref.simple_server import make_server, WSGIRequestHandler
+
+import bottle
+import numpy
+import requests
+
+from cam_server.pipeline.rest_api.rest_server import register_rest_interface
+from cam_server_client import PipelineClient
+from cam_server_client.utils import encode_image, decode_image, get_image_encodings
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class ImageBytesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.image = numpy.random.randint(0, 4000, size=(120, 160)).astype("uint16")
+
+    def test_encode_decode(self):
+        for image_format in ("raw", "npy"):
+            for encoding in [None] + get_image_encodings():
+                body, headers = encode_image(self.image, image_format, encoding)
+                self.assertEqual(headers.get("Content-Encoding"),
+                                 None if (encoding == "bitshuffle_lz4" and image_format == "npy") else encoding)
+                image = decode_image(body, headers)
+                numpy.testing.assert_array_equal(image, self.image)
+                self.assertEqual(image.dtype, self.image.dtype)
+
+        body, headers = encode_image(self.image, "raw", "gzip, deflate")
+        self.assertEqual(len(body), self.image.nbytes)
+        self.assertNotIn("Content-Encoding", headers)
+
+        # Non contiguous image.
+        body, headers = encode_image(self.image[::2, 10:20], "raw")
+        numpy.testing.assert_array_equal(decode_image(body, headers), self.image[::2, 10:20])
+
+    def test_background_image_bytes(self):
+        backgrounds = {"test_background": self.image}
+        instance_manager = SimpleNamespace(background_manager=SimpleNamespace(get_background=backgrounds.get))
+        app = bottle.Bottle()
+        register_rest_interface(app, instance_manager)
+
+        server = make_server("127.0.0.1", 0, app, handler_class=QuietHandler)
+        thread = Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            client = PipelineClient("http://127.0.0.1:%d" % server.server_port)
+
+            image = client.get_background_image_array("test_background")
+            numpy.testing.assert_array_equal(image, self.image)
+
+            image = client.get_background_image_bytes("test_background")
+            self.assertEqual(image["shape"], [120, 160])
+            self.assertEqual(image["dtype"], "<u2")
+            image_array = numpy.frombuffer(base64.b64decode(image["bytes"].encode()), dtype=image["dtype"])
+            numpy.testing.assert_array_equal(image_array.reshape(image["shape"]), self.image)
+
+            # JSON response if no binary format is requested.
+            url = client.api_address_format % "/background/test_background/image_bytes"
+            response = requests.get(url)
+            self.assertEqual(response.json()["image"], image)
+
+            response = requests.get(url + "?format=npy", headers={"Accept-Encoding": "identity"})
+            self.assertEqual(response.headers["Content-Type"], "application/x-npy")
+            numpy.testing.assert_array_equal(decode_image(response.content, response.headers), self.image)
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import time
+import unittest
+
+from cam_server.utils import JitterBuffer
+
+
+class JitterBufferTest(unittest.TestCase):
+
+    def test_reorder(self):
+        buffer = JitterBuffer(latency=10.0)
+        for pulse_id in [100, 102, 106, 104]:
+            buffer.put(pulse_id, str(pulse_id))
+        # The increment is not known yet: the first frame waits for the latency.
+        self.assertIsNone(buffer.pop())
+        buffer.latency = 0.0
+        self.assertEqual(buffer.pop(), (100, "100"))
+        self.assertEqual(buffer.pop(), (102, "102"))
+        self.assertEqual(buffer.increment, 2)
+        buffer.latency = 10.0
+        self.assertEqual(buffer.pop(), (104, "104"))
+        self.assertEqual(buffer.pop(), (106, "106"))
+        self.assertIsNone(buffer.pop())
+        self.assertEqual(buffer.reordered, 1)
+
+        # Missing pulse id: the next frame waits for the latency.
+        buffer.put(110, "110")
+        self.assertIsNone(buffer.pop())
+        buffer.latency = 0.02
+        self.assertEqual(buffer.get(5.0), (110, "110"))
+        self.assertEqual(buffer.increment, 2)
+
+        # Late frames are dropped.
+        buffer.put(108, "108")
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(buffer.late, 1)
+
+        metrics = buffer.get_metrics()
+        self.assertEqual(metrics["released"], 5)
+        self.assertEqual(metrics["late"], 1)
+        self.assertEqual(metrics["max_depth"], 4)
+        self.assertEqual(metrics["increment"], 2)
+
+    def test_increment_detection(self):
+        buffer = JitterBuffer(latency=0.0, increment_window=4)
+        for pulse_id in [0, 3, 6, 9, 10, 11]:
+            buffer.put(pulse_id, None)
+            buffer.pop()
+        self.assertEqual(buffer.increment, 1)
+        for pulse_id in [13, 15, 17, 19, 21]:
+            buffer.put(pulse_id, None)
+            buffer.pop()
+        self.assertEqual(buffer.increment, 2)
+
+    def test_full_and_reset(self):
+        buffer = JitterBuffer(latency=10.0, maxlen=3, increment_window=2)
+        for pulse_id in [10, 20, 30, 40]:
+            buffer.put(pulse_id, pulse_id)
+        self.assertEqual(buffer.pop(), (10, 10))
+        self.assertIsNone(buffer.pop())
+
+        # Consecutive late frames: pulse id reset. The frames received before the reset are released first.
+        for pulse_id in [1, 2, 3]:
+            buffer.put(pulse_id, pulse_id)
+        self.assertEqual(buffer.late, 3)
+        self.assertEqual(len(buffer), 4)
+        self.assertEqual([buffer.pop() for _ in range(3)], [(20, 20), (30, 30), (40, 40)])
+        self.assertIsNone(buffer.pop())
+        buffer.latency = 0.0
+        self.assertEqual(buffer.pop(), (3, 3))
+
+    def test_reset_after_increment(self):
+        buffer = JitterBuffer(latency=0.1)
+        for pulse_id in range(1000, 1020):
+            buffer.put(pulse_id, pulse_id)
+        self.assertEqual([buffer.get(1.0)[0] for _ in range(19)], list(range(1000, 1019)))
+        self.assertEqual(buffer.increment, 1)
+
+        # Camera restarted: 1019 was not released yet, and is released before the new pulse ids.
+        for pulse_id in range(1, 20):
+            buffer.put(pulse_id, pulse_id)
+        self.assertIsNone(buffer.increment)
+        released = [buffer.get(1.0) for _ in range(4)]
+        self.assertEqual([pulse_id for pulse_id, _ in released], [1019, 17, 18, 19])
+        self.assertEqual(buffer.increment, 1)
+        self.assertIsNone(buffer.get(0.2))
+
+    def test_blocking_get(self):
+        buffer = JitterBuffer(latency=0.05)
+        buffer.put(1, "a")
+        start = time.time()
+        self.assertEqual(buffer.get(5.0), (1, "a"))
+        self.assertGreaterEqual(time.time() - start, 0.04)
+        self.assertIsNone(buffer.get(0.01))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from cam_server.lazy_import import lazy_import, lazy_jit, LazyModule
+
+HEAVY_MODULES = ["scipy", "matplotlib", "PIL", "numba", "h5py"]
+
+# Starts an instance in a pooled worker of a camera manager, which prints the modules imported by the worker.
+CAMERA_WORKER_SCRIPT = """
+import sys, time
+from cam_server.camera.management import CameraInstanceManager
+from cam_server.instance_management.management import InstanceWrapper
+
+def process_function(stop_event, statistics, parameter_queue):
+    print(' '.join(sys.modules), flush=True)
+    stop_event.clear()
+    stop_event.wait()
+
+manager = CameraInstanceManager(None)
+worker_pool = manager.get_worker_pool()
+while len(worker_pool._workers) < worker_pool.size:
+    time.sleep(0.01)
+# Lets the workers preload the modules.
+time.sleep(2.0)
+manager.add_instance('test', InstanceWrapper('test', process_function, None))
+manager.start_instance('test')
+manager.stop_all_instances()
+worker_pool.close()
+"""
+
+
+def get_imported_modules(module_name):
+    # Imports the module in a new interpreter, with the same path.
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.check_output([sys.executable, "-c", "import sys, %s; print(' '.join(sys.modules))" %
+                                      module_name], env=env)
+    return output.decode().split()
+
+
+class LazyImportTest(unittest.TestCase):
+
+    def test_lazy_import(self):
+        sys.modules.pop("colorsys", None)
+        colorsys = lazy_import("colorsys")
+        self.assertIsInstance(colorsys, LazyModule)
+        self.assertNotIn("colorsys", sys.modules)
+        self.assertEqual(colorsys.rgb_to_hsv(1.0, 0.0, 0.0), (0.0, 1.0, 1.0))
+        self.assertIn("colorsys", sys.modules)
+
+        self.assertIsNone(lazy_import("not_installed_module"))
+
+        xml = lazy_import("xml", ("dom.minidom",))
+        self.assertIsNotNone(xml.dom.minidom.parseString("<a/>"))
+
+    def test_lazy_jit(self):
+        if lazy_import("numba") is None:
+            return
+
+        @lazy_jit(nogil=True)
+        def add(a, b):
+            return a + b
+
+        self.assertEqual(add(1, 2), 3)
+        self.assertEqual(add.__name__, "add")
+
+    def test_server_imports(self):
+        for module_name in ("cam_server.start_camera_worker", "cam_server.start_pipeline_worker",
+                            "cam_server.start_camera_proxy"):
+            modules = get_imported_modules(module_name)
+            self.assertIn(module_name, modules)
+            for heavy_module in HEAVY_MODULES:
+                self.assertNotIn(heavy_module, modules, "%s imported by %s" % (heavy_module, module_name))
+
+    def test_camera_worker_imports(self):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        modules = subprocess.check_output([sys.executable, "-c", CAMERA_WORKER_SCRIPT], env=env).decode().split()
+        self.assertIn("cam_server.camera.sender", modules)
+        for heavy_module in HEAVY_MODULES + ["cam_server.pipeline.transceiver"]:
+            self.assertNotIn(heavy_module, modules, "%s imported by the camera workers" % (heavy_module,))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import multiprocessing
+import os
+import time
+import unittest
+from threading import Thread
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy
+
+from cam_server import config
+from cam_server.pipeline.configuration import PipelineConfig
+from cam_server.pipeline import transceiver
+from cam_server.utils import Statistics, PulseIdJoin
+
+# Pulse ids received from each camera.
+CAMERA_PULSE_IDS = {"camera1": list(range(20)),
+                    "camera2": [pulse_id for pulse_id in range(20) if pulse_id != 5],
+                    "camera3": list(range(3, 20))}
+
+
+class MockSource(object):
+    def __init__(self, camera_name):
+        self.camera_name = camera_name
+        self.pulse_ids = iter(CAMERA_PULSE_IDS[camera_name])
+        self.total_bytes = 0
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def receive(self):
+        pulse_id = next(self.pulse_ids, None)
+        if pulse_id is None:
+            time.sleep(0.01)
+            return None
+        time.sleep(0.001)
+        image = numpy.full((10, 20), pulse_id, dtype="uint16")
+        self.total_bytes += image.nbytes
+        values = {"image": image, "x_axis": numpy.arange(20), "y_axis": numpy.arange(10), "timestamp": pulse_id / 100.0}
+        return SimpleNamespace(data=SimpleNamespace(pulse_id=pulse_id, global_timestamp=pulse_id,
+                                                    global_timestamp_offset=0,
+                                                    data={k: SimpleNamespace(value=v) for k, v in values.items()}),
+                               statistics=SimpleNamespace(total_bytes_received=self.total_bytes))
+
+
+class MockSender(object):
+    def __init__(self):
+        self.messages = []
+        self.stream = None
+        self.create_header = None
+        self.data_format = None
+        self.records = None
+
+    def send(self, data, timestamp, pulse_id, check_data):
+        self.messages.append((pulse_id, data))
+
+    def close(self):
+        pass
+
+
+class MultiCameraPipelineTest(unittest.TestCase):
+
+    def run_pipeline(self, parameters, new_parameters=None):
+        stop_event = multiprocessing.Event()
+        parameter_queue = multiprocessing.Queue()
+        statistics = Statistics()
+        sender = MockSender()
+        cam_client = mock.Mock()
+        cam_client.get_instance_stream.side_effect = lambda camera_name: camera_name
+        pipeline_config = PipelineConfig("test_pipeline", parameters)
+
+        def run():
+            with self.assertRaises(SystemExit):
+                transceiver.multi_camera_pipeline(stop_event, statistics, parameter_queue, cam_client,
+                                                  pipeline_config, 12000, None)
+
+        with mock.patch.object(transceiver, "create_source", MockSource), \
+                mock.patch.object(transceiver, "create_sender", lambda *args: sender):
+            thread = Thread(target=run)
+            thread.start()
+            if new_parameters is not None:
+                time.sleep(0.5)
+                parameter_queue.put(new_parameters)
+            time.sleep(1.0)
+            stop_event.set()
+            thread.join(5.0)
+        self.assertFalse(thread.is_alive())
+        return sender.messages
+
+    def test_synchronized_images(self):
+        messages = self.run_pipeline({"pipeline_type": config.PIPELINE_TYPE_MULTI_CAMERA,
+                                      "camera_names": ["camera1", "camera2", "camera3"]})
+        # Only the pulse ids received from all cameras.
+        self.assertEqual([pulse_id for pulse_id, _ in messages], [pulse_id for pulse_id in range(3, 20) if pulse_id != 5])
+        for pulse_id, data in messages:
+            for camera_name in CAMERA_PULSE_IDS:
+                self.assertTrue((data[camera_name + config.EPICS_PV_SUFFIX_IMAGE] == pulse_id).all())
+                self.assertEqual(len(data[camera_name + ":x_axis"]), 20)
+
+    def test_function(self):
+        messages = self.run_pipeline({"pipeline_type": config.PIPELINE_TYPE_MULTI_CAMERA,
+                                      "camera_names": ["camera1", "camera2"],
+                                      "function": os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                   "user_scripts/multi_camera_example.py")})
+        self.assertEqual([pulse_id for pulse_id, _ in messages], [pulse_id for pulse_id in range(20) if pulse_id != 5])
+        for pulse_id, data in messages:
+            self.assertEqual(data["cameras"], ["camera1", "camera2"])
+            self.assertEqual(data["intensity"], pulse_id * 200 * 2)
+
+    def test_function_error(self):
+        parameters = {"pipeline_type": config.PIPELINE_TYPE_MULTI_CAMERA,
+                      "camera_names": ["camera1", "camera2"],
+                      "function": os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                               "user_scripts/multi_camera_error.py")}
+        messages = self.run_pipeline(dict(parameters, abort_on_error=False))
+        # Only the failed pulse id is not sent.
+        self.assertEqual([pulse_id for pulse_id, _ in messages], [pulse_id for pulse_id in range(20)
+                                                                 if pulse_id not in (5, 7)])
+        messages = self.run_pipeline(parameters)
+        self.assertEqual([pulse_id for pulse_id, _ in messages], [0, 1, 2, 3, 4, 6])
+
+    def test_sync_parameters(self):
+        parameters = {"pipeline_type": config.PIPELINE_TYPE_MULTI_CAMERA, "camera_names": ["camera1", "camera2"]}
+        joins = []
+
+        def create_join(*args, **kwargs):
+            joins.append(kwargs)
+            return PulseIdJoin(*args, **kwargs)
+
+        with mock.patch.object(transceiver, "PulseIdJoin", create_join):
+            messages = self.run_pipeline(parameters, dict(parameters, sync_timeout=0.5, image_threshold=10))
+        # The synchronization is recreated only if its parameters change.
+        self.assertEqual([join["max_age"] for join in joins], [config.PIPELINE_SYNC_TIMEOUT, 0.5])
+        self.assertEqual([pulse_id for pulse_id, _ in messages], [pulse_id for pulse_id in range(20) if pulse_id != 5])
+
+        joins.clear()
+        with mock.patch.object(transceiver, "PulseIdJoin", create_join):
+            self.run_pipeline(parameters, dict(parameters, image_threshold=10))
+        self.assertEqual(len(joins), 1)
+
+    def test_config(self):
+        configuration = PipelineConfig("test_pipeline", {"pipeline_type": config.PIPELINE_TYPE_MULTI_CAMERA,
+                                                         "camera_names": ["camera1", "camera2"]})
+        self.assertEqual(configuration.get_camera_name(), "camera1")
+        with self.assertRaisesRegex(ValueError, "camera_names must be a list"):
+            PipelineConfig("test_pipeline", {"pipeline_type": config.PIPELINE_TYPE_MULTI_CAMERA})
+        with self.assertRaisesRegex(ValueError, "duplicated"):
+            PipelineConfig("test_pipeline", {"pipeline_type": config.PIPELINE_TYPE_MULTI_CAMERA,
+                                             "camera_names": ["camera1", "camera1"]})
+
+
+if __name__ == '__main__':
+    unittest.main()
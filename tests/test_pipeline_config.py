@@ -319,6 +319,14 @@ class PipelineConfigTest(unittest.TestCase):
         with self.assertRaisesRegex(ValueError, "number_of_slices must be an integer"):
             PipelineConfig.validate_pipeline_config(expanded_configuration)
 
+    def test_invalid_image_rois(self):
+        configuration = {"camera_name": "simulation",
+                         "image_rois": {"roi_a": [0, 10, 0, 10], "roi_b": [0, 10]}}
+
+        expanded_configuration = PipelineConfig.expand_config(configuration)
+        with self.assertRaisesRegex(ValueError, "Invalid ROI 'roi_b'"):
+            PipelineConfig.validate_pipeline_config(expanded_configuration)
+
     def test_invalid_pipeline_type(self):
         configuration = {"camera_name": "simulation"}
         expanded_configuration = PipelineConfig.expand_config(configuration)
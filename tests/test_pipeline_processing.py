@@ -1,12 +1,16 @@
 import json
 import time
+import tracemalloc
 import unittest
 
 import numpy
 
 from cam_server.pipeline.configuration import PipelineConfig
-from cam_server.pipeline.data_processing.functions import calculate_slices, subtract_background
+from cam_server.pipeline.data_processing.functions import calculate_slices, subtract_background, BufferPool, rotate, \
+    binning
 from cam_server.pipeline.data_processing.default import process_image
+from cam_server.pipeline.data_processing.fitting import GaussFitState
+from cam_server.pipeline.data_processing.pre_processor import process_image as pre_process_image, PreProcessingPlan
 from cam_server.utils import sum_images
 from tests.helpers.factory import MockBackgroundManager
 from tests import get_simulated_camera
@@ -300,6 +304,223 @@ class PipelineProcessingTest(unittest.TestCase):
         self.assertNotEqual(result_1["slice_0_center_x"], result_3["slice_0_center_x"])
         self.assertNotEqual(result_1["slice_0_center_y"], result_3["slice_0_center_y"])
 
+    def test_fit_warm_start(self):
+        height, width = 200, 300
+        x_axis = numpy.linspace(0, width - 1, width, dtype='f')
+        y_axis = numpy.linspace(0, height - 1, height, dtype='f')
+        random = numpy.random.RandomState(0)
+
+        def get_image(center_x, center_y):
+            # Not exactly gaussian beam, so that the fit needs a few iterations.
+            x = numpy.exp(-(x_axis - center_x) ** 2 / (2 * 15.0 ** 2)) + \
+                0.3 * numpy.exp(-(x_axis - center_x - 25) ** 2 / (2 * 20.0 ** 2))
+            y = numpy.exp(-(y_axis - center_y) ** 2 / (2 * 10.0 ** 2))
+            image = 100 + 1000 * numpy.outer(y, x) + random.normal(0, 5, (height, width))
+            return image.astype("uint16")
+
+        cold_parameters = PipelineConfig("test_pipeline", {
+            "camera_name": "simulation",
+            "image_good_region": {"threshold": 0.3, "gfscale": 1.8}
+        }).get_configuration()
+        warm_parameters = dict(cold_parameters, fit_warm_start=True)
+
+        # Stable beam.
+        centers = [(150 + random.normal(0, 0.5), 100 + random.normal(0, 0.5)) for _ in range(10)]
+        images = [get_image(center_x, center_y) for center_x, center_y in centers]
+
+        cold_iterations = 0
+        for image in images:
+            result = process_image(image, 0, time.time(), x_axis, y_axis, warm_parameters, fit_state=GaussFitState())
+            cold_iterations += result["x_fit_iterations"] + result["y_fit_iterations"]
+
+        fit_state = GaussFitState()
+        warm_iterations = 0
+        for image in images:
+            # Without fit_warm_start the state is not used.
+            cold_result = process_image(image, 0, time.time(), x_axis, y_axis, cold_parameters, fit_state=fit_state)
+            warm_result = process_image(image, 0, time.time(), x_axis, y_axis, warm_parameters, fit_state=fit_state)
+
+            self.assertNotIn("x_fit_iterations", cold_result)
+            for key in ["x_fit_iterations", "y_fit_iterations", "gr_x_fit_iterations", "gr_y_fit_iterations"]:
+                self.assertGreater(warm_result[key], 0)
+            for key in ["x_fit_mean", "y_fit_mean", "x_fit_standard_deviation", "y_fit_standard_deviation",
+                        "gr_x_fit_mean", "gr_y_fit_standard_deviation"]:
+                self.assertAlmostEqual(cold_result[key], warm_result[key], delta=abs(cold_result[key]) * 1e-3)
+            warm_iterations += warm_result["x_fit_iterations"] + warm_result["y_fit_iterations"]
+
+        self.assertGreater(fit_state.warm_starts, 0)
+        self.assertLessEqual(warm_iterations, cold_iterations)
+
+        # Jump of the beam: falls back to a cold start.
+        cold_starts = fit_state.cold_starts
+        result = process_image(get_image(60, 40), 0, time.time(), x_axis, y_axis, warm_parameters, fit_state=fit_state)
+        self.assertEqual(fit_state.cold_starts, cold_starts + 4)
+        self.assertAlmostEqual(result["y_fit_mean"], 40, delta=0.5)
+
+    def test_image_rois(self):
+        simulated_camera = get_simulated_camera()
+        image = simulated_camera.get_image()
+        x_axis, y_axis = simulated_camera.get_x_y_axis()
+
+        rois = {"roi_a": [10, 100, 20, 50], "roi_b": [300, 200, 150, 100], "roi_c": [0, 400, 0, 200]}
+        parameters = PipelineConfig("test_pipeline", {
+            "camera_name": "simulation",
+            "image_rois": rois
+        }).get_configuration()
+
+        result = process_image(image, 0, time.time(), x_axis, y_axis, parameters)
+
+        for name, (offset_x, size_x, offset_y, size_y) in rois.items():
+            roi_image = image[offset_y:offset_y + size_y, offset_x:offset_x + size_x]
+            roi_x_axis = x_axis[offset_x:offset_x + size_x]
+            roi_y_axis = y_axis[offset_y:offset_y + size_y]
+
+            numpy.testing.assert_array_equal(result[name + "_x_profile"], roi_image.sum(0))
+            numpy.testing.assert_array_equal(result[name + "_y_profile"], roi_image.sum(1))
+            self.assertEqual(result[name + "_intensity"], roi_image.sum())
+            self.assertAlmostEqual(result[name + "_x_center_of_mass"],
+                                   (roi_x_axis * roi_image.sum(0)).sum() / roi_image.sum(), delta=1e-3)
+            self.assertAlmostEqual(result[name + "_y_center_of_mass"],
+                                   (roi_y_axis * roi_image.sum(1)).sum() / roi_image.sum(), delta=1e-3)
+
+        # Full image ROI is the same as the image profiles.
+        numpy.testing.assert_array_equal(result["roi_c_x_profile"], result["x_profile"])
+        self.assertEqual(result["roi_c_intensity"], result["intensity"])
+
+    def test_pre_processing_buffer_pool(self):
+        height, width = 1024, 1024
+        random = numpy.random.RandomState(0)
+        frames = [random.randint(0, 1000, size=(height, width)).astype("uint16") for _ in range(4)]
+        x_axis = numpy.linspace(0, width - 1, width, dtype='f')
+        y_axis = numpy.linspace(0, height - 1, height, dtype='f')
+        background = random.randint(0, 50, size=(height, width)).astype("uint16")
+        binned_background = random.randint(0, 50, size=(height // 2, width // 2)).astype("uint16")
+
+        for parameters, image_background_array in [
+            ({"image_background_enable": True, "image_threshold": 30,
+              "image_region_of_interest": [10, 300, 20, 200]}, background),
+            ({"binning_x": 2, "binning_y": 2, "image_background_enable": True, "image_threshold": 30},
+             binned_background),
+            ({"binning_x": 2, "binning_y": 2, "binning_mean": True, "image_background_enable": "signed",
+              "image_threshold": 3}, binned_background)]:
+            buffer_pool = BufferPool()
+
+            # Same results as without buffer pool.
+            for frame in frames:
+                expected = pre_process_image(frame.copy(), 0, 0, x_axis, y_axis, dict(parameters),
+                                             image_background_array)
+                result = pre_process_image(frame.copy(), 0, 0, x_axis, y_axis, dict(parameters),
+                                           image_background_array, buffer_pool)
+                numpy.testing.assert_array_equal(result[0], expected[0])
+                self.assertEqual(result[0].dtype, expected[0].dtype)
+                numpy.testing.assert_array_equal(result[1], expected[1])
+
+            # Steady state: no buffer allocated, and no memory allocated in the size of the frame.
+            allocations = buffer_pool.allocations
+            images = [frame.copy() for frame in frames]
+            tracemalloc.start()
+            try:
+                start_memory, _ = tracemalloc.get_traced_memory()
+                for i in range(20):
+                    image = images[i % len(images)]
+                    image[:] = frames[i % len(frames)]
+                    result = pre_process_image(image, 0, 0, x_axis, y_axis, dict(parameters),
+                                               image_background_array, buffer_pool)
+                    del result
+                _, peak_memory = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            self.assertEqual(buffer_pool.allocations, allocations)
+            self.assertLess(peak_memory - start_memory, frames[0].nbytes / 8)
+
+        # A buffer is not reused while referenced.
+        buffer_pool = BufferPool()
+        buffer = buffer_pool.get((10, 10), "uint16")
+        view = buffer[2:5]
+        del buffer
+        self.assertIsNot(buffer_pool.get((10, 10), "uint16").base, view.base)
+        del view
+        self.assertEqual(buffer_pool.allocations, 2)
+        buffer_pool.get((10, 10), "uint16")
+        self.assertEqual(buffer_pool.allocations, 2)
+
+    def test_pre_processing_plan(self):
+        height, width = 600, 800
+        random = numpy.random.RandomState(0)
+        y, x = numpy.mgrid[:height, :width]
+        frame = (1000 * numpy.exp(-((x - 400) ** 2 + (y - 300) ** 2) / 5000.) +
+                 random.randint(0, 50, size=(height, width))).astype("uint16")
+        x_axis = numpy.linspace(0, width - 1, width, dtype='f')
+        y_axis = numpy.linspace(0, height - 1, height, dtype='f')
+        background = random.randint(0, 30, size=(height // 2, width // 2)).astype("uint16")
+
+        for rotation in [{"angle": 30, "order": 1, "mode": "0.0"}, {"angle": -70, "order": 0, "mode": "reflect"},
+                         {"angle": 90, "order": 1, "mode": "ortho"}, {"angle": 15, "order": 3, "mode": "nearest"}]:
+            parameters = {"binning_x": 2, "binning_y": 2, "image_background_enable": True, "image_threshold": 10,
+                          "rotation": rotation, "image_region_of_interest": [150, 60, 120, 40]}
+            plan = PreProcessingPlan(parameters, background)
+            image, roi_x_axis, roi_y_axis = plan.process(frame.copy(), x_axis, y_axis)
+
+            # Full frame processing, then region of interest.
+            expected, binned_x_axis, binned_y_axis = binning(frame.copy(), x_axis, y_axis, 2, 2)
+            expected = subtract_background(expected, background)
+            expected = rotate(expected, rotation["angle"], rotation["order"], rotation["mode"])
+            expected = expected[120:160, 150:210].copy()
+            expected[expected < 10] = 0
+
+            numpy.testing.assert_array_equal(image, expected)
+            numpy.testing.assert_array_equal(roi_x_axis, binned_x_axis[150:210])
+            numpy.testing.assert_array_equal(roi_y_axis, binned_y_axis[120:160])
+
+            # Only the footprint of the region of interest is processed, and the background is cropped to it.
+            input_window, cropped_background = plan._plan.input_window, plan._plan.background
+            if rotation["mode"] != "reflect":
+                self.assertLess(frame[input_window].size, frame.size / 10)
+            self.assertEqual(cropped_background.shape,
+                             (frame[input_window].shape[0] // 2, frame[input_window].shape[1] // 2))
+
+            # Plan is recompiled if the shape changes: the background does not match anymore.
+            with self.assertRaises(RuntimeError):
+                plan.process(frame[:400, :600].copy(), x_axis[:600], y_axis[:400])
+
+    def test_pre_processing_copy_on_write(self):
+        height, width = 200, 300
+        random = numpy.random.RandomState(0)
+        frame = random.randint(0, 100, size=(height, width)).astype("uint16")
+        x_axis = numpy.linspace(0, width - 1, width, dtype='f')
+        y_axis = numpy.linspace(0, height - 1, height, dtype='f')
+        background = random.randint(0, 20, size=(height, width)).astype("uint16")
+
+        for parameters, image_background_array, copy_needed in [
+            ({"image_threshold": 30}, None, True),
+            ({"image_background_enable": True, "image_region_of_interest": [10, 50, 20, 40]}, background, True),
+            ({"image_background_enable": "signed", "image_threshold": 30}, background, False),
+            ({"binning_x": 2, "binning_y": 2, "image_threshold": 30}, None, False),
+            ({"rotation": {"angle": 90, "order": 1, "mode": "ortho"}, "image_region_of_interest": [10, 50, 20, 40]},
+             None, False)]:
+            for buffer_pool in [None, BufferPool()]:
+                expected = pre_process_image(frame.copy(), 0, 0, x_axis, y_axis, dict(parameters),
+                                             image_background_array)[0]
+
+                # Read-only input: never modified, copied only if a stage modifies it in place.
+                shared_frame = frame.copy()
+                shared_frame.flags.writeable = False
+                plan = PreProcessingPlan(dict(parameters), image_background_array)
+                self.assertEqual(plan.is_copy_needed(shared_frame), copy_needed)
+                image, _, _ = plan.process(shared_frame, x_axis, y_axis, buffer_pool)
+                numpy.testing.assert_array_equal(image, expected)
+                numpy.testing.assert_array_equal(shared_frame, frame)
+                if copy_needed:
+                    self.assertFalse(numpy.may_share_memory(image, shared_frame))
+                elif not numpy.may_share_memory(image, shared_frame):
+                    self.assertTrue(image.flags.writeable)
+
+                # Writeable input: modified in place, never copied.
+                private_frame = frame.copy()
+                self.assertFalse(plan.is_copy_needed(private_frame))
+                image, _, _ = plan.process(private_frame, x_axis, y_axis, buffer_pool)
+                numpy.testing.assert_array_equal(image, expected)
+
     def test_calculate_slices_invalid_input(self):
         with self.assertRaisesRegex(ValueError, "Number of slices must be odd."):
             calculate_slices(None, None, None, None, 2)
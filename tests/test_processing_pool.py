@@ -0,0 +1,186 @@
+import multiprocessing
+import os
+import random
+import time
+import unittest
+from threading import Thread
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy
+
+from cam_server.pipeline import transceiver
+from cam_server.pipeline.configuration import PipelineConfig
+from cam_server.pipeline.processing_pool import ProcessingPool
+from cam_server.utils import Statistics
+
+offset = 0
+
+
+def process_frame(image, x_axis, y_axis, pulse_id, timestamp, bsdata):
+    time.sleep(random.uniform(0, 0.005))
+    if pulse_id % 10 == 5:
+        return None
+    if pulse_id == 1000:
+        raise ValueError("Invalid frame")
+    image += offset
+    return {"image": image, "sum": int(image.sum()), "x_profile": image.sum(0), "pid": os.getpid(),
+            "bsdata": bsdata, "timestamp": timestamp}
+
+
+def set_offset(value):
+    global offset
+    offset = value
+
+
+class ProcessingPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.results = []
+        self.stop_event = multiprocessing.Event()
+        self.frame = numpy.arange(100 * 200, dtype="uint16").reshape(100, 200)
+        self.pool = ProcessingPool(3, self.frame.nbytes, process_frame, self.on_result, set_offset,
+                                   stop_event=self.stop_event)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def on_result(self, pulse_id, processed_data, context):
+        self.results.append((pulse_id, processed_data, context))
+
+    def wait_results(self, count, timeout=10.0):
+        start = time.time()
+        while (len(self.results) < count) and (time.time() - start < timeout):
+            time.sleep(0.01)
+
+    def submit(self, pulse_ids, image=None):
+        for pulse_id in pulse_ids:
+            while not self.pool.submit(self.frame if image is None else image, pulse_id, float(pulse_id), None, None,
+                                       {"channel": pulse_id}, context=-pulse_id):
+                time.sleep(0.001)
+
+    def test_ordered_results(self):
+        self.submit(range(100))
+        self.wait_results(90)
+        self.assertEqual([pulse_id for pulse_id, _, _ in self.results], [i for i in range(100) if i % 10 != 5])
+        for pulse_id, processed_data, context in self.results:
+            self.assertEqual(context, -pulse_id)
+            self.assertEqual(processed_data["timestamp"], float(pulse_id))
+            self.assertEqual(processed_data["bsdata"], {"channel": pulse_id})
+            numpy.testing.assert_array_equal(processed_data["image"], self.frame)
+            numpy.testing.assert_array_equal(processed_data["x_profile"], self.frame.sum(0))
+            self.assertNotEqual(processed_data["pid"], os.getpid())
+        # The frames are processed in all workers, but not modified in the caller.
+        self.assertEqual(len(set(processed_data["pid"] for _, processed_data, _ in self.results)), 3)
+        self.assertEqual(self.frame[0, 1], 1)
+        self.assertFalse(self.stop_event.is_set())
+
+    def test_update_and_big_frames(self):
+        self.pool.update(2)
+        self.submit(range(10))
+        self.wait_results(9)
+        for _, processed_data, _ in self.results:
+            numpy.testing.assert_array_equal(processed_data["image"], self.frame + 2)
+
+        # Frames bigger than the slots are pickled.
+        del self.results[:]
+        big_frame = numpy.ones((400, 400), dtype="float64")
+        self.submit(range(20, 25), big_frame)
+        self.wait_results(5)
+        self.assertEqual([pulse_id for pulse_id, _, _ in self.results], list(range(20, 25)))
+        for _, processed_data, _ in self.results:
+            numpy.testing.assert_array_equal(processed_data["image"], big_frame + 2)
+
+    def test_error(self):
+        self.submit([998, 999, 1000, 1001])
+        self.wait_results(3)
+        self.assertTrue(self.stop_event.wait(5.0))
+        self.assertEqual([pulse_id for pulse_id, _, _ in self.results], [998, 999, 1001])
+
+    def test_dropped_frames(self):
+        submitted = sum(self.pool.submit(self.frame, i, 0.0, None, None) for i in range(self.pool.slots + 10))
+        self.assertEqual(submitted + self.pool.dropped, self.pool.slots + 10)
+        self.assertGreater(self.pool.dropped, 0)
+        # Slots are released when the results are received.
+        self.wait_results(submitted - 1)
+        self.submit([2000])
+        self.wait_results(submitted)
+        pulse_ids = [pulse_id for pulse_id, _, _ in self.results]
+        self.assertEqual(pulse_ids, sorted(pulse_ids))
+        self.assertEqual(pulse_ids[-1], 2000)
+
+
+class MockSource(object):
+    def __init__(self, stream_address):
+        self.pulse_ids = iter(range(20))
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def receive(self):
+        pulse_id = next(self.pulse_ids, None)
+        if pulse_id is None:
+            time.sleep(0.01)
+            return None
+        values = {"image": numpy.full((10, 20), pulse_id, dtype="uint16"), "x_axis": numpy.arange(20),
+                  "y_axis": numpy.arange(10), "timestamp": pulse_id / 100.0}
+        return SimpleNamespace(data=SimpleNamespace(pulse_id=pulse_id, global_timestamp=pulse_id,
+                                                    global_timestamp_offset=0,
+                                                    data={k: SimpleNamespace(value=v) for k, v in values.items()}),
+                               statistics=SimpleNamespace(total_bytes_received=0))
+
+
+class MockSender(object):
+    def __init__(self):
+        self.pulse_ids = []
+        self.stream = None
+        self.create_header = None
+        self.data_format = None
+        self.records = None
+
+    def send(self, data, timestamp, pulse_id, check_data):
+        self.pulse_ids.append(pulse_id)
+
+    def close(self):
+        pass
+
+
+class ProcessingWorkersPipelineTest(unittest.TestCase):
+
+    def test_statistics(self):
+        stop_event = multiprocessing.Event()
+        statistics = Statistics()
+        sender = MockSender()
+        cam_client = mock.Mock()
+        cam_client.get_instance_stream.return_value = "tcp://localhost:9999"
+        cam_client.get_camera_geometry.return_value = (20, 10)
+        pipeline_config = PipelineConfig("test_pipeline", {"camera_name": "simulation", "processing_workers": 2})
+
+        def run():
+            with self.assertRaises(SystemExit):
+                transceiver.processing_pipeline(stop_event, statistics, multiprocessing.Queue(), cam_client,
+                                                pipeline_config, 12000, None)
+
+        with mock.patch.object(transceiver, "create_source", MockSource), \
+                mock.patch.object(transceiver, "create_sender", lambda *args: sender):
+            thread = Thread(target=run)
+            thread.start()
+            # The statistics are updated every second.
+            start = time.time()
+            while (not sender.pulse_ids or statistics.copies_avoided < len(sender.pulse_ids)) and \
+                    (time.time() - start < 5.0):
+                time.sleep(0.1)
+            stop_event.set()
+            thread.join(10.0)
+        self.assertFalse(thread.is_alive())
+        # Frames are dropped while the slots are busy.
+        self.assertGreater(len(sender.pulse_ids), 0)
+        # Counted by the processing workers.
+        self.assertEqual(statistics.copies_avoided, len(sender.pulse_ids))
+
+
+if __name__ == '__main__':
+    unittest.main()
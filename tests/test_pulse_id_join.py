@@ -0,0 +1,79 @@
+import time
+import unittest
+
+from cam_server.utils import PulseIdJoin
+
+
+class PulseIdJoinTest(unittest.TestCase):
+
+    def test_join(self):
+        join = PulseIdJoin(["image", "data"])
+        self.assertIsNone(join.put("image", 10, "image 10"))
+        self.assertIsNone(join.put("image", 11, "image 11"))
+        self.assertEqual(join.put("data", 11, "data 11"), {"image": "image 11", "data": "data 11"})
+        # The image 10 can not be joined anymore.
+        self.assertEqual(len(join), 0)
+        self.assertIsNone(join.put("data", 10, "data 10"))
+        self.assertEqual(join.put("data", 12, "data 12"), None)
+        self.assertEqual(join.put("image", 12, "image 12"), {"image": "image 12", "data": "data 12"})
+
+        metrics = join.get_metrics()
+        self.assertEqual((metrics["hits"], metrics["misses"], metrics["expired"]), (2, 1, 1))
+        self.assertEqual(metrics["dropped"], 2)
+        self.assertEqual(metrics["max_depth"], 2)
+        metrics = join.get_metrics()
+        self.assertEqual((metrics["hits"], metrics["misses"], metrics["expired"]), (0, 0, 0))
+        self.assertEqual(metrics["dropped"], 2)
+
+    def test_multiple_streams(self):
+        join = PulseIdJoin(["camera1", "camera2", "camera3"])
+        for pulse_id in range(5):
+            self.assertIsNone(join.put("camera3", pulse_id, pulse_id * 3))
+            self.assertIsNone(join.put("camera1", pulse_id, pulse_id))
+        for pulse_id in range(5):
+            self.assertEqual(join.put("camera2", pulse_id, pulse_id * 2),
+                             {"camera1": pulse_id, "camera2": pulse_id * 2, "camera3": pulse_id * 3})
+        self.assertEqual(len(join), 0)
+
+    def test_limits(self):
+        join = PulseIdJoin(["image", "data"], max_length={"data": 3}, max_bytes={"image": 1000})
+        for pulse_id in range(10):
+            join.put("image", pulse_id, pulse_id, 300)
+            join.put("data", pulse_id + 100, pulse_id)
+        self.assertEqual(join.get_size("image"), 900)
+        self.assertEqual(len(join), 6)
+        self.assertEqual(join.get_metrics()["expired"], 14)
+        self.assertEqual(join.put("data", 9, "data 9"), {"image": 9, "data": "data 9"})
+        self.assertEqual(join.get_size("image"), 0)
+
+    def test_pid_window_and_age(self):
+        join = PulseIdJoin(["image", "data"], max_age=0.05, pid_window=100)
+        join.put("image", 1000, 1000)
+        join.put("image", 1050, 1050)
+        join.put("image", 1101, 1101)
+        self.assertEqual(len(join), 2)
+        time.sleep(0.1)
+        join.put("image", 1102, 1102)
+        self.assertEqual(len(join), 1)
+        self.assertIsNotNone(join.put("data", 1102, 1102))
+
+        # Late, within the window.
+        self.assertIsNone(join.put("data", 1050, 1050))
+        self.assertEqual(join.watermark, 1102)
+        # Pulse id reset.
+        join.put("data", 10, 10)
+        self.assertEqual(join.put("image", 10, 10), {"image": 10, "data": 10})
+        self.assertEqual(join.watermark, 10)
+
+    def test_clear(self):
+        join = PulseIdJoin(["image", "data"])
+        join.put("image", 1, 1, 100)
+        join.put("data", 2, 2)
+        join.clear()
+        self.assertEqual(len(join), 0)
+        self.assertEqual(join.get_size("image"), 0)
+        self.assertIsNone(join.watermark)
+
+
+if __name__ == '__main__':
+    unittest.main()
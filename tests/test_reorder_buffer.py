@@ -0,0 +1,94 @@
+import time
+import unittest
+from threading import Thread
+
+from cam_server.utils import ReorderBuffer
+
+
+class ReorderBufferTest(unittest.TestCase):
+
+    def test_expected_order(self):
+        buffer = ReorderBuffer(maxlen=10)
+        for pulse_id in [10, 11, 12, 13]:
+            buffer.expect(pulse_id)
+        buffer.put(12, "c")
+        buffer.put(11, "b")
+        self.assertIsNone(buffer.pop())
+        buffer.put(10, "a")
+        self.assertEqual(buffer.pop(), (10, "a"))
+        self.assertEqual(buffer.pop(), (11, "b"))
+        # Discarded pulse ids are skipped.
+        buffer.put(13, None)
+        self.assertEqual(buffer.pop(), (12, "c"))
+        self.assertIsNone(buffer.pop())
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(buffer.released, 3)
+        self.assertEqual(buffer.dropped, 0)
+
+    def test_deadline(self):
+        for emit_late in (False, True):
+            buffer = ReorderBuffer(timeout=0.05, emit_late=emit_late)
+            for pulse_id in range(5):
+                buffer.expect(pulse_id)
+            for pulse_id in range(1, 5):
+                buffer.put(pulse_id, pulse_id)
+            start = time.time()
+            # The slow head does not stall the following frames after its deadline.
+            self.assertEqual(buffer.get(5.0), (1, 1))
+            self.assertGreaterEqual(time.time() - start, 0.04)
+            self.assertEqual(buffer.dropped, 1)
+            for pulse_id in range(2, 5):
+                self.assertEqual(buffer.get(0), (pulse_id, pulse_id))
+
+            buffer.put(0, 0)
+            self.assertEqual(buffer.late, 1)
+            self.assertEqual(buffer.get(0), (0, 0) if emit_late else None)
+
+    def test_full(self):
+        buffer = ReorderBuffer(maxlen=3)
+        for pulse_id in range(5):
+            buffer.expect(pulse_id)
+        buffer.put(3, "d")
+        self.assertEqual(buffer.pop(), None)
+        self.assertEqual(buffer.dropped, 2)
+        buffer.put(2, "c")
+        self.assertEqual(buffer.pop(), (2, "c"))
+        self.assertEqual(buffer.pop(), (3, "d"))
+
+    def test_unexpected_items(self):
+        buffer = ReorderBuffer(maxlen=4, increment=2)
+        buffer.put(100, "a")
+        self.assertEqual(buffer.pop(), (100, "a"))
+        # Items are sorted by pulse id and released when following the last one.
+        buffer.put(106, "d")
+        buffer.put(104, "c")
+        self.assertIsNone(buffer.pop())
+        buffer.put(102, "b")
+        self.assertEqual([buffer.pop() for _ in range(3)], [(102, "b"), (104, "c"), (106, "d")])
+        # Ancient pulse ids are late.
+        buffer.put(98, "x")
+        self.assertIsNone(buffer.pop())
+        self.assertEqual(buffer.late, 1)
+        # Gap: released when the buffer exceeds maxlen.
+        for pulse_id in range(200, 210, 2):
+            buffer.put(pulse_id, pulse_id)
+        self.assertEqual(buffer.pop(), (200, 200))
+        self.assertEqual([buffer.pop() for _ in range(4)], [(202, 202), (204, 204), (206, 206), (208, 208)])
+        metrics = buffer.get_metrics()
+        self.assertEqual(metrics["released"], 9)
+        self.assertEqual(metrics["max_depth"], 5)
+
+    def test_blocking_get(self):
+        buffer = ReorderBuffer()
+        buffer.expect(1)
+        thread = Thread(target=lambda: (time.sleep(0.05), buffer.put(1, "a")))
+        thread.start()
+        start = time.time()
+        self.assertEqual(buffer.get(5.0), (1, "a"))
+        self.assertLess(time.time() - start, 1.0)
+        thread.join()
+        self.assertIsNone(buffer.get(0.01))
+
+
+if __name__ == '__main__':
+    unittest.main()
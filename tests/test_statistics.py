@@ -0,0 +1,51 @@
+import multiprocessing
+import unittest
+
+from cam_server.utils import Statistics, init_statistics, set_statistics, on_message_sent
+
+
+def update_statistics(statistics, frames):
+    init_statistics(statistics)
+    for _ in range(frames):
+        set_statistics(statistics, None, statistics.total_bytes + 100, 1, "10x5x2")
+        on_message_sent(statistics)
+    statistics.timestamp = 0
+    set_statistics(statistics, None, statistics.total_bytes, 0, "10x5x2", 7)
+
+
+class StatisticsTest(unittest.TestCase):
+
+    def test_statistics(self):
+        statistics = Statistics()
+        self.assertEqual(statistics.rx_count, 0)
+        self.assertIsNone(statistics.frame_shape)
+
+        statistics.throughput = None
+        self.assertIsNone(statistics.throughput)
+        statistics.memory = None
+        self.assertIsNone(statistics.memory)
+        statistics.memory = 1000
+        self.assertEqual(statistics.memory, 1000)
+
+        with self.assertRaises(AttributeError):
+            statistics.unknown
+        # Attributes out of the record are local to the process.
+        statistics._process = "process"
+        self.assertEqual(statistics._process, "process")
+
+        process = multiprocessing.Process(target=update_statistics, args=(statistics, 10))
+        process.start()
+        process.join()
+
+        self.assertEqual(statistics.rx_count, 10)
+        self.assertEqual(statistics.tx_count, 10)
+        self.assertEqual(statistics.total_bytes, 1000)
+        self.assertEqual(statistics.frame_shape, "10x5x2")
+        self.assertEqual(statistics.copies_avoided, 7)
+        self.assertEqual(statistics.pid, process.pid)
+        self.assertGreater(statistics.update_timestamp, 0)
+        self.assertEqual(statistics._process, "process")
+
+
+if __name__ == '__main__':
+    unittest.main()
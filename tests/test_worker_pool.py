@@ -0,0 +1,132 @@
+import os
+import sys
+import time
+import unittest
+from threading import Lock
+
+from cam_server.camera.configuration import CameraConfigManager
+from cam_server.camera.management import CameraInstanceManager, CameraInstance
+from cam_server.instance_management.configuration import ConfigFileStorage
+from cam_server.instance_management.management import InstanceManager, InstanceWrapper
+from cam_server.utils import init_statistics
+
+
+def process_function(stop_event, statistics, parameter_queue, value, lock=None):
+    init_statistics(statistics)
+    statistics.rx_count = value
+    stop_event.clear()
+    statistics.frame_shape = parameter_queue.get()
+    stop_event.wait()
+    sys.exit(3)
+
+
+def camera_process_function(stop_event, statistics, parameter_queue, camera, port, frame_cache=None):
+    # Receives the images of the camera source, as the camera senders.
+    init_statistics(statistics)
+
+    def on_image(image, timestamp, *args):
+        statistics.frame_shape = "%dx%d" % image.shape
+        statistics.rx_count += 1
+
+    camera.connect()
+    camera.add_callback(on_image)
+    stop_event.clear()
+    stop_event.wait()
+    camera.disconnect()
+
+
+def wait_for(condition, timeout=5.0):
+    start_time = time.time()
+    while not condition() and (time.time() - start_time) < timeout:
+        time.sleep(0.01)
+
+
+class WorkerPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.instance_manager = InstanceManager(worker_pool_size=2)
+        # The pool is filled in the background.
+        wait_for(lambda: len(self.instance_manager.get_worker_pool()._workers) == 2)
+
+    def tearDown(self):
+        self.instance_manager.stop_all_instances()
+        self.instance_manager.worker_pool.close()
+
+    def test_lazy_pool(self):
+        instance_manager = InstanceManager(worker_pool_size=2)
+        self.assertIsNone(instance_manager.worker_pool)
+        instance_manager.add_instance("test", InstanceWrapper("test", process_function, None, 10))
+        instance_manager.start_instance("test")
+        try:
+            self.assertIsNotNone(instance_manager.worker_pool)
+            self.assertTrue(instance_manager.get_instance("test").is_running())
+        finally:
+            instance_manager.stop_all_instances()
+            instance_manager.worker_pool.close()
+
+    def test_pooled_instance(self):
+        worker_pool = self.instance_manager.worker_pool
+        pooled_pids = [worker.process.pid for worker in worker_pool._workers]
+        self.assertEqual(len(pooled_pids), 2)
+
+        self.instance_manager.add_instance("test", InstanceWrapper("test", process_function, None, 10))
+        self.instance_manager.start_instance("test")
+        instance = self.instance_manager.get_instance("test")
+        self.assertTrue(instance.is_running())
+        self.assertEqual(instance.statistics.rx_count, 10)
+        self.assertEqual(instance.statistics.pid, pooled_pids[0])
+        instance.set_parameter("parameter")
+        wait_for(lambda: instance.statistics.frame_shape)
+        self.assertEqual(instance.statistics.frame_shape, "parameter")
+
+        self.instance_manager.stop_instance("test")
+        self.assertFalse(instance.is_running())
+
+        # Restarted in another worker: the pool is refilled in the background.
+        wait_for(lambda: len(worker_pool._workers) == 2)
+        self.assertEqual(len(worker_pool._workers), 2)
+        self.instance_manager.start_instance("test")
+        self.assertEqual(instance.statistics.pid, pooled_pids[1])
+        instance.set_parameter("parameter")
+        instance.stop_event.set()
+        instance.process.join(5.0)
+        self.assertEqual(self.instance_manager.get_instance_exit_code("test"), 3)
+
+    def test_not_serializable(self):
+        pooled_pids = [worker.process.pid for worker in self.instance_manager.worker_pool._workers]
+
+        # Process functions which cannot be sent to the workers run in a new process.
+        self.instance_manager.add_instance("test", InstanceWrapper("test", process_function, None, 10, Lock()))
+        self.instance_manager.start_instance("test")
+        instance = self.instance_manager.get_instance("test")
+        self.assertTrue(instance.is_running())
+        self.assertNotIn(instance.statistics.pid, pooled_pids)
+        instance.set_parameter("parameter")
+        self.assertEqual([worker.process.pid for worker in self.instance_manager.worker_pool._workers], pooled_pids)
+
+    def test_camera_instance(self):
+        config_base = os.path.join(os.path.dirname(os.path.abspath(__file__)), "camera_config")
+        config_manager = CameraConfigManager(config_provider=ConfigFileStorage(config_base))
+        instance_manager = CameraInstanceManager(config_manager)
+        worker_pool = instance_manager.get_worker_pool()
+        try:
+            wait_for(lambda: len(worker_pool._workers) == worker_pool.size)
+            pooled_pids = [worker.process.pid for worker in worker_pool._workers]
+            self.assertGreater(len(pooled_pids), 0)
+
+            # The camera sources are sent to the pooled workers.
+            camera = config_manager.load_camera("simulation")
+            instance_manager.add_instance("simulation", CameraInstance(camera_process_function, camera, 12000))
+            instance_manager.start_instance("simulation")
+            instance = instance_manager.get_instance("simulation")
+            self.assertEqual(instance.statistics.pid, pooled_pids[0])
+            wait_for(lambda: instance.statistics.rx_count > 1)
+            self.assertGreater(instance.statistics.rx_count, 1)
+            self.assertEqual(instance.statistics.frame_shape, "200x400")
+        finally:
+            instance_manager.stop_all_instances()
+            worker_pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,4 @@
+def process(images, pulse_id, timestamp, x_axis, y_axis, parameters):
+    if pulse_id == 7:
+        raise ValueError("Failure on pulse id 7")
+    return {"pulse_id": pulse_id}
@@ -0,0 +1,8 @@
+from collections import OrderedDict
+
+
+def process(images, pulse_id, timestamp, x_axis, y_axis, parameters):
+    ret = OrderedDict()
+    ret["cameras"] = list(images.keys())
+    ret["intensity"] = int(sum(image.sum() for image in images.values()))
+    return ret